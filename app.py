@@ -4,34 +4,68 @@ Ponto de entrada da aplicação Flask + Dash.
 """
 import callbacks
 import logging
+import re
 from typing import Any
 from datetime import timedelta
 from config import Config
-import os
 
 from flask import Flask, Response, redirect
+from werkzeug.middleware.proxy_fix import ProxyFix
 import dash
 from dash import html, dcc, Input, Output, State, no_update
 import dash_mantine_components as dmc
 from dash import _dash_renderer
 
+from auth.auth import is_authenticated
+from auth.oidc_metadata import get_oidc_metadata
+from auth.context import get_current_user
+from auth.route_policy import (
+    FORBIDDEN,
+    LOGIN,
+    get_route_policy,
+    install_route_policy,
+    rule_decision,
+)
+from auth.secret_key import load_secret_keys
+from auth.session_store import install_session_interface
+from compression import available_encodings, install_compression, install_etags
+from health import install_health_routes
+from layout_cache import LayoutCache, config_fingerprint
 from login_layout import create_login_layout
+from logging_setup import setup_logging
+from metrics import install_metrics
+from profiling import install_profiling
+from static_assets import register_vendor_route, vendor_urls
 from home_layout import layout_main
 
 
-# Configurações de logging
-logging.basicConfig(level=logging.INFO)
+# Configurações de logging (JSON, escrito fora da requisição; ver logging_setup)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Ajusta a versão do React para compatibilidade
 _dash_renderer._set_react_version("18.2.0")
 
-# registra mantine_light e mantine_dark no plotly
-dmc.add_figure_templates()  # requer dmc >= 0.15.1
+# Os templates mantine_light/mantine_dark do plotly são registrados no
+# primeiro uso (ver home_layout.ensure_figure_templates)
 
 # Instância do servidor Flask
 flask_server = Flask(__name__)
-flask_server.secret_key = os.urandom(15)
+# Chave estável (Config ou arquivo): sessões valem em qualquer worker e
+# sobrevivem a reinícios; chaves antigas seguem aceitas durante a rotação
+flask_server.secret_key, flask_server.config["SECRET_KEY_FALLBACKS"] = load_secret_keys()
+
+# Atrás de proxy reverso, IP e esquema do cliente vêm de X-Forwarded-*
+if Config.TRUSTED_PROXIES:
+    flask_server.wsgi_app = ProxyFix(
+        flask_server.wsgi_app,
+        x_for=Config.TRUSTED_PROXIES,
+        x_proto=Config.TRUSTED_PROXIES,
+        x_host=Config.TRUSTED_PROXIES,
+    )
+
+# Cookie leva só o id da sessão; tokens ficam no backend configurado
+session_store = install_session_interface(flask_server)
 
 
 @flask_server.errorhandler(404)
@@ -59,6 +93,12 @@ def internal_error(error: Exception) -> tuple[str, int]:
 # Define prefixo de rota (assegura barra única ao final)
 prefix = Config.ROOT.rstrip("/") + "/"
 
+# CSS/JS de terceiros servidos localmente, com hash no nome e cache imutável
+# (gerados por `python -m static_assets build`; sem build, usa as CDNs)
+vendor_prefix = f"{prefix}vendor/"
+register_vendor_route(flask_server, vendor_prefix)
+vendor_stylesheets, vendor_scripts = vendor_urls(vendor_prefix)
+
 # Instância do app Dash
 app = dash.Dash(
     __name__,
@@ -68,21 +108,66 @@ app = dash.Dash(
     requests_pathname_prefix=prefix,
     routes_pathname_prefix=prefix,
     external_stylesheets=[
-        "https://unpkg.com/boxicons@2.1.1/css/boxicons.min.css",
+        *vendor_stylesheets,
         dmc.styles.ALL,
         dmc.styles.DATES,
     ],
-    external_scripts=[
-        "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0\
-            /dist/js/bootstrap.bundle.min.js",
-        "https://cdnjs.cloudflare.com/ajax/libs/dayjs/1.10.8/dayjs.min.js",
-        "https://cdnjs.cloudflare.com/ajax/libs/dayjs/1.10.8/locale/pt.min.js",
-    ],
+    external_scripts=vendor_scripts,
+    # assets/vendor/ entra pelas listas acima, não pela inclusão automática
+    assets_path_ignore=["^vendor$"],
     suppress_callback_exceptions=True,
+    # Endpoints assíncronos só quando os callbacks de auth forem async
+    use_async=Config.AUTH_ASYNC,
 )
 
 server = app.server
 
+# Métricas Prometheus em /metrics (callbacks, Keycloak, sessões)
+if Config.METRICS_ENABLED:
+    install_metrics(
+        flask_server,
+        app,
+        session_count=(lambda: len(session_store)) if session_store is not None else None,
+    )
+
+# Profiling sob demanda em /admin/profiling (desligado, quase sem custo)
+install_profiling(flask_server, app)
+
+# Probes: /healthz (processo de pé) e /readyz (discovery e JWKS do realm
+# em cache); nenhum dos dois chama o Keycloak
+oidc_metadata = get_oidc_metadata()
+install_health_routes(flask_server, oidc_metadata.status)
+
+# Política de rotas compilada uma vez; páginas protegidas sem login são
+# redirecionadas antes de o Dash servir o HTML (o login fica na raiz)
+route_policy = get_route_policy()
+install_route_policy(
+    flask_server,
+    route_policy,
+    page_endpoints=(prefix, f"{prefix}<path:path>"),
+    login_url=prefix,
+)
+
+# Layout e dependências com ETag forte: recargas recebem 304 sem corpo
+install_etags(flask_server, [f"{prefix}_dash-layout", f"{prefix}_dash-dependencies"])
+
+# br/gzip conforme o cliente; por último, para envolver todo o wsgi_app
+if Config.COMPRESSION_ENABLED:
+    install_compression(flask_server)
+
+# Tema do MantineProvider raiz (faz parte da chave do cache de layouts)
+THEME = {
+    "colorScheme": "dark",
+    "primaryColor": "indigo",
+    "fontFamily": "'Inter', sans-serif",
+}
+
+# Layouts estáticos montados e serializados uma vez; a saudação chega
+# depois, pelo callback get_info_user
+layout_cache = LayoutCache(lambda: config_fingerprint(THEME))
+layout_cache.register("login", create_login_layout)
+layout_cache.register("main", layout_main)
+
 
 def serve_layout() -> Any:
     """
@@ -92,16 +177,13 @@ def serve_layout() -> Any:
     :return: Componente MantineProvider contendo o layout inicial.
     """
     return dmc.MantineProvider(
-        theme={
-            "colorScheme": "dark",
-            "primaryColor": "indigo",
-            "fontFamily": "'Inter', sans-serif",
-        },
+        theme=THEME,
         children=[
             dcc.Location(id="url", refresh=True),
             dcc.Store(id="login-status", storage_type="session",
                       data={"logged_in": False, "token": None}),
-            dcc.Interval(id="auth-keeper", interval=30*1000, n_intervals=0),
+            # Desligado até o login; schedule_refresh define o intervalo
+            dcc.Interval(id="auth-keeper", disabled=True, n_intervals=0),
             html.Div(id="page-content"),
         ],
     )
@@ -120,8 +202,10 @@ def render_page(pathname: str, login_status: dict) -> Any:
     """
     Decide o que renderizar em função da rota e do estado de login.
 
-    - Se a rota for protegida e o usuário não estiver autenticado, 
-    exibe o login.
+    - Se a rota for protegida (`route_policy`) e o usuário não estiver
+    autenticado, exibe o login. A autenticação é conferida no servidor,
+    verificando o access_token da sessão contra o JWKS do realm.
+    - Se faltar algum papel exigido pela rota, exibe "acesso negado".
     - Caso contrário, injeta o `dash.page_container`.
 
     :param pathname: Caminho atual da URL.
@@ -129,24 +213,20 @@ def render_page(pathname: str, login_status: dict) -> Any:
     :return: Layout de login ou conteúdo da página solicitada.
     """
 
-    # Normaliza barra final
-    if pathname != "/" and pathname.endswith("/"):
-        pathname = pathname[:-1]
-
-    # Rotas que exigem autenticação (sempre sem barra final)
-    prefix_clean = Config.ROOT.rstrip("/")  # home
-    protected_routes = {
-        f"{prefix_clean}",
-    }
-    login = login_status or {}
-
-    # Se rota protegida e não logado, retorna layout de login
+    rule = route_policy.match(pathname or "/")
+    if rule is not None and not rule.public:
+        login = login_status or {}
+        logged_in = login.get("logged_in", False) and is_authenticated()
+        decision = rule_decision(rule, get_current_user() if logged_in else None)
 
-    if pathname in protected_routes and not login_status.get("logged_in", False):
-        return create_login_layout()
+        # Se rota protegida e não logado, retorna layout de login
+        if decision == LOGIN:
+            return layout_cache.get("login")
+        if decision == FORBIDDEN:
+            return dmc.Center(dmc.Title("Acesso negado", order=3), h="100dvh")
 
     # Senão, renderiza a página normalmente
-    return layout_main()
+    return layout_cache.get("main")
 
 
 @app.server.route('/')
@@ -154,8 +234,35 @@ def home():
     return redirect('/home/')
 
 
+def warm_up() -> None:
+    """
+    Executa a preparação que o Dash faz na primeira requisição.
+
+    O Dash junta os callbacks globais ao `callback_map` no primeiro
+    request, sem lock: em servidores com threads, requisições simultâneas
+    num processo recém-criado podem ver o mapa pela metade. As entradas de
+    produção chamam isto no import (com `preload_app`, uma vez no master,
+    antes do fork). Com a compressão ligada, também deixa os bundles do
+    Dash comprimidos no cache, para nenhum worker pagar por isso. Os
+    layouts estáticos também já saem montados.
+    """
+    layout_cache.warm_up()
+    client = flask_server.test_client()
+    response = client.get(f"{prefix}_dash-dependencies")
+    if response.status_code != 200:
+        raise RuntimeError(f"Falha ao preparar o Dash: {response.status_code}")
+    if Config.COMPRESSION_ENABLED:
+        index = client.get(prefix).get_data(as_text=True)
+        bundles = re.findall(rf'src="({re.escape(prefix)}_dash-component-suites/[^"]+)"', index)
+        for encoding in available_encodings():
+            for url in bundles:
+                # O cache só guarda depois de o corpo ser lido até o fim
+                client.get(url, headers={"Accept-Encoding": encoding}).get_data()
+
+
 if __name__ == "__main__":
     logger.info("Iniciando servidor em modo debug")
+    oidc_metadata.start(wait=Config.OIDC_WARM_TIMEOUT)
     app.run(
         debug=False,
         port=8052,
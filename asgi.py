@@ -0,0 +1,49 @@
+"""
+Entrada ASGI da aplicação.
+
+    AUTH_ASYNC=true uvicorn asgi:application --port 8052
+
+O Flask continua WSGI: cada requisição roda em uma thread de um pool
+(`Config.ASGI_THREADS`). Essas threads carregam o event loop do servidor,
+então, com `AUTH_ASYNC` ligado, as corrotinas dos callbacks de
+autenticação rodam nesse loop e compartilham um único pool httpx para o
+Keycloak.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from app import server, warm_up
+from auth.oidc_metadata import get_oidc_metadata
+from config import Config
+
+_executor = ThreadPoolExecutor(
+    max_workers=Config.ASGI_THREADS, thread_name_prefix="wsgi",
+)
+
+
+class _ThreadedWsgiToAsgiInstance(WsgiToAsgiInstance):
+    # O padrão do asgiref (thread_sensitive=True) serializa todas as
+    # requisições em uma única thread.
+    run_wsgi_app = sync_to_async(
+        WsgiToAsgiInstance.__dict__["run_wsgi_app"].func,
+        thread_sensitive=False,
+        executor=_executor,
+    )
+
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    """`WsgiToAsgi` que atende requisições em paralelo no pool de threads."""
+
+    async def __call__(self, scope, receive, send):
+        await _ThreadedWsgiToAsgiInstance(self.wsgi_application)(
+            scope, receive, send,
+        )
+
+
+warm_up()
+# Cada processo do uvicorn importa este módulo: aquece discovery e JWKS
+get_oidc_metadata().start(wait=Config.OIDC_WARM_TIMEOUT)
+
+application = ThreadedWsgiToAsgi(server)
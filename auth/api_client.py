@@ -0,0 +1,298 @@
+"""
+Cliente HTTP das APIs protegidas chamadas pelos callbacks, com o access
+token do usuário da sessão.
+
+- Conexões keep-alive reaproveitadas: um `requests.Session` por processo,
+  com um pool por host (`Config.API_POOL_HOSTS` hosts,
+  `Config.API_POOL_MAXSIZE` conexões cada);
+- o token sai de `session["kc"]`; faltando menos de
+  `Config.API_TOKEN_REFRESH_MARGIN` s para `access_expires_at`, é renovado
+  antes da chamada, pelo mesmo single-flight do auth-keeper
+  (`auth.refresh`);
+- um 401 renova o token uma vez (ou usa o que outra requisição da sessão
+  já renovou) e repete a chamada; um segundo 401 volta para quem chamou;
+- `batch` faz várias chamadas independentes em paralelo e devolve as
+  respostas na ordem pedida.
+
+Uso num callback::
+
+    api = get_api_client()
+    vendas = api.get("/vendas", params={"mes": mes}).json()
+    clientes, metas = api.batch([ApiCall("GET", "/clientes"),
+                                 ApiCall("GET", "/metas")])
+
+As chamadas precisam do contexto da requisição (a sessão). Em `batch`, só
+o HTTP sai da thread da requisição: o token é lido e renovado nela. Corpos
+enviados precisam poder ser reenviados (nada de streams) por causa da
+repetição depois do 401.
+
+O token só vai para o esquema e host de `Config.API_BASE_URL` e para os
+de `Config.API_ALLOWED_HOSTS` (https, salvo `http://` explícito na
+entrada); com os dois vazios, nenhuma chamada é feita (ValueError).
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Sequence, Tuple, Union
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from flask import session
+from requests.adapters import HTTPAdapter
+
+from auth.auth import _keep_through_outage, _now_ts, _refresh_session_tokens
+from config import Config
+from metrics import REGISTRY
+from profiling import phase
+
+logger = logging.getLogger(__name__)
+
+API_SECONDS = REGISTRY.histogram(
+    "api_request_duration_seconds",
+    "Duração das chamadas às APIs protegidas, por host.",
+    ("host", "outcome"),
+)
+API_TOKEN_REFRESHES = REGISTRY.counter(
+    "api_token_refreshes_total",
+    "Renovações do token da sessão feitas pelo cliente das APIs.",
+    ("reason", "outcome"),
+)
+
+
+class ApiAuthError(Exception):
+    """A sessão não tem (ou não conseguiu renovar) um token para a API."""
+
+
+class ApiCall(NamedTuple):
+    """Uma chamada de `ApiClient.batch`; `kwargs` vai para o `requests`."""
+
+    method: str
+    url: str
+    kwargs: Optional[Dict[str, Any]] = None
+
+
+_Prepared = Tuple[str, str, Dict[str, Any]]
+
+
+def _origin(url: str) -> Tuple[str, str]:
+    parts = urlsplit(url)
+    return parts.scheme.lower(), parts.netloc.lower()
+
+
+class ApiClient:
+    """
+    Cliente das APIs protegidas, compartilhado pelas requisições do processo.
+
+    :param base_url: Prefixo das URLs relativas.
+    :param allowed_hosts: Hosts ("host:porta", só https; "http://host:porta"
+        para aceitar http) que recebem o token, além do esquema e host de
+        `base_url`. Sem nenhum dos dois, toda chamada é recusada.
+    :param timeout: Timeout (conexão, leitura) padrão de cada chamada.
+    :param pool_hosts: Hosts com pool de conexões próprio.
+    :param pool_maxsize: Conexões keep-alive mantidas por host.
+    :param batch_workers: Chamadas simultâneas de um `batch`.
+    :param refresh_margin: Antecedência (s) da renovação antes de
+        `access_expires_at`.
+    """
+
+    def __init__(
+        self,
+        base_url: str = "",
+        allowed_hosts: Sequence[str] = (),
+        timeout: Tuple[float, float] = (3.0, 15.0),
+        pool_hosts: int = 10,
+        pool_maxsize: int = 20,
+        batch_workers: int = 8,
+        refresh_margin: int = 30,
+    ) -> None:
+        self.base_url = base_url.rstrip("/") + "/" if base_url else ""
+        origins = {_origin(host if "://" in host else f"https://{host}")
+                   for host in allowed_hosts}
+        if base_url:
+            origins.add(_origin(base_url))
+        self.allowed_origins: FrozenSet[Tuple[str, str]] = frozenset(origins)
+        self.timeout = timeout
+        self.refresh_margin = refresh_margin
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_hosts,
+                              pool_maxsize=pool_maxsize, max_retries=0)
+        for protocol in ("https://", "http://"):
+            self.http.mount(protocol, adapter)
+        # Threads criadas no primeiro `batch` (depois do fork do gunicorn)
+        self._executor = ThreadPoolExecutor(max_workers=batch_workers,
+                                            thread_name_prefix="api-batch")
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        self.http.close()
+
+    # --- API -------------------------------------------------------------
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """
+        Chama a API com o token da sessão (`kwargs` como no `requests`).
+
+        :raises ApiAuthError: Sessão sem login ou refresh recusado.
+        :raises ValueError: Host fora dos autorizados a receber o token.
+        """
+        prepared = self._prepare(ApiCall(method, url, kwargs))
+        token = self._token()
+        with phase("api"):
+            response = self._send(prepared, token)
+        if response.status_code == 401:
+            token = self._token_after_401(token)
+            if token is not None:
+                with phase("api"):
+                    response = self._send(prepared, token)
+        return response
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def batch(self, calls: Sequence[ApiCall],
+              return_exceptions: bool = False
+              ) -> List[Union[requests.Response, Exception]]:
+        """
+        Faz as chamadas em paralelo, com um token e, se alguma voltar 401,
+        uma única renovação para o lote todo.
+
+        :param return_exceptions: Devolve as exceções de rede na posição da
+            chamada, em vez de levantar a primeira.
+        :return: Respostas na ordem de `calls`.
+        """
+        prepared = [self._prepare(call) for call in calls]
+        token = self._token()
+        results = self._send_all(prepared, token)
+        unauthorized = [i for i, result in enumerate(results)
+                        if isinstance(result, requests.Response)
+                        and result.status_code == 401]
+        if unauthorized:
+            token = self._token_after_401(token)
+            if token is not None:
+                retried = self._send_all([prepared[i] for i in unauthorized], token)
+                for i, result in zip(unauthorized, retried):
+                    results[i] = result
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+    # --- HTTP ------------------------------------------------------------
+
+    def _prepare(self, call: ApiCall) -> _Prepared:
+        url = urljoin(self.base_url, call.url.lstrip("/")) if self.base_url else call.url
+        scheme, host = _origin(url)
+        # Sem lista, nenhum host é autorizado: o token não vaza por engano;
+        # o esquema também conta, para o token não sair em http puro
+        if (scheme, host) not in self.allowed_origins:
+            raise ValueError(f"{scheme}://{host} não autorizado a receber o token")
+        kwargs = dict(call.kwargs or {})
+        kwargs.setdefault("timeout", self.timeout)
+        return call.method.upper(), url, kwargs
+
+    def _send(self, prepared: _Prepared, token: str) -> requests.Response:
+        method, url, kwargs = prepared
+        headers = {**(kwargs.get("headers") or {}), "Authorization": f"Bearer {token}"}
+        host = urlsplit(url).netloc
+        started = time.perf_counter()
+        try:
+            response = self.http.request(method, url, **{**kwargs, "headers": headers})
+        except requests.RequestException:
+            API_SECONDS.observe(time.perf_counter() - started, host=host, outcome="error")
+            raise
+        API_SECONDS.observe(time.perf_counter() - started, host=host,
+                            outcome=f"{response.status_code // 100}xx")
+        return response
+
+    def _send_all(self, prepared: List[_Prepared], token: str
+                  ) -> List[Union[requests.Response, Exception]]:
+        with phase("api"):
+            if len(prepared) == 1:
+                try:
+                    return [self._send(prepared[0], token)]
+                except requests.RequestException as exc:
+                    return [exc]
+            futures = [self._executor.submit(self._send, item, token)
+                       for item in prepared]
+            results: List[Union[requests.Response, Exception]] = []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as exc:
+                    results.append(exc)
+            return results
+
+    # --- token da sessão ---------------------------------------------------
+
+    def _token(self) -> str:
+        """Access token da sessão, renovado se estiver para vencer."""
+        kc = session.get("kc") or {}
+        if not kc.get("access_token"):
+            raise ApiAuthError("Sessão sem login")
+        now = _now_ts()
+        expiring = kc.get("access_expires_at", 0) - self.refresh_margin <= now
+        # No modo degradado, a próxima tentativa tem hora marcada (retry_at)
+        if expiring and kc.get("retry_at", 0) <= now:
+            if kc.get("refresh_expires_at", 0) > now:
+                self._refresh(kc, "expiring")
+                kc = session.get("kc") or {}
+            elif kc.get("access_expires_at", 0) <= now:
+                raise ApiAuthError("Token da sessão expirado")
+        return kc["access_token"]
+
+    def _token_after_401(self, sent: str) -> Optional[str]:
+        """
+        Token para repetir a chamada recusada com `sent`.
+
+        :return: None se não há como renovar agora (a resposta 401 fica).
+        """
+        kc = session.get("kc") or {}
+        current = kc.get("access_token")
+        if current and current != sent:
+            return current  # outra requisição da sessão já renovou
+        now = _now_ts()
+        if not current or kc.get("refresh_expires_at", 0) <= now \
+                or kc.get("retry_at", 0) > now:
+            return None
+        if not self._refresh(kc, "unauthorized"):
+            return None
+        return session["kc"]["access_token"]
+
+    def _refresh(self, kc: Dict[str, Any], reason: str) -> bool:
+        """
+        Renova o token da sessão (single-flight por refresh_token).
+
+        :return: False se o Keycloak está fora e a sessão segue no modo
+            degradado com o token atual.
+        :raises ApiAuthError: Refresh recusado pelo Keycloak.
+        """
+        try:
+            _refresh_session_tokens(kc)
+        except Exception as exc:
+            if _keep_through_outage(kc, exc):
+                API_TOKEN_REFRESHES.inc(reason=reason, outcome="outage")
+                return False
+            API_TOKEN_REFRESHES.inc(reason=reason, outcome="failure")
+            logger.warning("Falha ao renovar token para a API: %s", exc)
+            raise ApiAuthError("Falha ao renovar o token da sessão") from exc
+        API_TOKEN_REFRESHES.inc(reason=reason, outcome="success")
+        return True
+
+
+@lru_cache(maxsize=1)
+def get_api_client() -> ApiClient:
+    """Cliente das APIs do processo, configurado a partir de `Config`."""
+    return ApiClient(
+        base_url=Config.API_BASE_URL,
+        allowed_hosts=[h.strip() for h in Config.API_ALLOWED_HOSTS.split(",") if h.strip()],
+        timeout=(Config.API_CONNECT_TIMEOUT, Config.API_READ_TIMEOUT),
+        pool_hosts=Config.API_POOL_HOSTS,
+        pool_maxsize=Config.API_POOL_MAXSIZE,
+        batch_workers=Config.API_BATCH_WORKERS,
+        refresh_margin=Config.API_TOKEN_REFRESH_MARGIN,
+    )
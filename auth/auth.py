@@ -2,31 +2,74 @@
 Módulo de autenticação com Keycloak.
 """
 import logging
+import random
 import time
 from typing import Any, Dict, Optional, Tuple, Union
 
-from flask import session
+from flask import request, session
 import jwt
-from dash import callback, Input, Output, State, no_update, ctx
+from dash import callback, clientside_callback, Input, Output, State, no_update, ctx
 from dash.exceptions import PreventUpdate
 
-from keycloak import KeycloakOpenID
 from config import Config
+from metrics import REGISTRY
+from auth.context import (
+    claims_cache,
+    get_current_user,
+    reset_current_user,
+)
+from auth.jwks import JWKSError
+from auth.refresh import RefreshLockTimeout, get_refresh_coordinator
+from auth.revocation import get_revocation_queue
+from auth.throttle import get_login_throttle, throttled_message
+from auth.transport import (
+    KeycloakUnavailableError,
+    get_gateway,
+    get_keycloak_client,
+    is_transient,
+)
 
 logger = logging.getLogger(__name__)
 
 
 # --- Keycloak client ---------------------------------------------------------
-keycloak_openid = KeycloakOpenID(
-    server_url=Config.KEYCLOAK_SERVER_URL,
-    client_id=Config.KEYCLOAK_CLIENT_ID,
-    realm_name=Config.KEYCLOAK_REALM_NAME,
-    client_secret_key=Config.KEYCLOAK_CLIENT_SECRET_KEY,
+# O cliente é criado no primeiro uso (get_keycloak_client) e as chamadas
+# passam pelo gateway (timeouts, retries, bulkhead, circuit breaker).
+
+
+def _sync_io_callback(*args: Any, **kwargs: Any):
+    """
+    Registra um callback de I/O síncrono, a menos que `Config.AUTH_ASYNC`
+    esteja ligado (aí quem registra é `auth.auth_async`).
+    """
+    if Config.AUTH_ASYNC:
+        return lambda func: func
+    return callback(*args, **kwargs)
+
+# Mensagem de login enquanto o Keycloak está fora do ar
+UNAVAILABLE_MESSAGE = (
+    "Serviço de autenticação indisponível. Tente novamente em instantes."
 )
 
 # Margem para renovar/avaliar expiração (segundos)
 _TOKEN_SKEW = 30
 
+# Limites do agendamento do auth-keeper (segundos)
+_MIN_REFRESH_DELAY = 5
+_MAX_REFRESH_DELAY = 3600
+
+LOGINS = REGISTRY.counter(
+    "auth_logins_total", "Tentativas de login por resultado.", ("outcome",),
+)
+REFRESHES = REGISTRY.counter(
+    "auth_refreshes_total", "Renovações de token por resultado.", ("outcome",),
+)
+FORCED_LOGOUTS = REGISTRY.counter(
+    "auth_forced_logouts_total",
+    "Sessões derrubadas pelo auth-keeper.",
+    ("reason",),
+)
+
 # --- Helpers -----------------------------------------------------------------
 
 
@@ -39,28 +82,39 @@ def _now_ts() -> int:
     Input("login-status", 'data'),
 )
 def get_info_user(login_status):
-
-    print("PEGANDO INFO DO USUARIO")
-    user_logged = session.get("name", ' ')
+    user = get_current_user()
+    user_logged = user.name if user else ' '
     return f"Welcome {user_logged.title()}"
 
 
 def decode_token(token: str) -> Optional[Dict[str, Any]]:
-    """Decodifica um JWT sem verificar assinatura (apenas claims)."""
+    """
+    Verifica o JWT localmente (assinatura via JWKS, `exp`, `iss`, `aud`).
+    Tokens já verificados saem do cache de claims.
+
+    :return: Claims do token ou None se ele não for válido.
+    """
     try:
-        print(token)
-        return jwt.decode(token,
-                          options={"verify_signature": False},
-                          algorithms=["RS256"],)
-    except jwt.exceptions.DecodeError as exc:
-        logger.error("Falha ao decodificar token JWT", exc_info=exc)
+        return claims_cache.verify(token)
+    except jwt.InvalidTokenError as exc:
+        logger.warning("Token JWT rejeitado: %s", exc)
+        return None
+    except JWKSError as exc:
+        logger.error("JWKS indisponível para verificar token", exc_info=exc)
         return None
 
 
-def _save_tokens_to_session(token_bundle: Dict[str, Any]) -> None:
+def _save_tokens_to_session(token_bundle: Dict[str, Any],
+                            claims: Optional[Dict[str, Any]] = None,
+                            login: bool = False) -> None:
     """
     Guarda tokens e metadados na sessão Flask (servidor).
     NÃO colocar tokens no dcc.Store.
+
+    :param claims: Claims do access token já verificado (`decode_token`);
+        sem elas, a verificação é feita aqui.
+    :param login: Tokens de um login novo: a sessão server-side ganha um
+        id novo (contra session fixation). O refresh mantém o id.
     """
     access_token = token_bundle.get("access_token")
     refresh_token = token_bundle.get("refresh_token")
@@ -74,7 +128,14 @@ def _save_tokens_to_session(token_bundle: Dict[str, Any]) -> None:
     access_expires_at = now + max(0, expires_in - _TOKEN_SKEW)
     refresh_expires_at = now + max(0, refresh_expires_in - _TOKEN_SKEW)
 
-    claims = decode_token(access_token) or {}
+    if claims is None:
+        claims = decode_token(access_token)
+    if claims is None:
+        raise jwt.InvalidTokenError("Access token rejeitado na verificação.")
+    # A sessão em cookie não tem id no servidor para trocar
+    regenerate = getattr(session, "regenerate", None)
+    if login and regenerate is not None:
+        regenerate()
     session["kc"] = {
         "access_token": access_token,
         "refresh_token": refresh_token,
@@ -89,6 +150,166 @@ def _save_tokens_to_session(token_bundle: Dict[str, Any]) -> None:
     session["username"] = claims.get(
         "preferred_username") or claims.get("email") or ""
     session["name"] = claims.get("name") or session["username"]
+    reset_current_user()
+
+
+def _refresh_session_tokens(kc: Dict[str, Any]) -> None:
+    """
+    Troca o refresh_token da sessão por um novo bundle de tokens.
+
+    Chamadas concorrentes com o mesmo refresh_token (abas, callbacks,
+    workers) resultam em um único refresh no Keycloak.
+    """
+    try:
+        new_bundle = get_refresh_coordinator().refresh(
+            kc.get("refresh_token"),
+            lambda token: get_gateway().call(
+                "refresh_token", get_keycloak_client().refresh_token, token,
+            ),
+        )
+        _save_tokens_to_session(new_bundle)
+    except Exception as exc:
+        REFRESHES.inc(outcome="outage" if is_outage(exc) else "failure")
+        raise
+    REFRESHES.inc(outcome="success")
+
+
+# --- Modo degradado ----------------------------------------------------------
+# Com o Keycloak fora do ar, um refresh que falha não derruba a sessão: as
+# claims já verificadas valem até `exp + KEYCLOAK_OUTAGE_GRACE` e o refresh
+# é retentado com backoff exponencial e jitter, para as sessões não
+# baterem juntas no Keycloak quando ele voltar. Recusas do Keycloak
+# (invalid_grant, token inválido) continuam encerrando a sessão.
+
+
+def is_outage(exc: BaseException) -> bool:
+    """
+    Falha do Keycloak (rede, timeout, 5xx, circuito aberto), e não uma
+    recusa do token (`invalid_grant`, 4xx).
+    """
+    return isinstance(exc, (KeycloakUnavailableError, RefreshLockTimeout)) \
+        or is_transient(exc)
+
+
+def _outage_retry_delay(attempt: int) -> int:
+    """Espera até a próxima tentativa: exponencial com "equal jitter"."""
+    step = min(Config.KEYCLOAK_OUTAGE_RETRY_MAX,
+               Config.KEYCLOAK_OUTAGE_RETRY_BASE * 2 ** (attempt - 1))
+    return max(1, round(step / 2 + random.uniform(0, step / 2)))
+
+
+def _keep_through_outage(kc: Dict[str, Any], exc: BaseException) -> bool:
+    """
+    Mantém a sessão depois de um refresh que falhou por queda do Keycloak.
+
+    :return: False se a falha não é uma queda ou a tolerância acabou (a
+        sessão deve cair); True se a sessão segue, com a próxima tentativa
+        agendada em `retry_at`.
+    """
+    if not is_outage(exc) or Config.KEYCLOAK_OUTAGE_GRACE <= 0:
+        return False
+    now = _now_ts()
+    expires_at = int((kc.get("claims") or {}).get("exp", 0))
+    degraded_until = kc.get("degraded_until") or expires_at + Config.KEYCLOAK_OUTAGE_GRACE
+    if now >= degraded_until:
+        return False
+    attempt = kc.get("degraded_attempts", 0) + 1
+    if attempt == 1:
+        logger.info("Keycloak indisponível; sessão mantida até %s: %s",
+                    time.strftime("%H:%M:%S", time.localtime(degraded_until)), exc)
+    session["kc"] = {
+        **kc,
+        "degraded_until": degraded_until,
+        "degraded_attempts": attempt,
+        "retry_at": min(now + _outage_retry_delay(attempt), degraded_until),
+    }
+    reset_current_user()
+    return True
+
+
+def is_authenticated() -> bool:
+    """
+    Indica se a sessão Flask atual tem um access_token válido.
+
+    O token é verificado localmente; se já expirou mas o refresh_token
+    ainda vale, renova antes de responder.
+    """
+    kc = session.get("kc") or {}
+    access_token = kc.get("access_token")
+    if not access_token:
+        return False
+
+    now = _now_ts()
+    if kc.get("access_expires_at", 0) <= now:
+        if kc.get("refresh_expires_at", 0) <= now:
+            return False
+        if kc.get("retry_at", 0) > now:
+            # Modo degradado: espera a tentativa agendada, sem chamar o Keycloak
+            return get_current_user() is not None
+        try:
+            # _save_tokens_to_session já verifica o novo token
+            _refresh_session_tokens(kc)
+            return True
+        except Exception as exc:
+            if _keep_through_outage(kc, exc):
+                return get_current_user() is not None
+            logger.warning("Falha ao renovar token da sessão: %s", exc)
+            return False
+
+    return get_current_user() is not None
+
+
+def _refresh_deadline(kc: Dict[str, Any]) -> int:
+    """Instante (epoch) em que o cliente deve pedir a renovação."""
+    deadline = kc.get("retry_at") or kc.get("access_expires_at", 0)
+    return min(deadline, kc.get("refresh_expires_at", 0))
+
+
+def _logged_in_status() -> Dict[str, Any]:
+    """Dado do 'login-status' para uma sessão autenticada."""
+    kc = session.get("kc") or {}
+    return {"logged_in": True, "token": None, "refresh_at": _refresh_deadline(kc)}
+
+
+def _logged_out_status() -> Dict[str, Any]:
+    """Dado do 'login-status' para uma sessão sem login."""
+    return {"logged_in": False, "token": None}
+
+
+def _login_succeeded() -> Tuple[Dict[str, Any], str, str, Dict[str, str]]:
+    """Saídas de check_credentials para um login aceito."""
+    home_path = f"{Config.ROOT_PATH_PREFIX.rstrip('/')}"
+    # No front guardamos só o flag; token fica na sessão Flask
+    return _logged_in_status(), home_path, "", {"display": "none"}
+
+
+def _login_failed(message: str) -> Tuple[Any, Any, str, Dict[str, str]]:
+    """
+    Saídas de check_credentials para um login recusado.
+
+    O 'login-status' fica como está: gravá-lo dispararia os callbacks que
+    dependem dele (schedule_refresh etc.) sem nada ter mudado.
+    """
+    return no_update, no_update, message, {"display": "block"}
+
+
+def _logout_redirect() -> Tuple[str, Dict[str, Any]]:
+    """Saídas de handle_logout."""
+    login_path = f"{Config.ROOT_PATH_PREFIX.rstrip('/')}"
+    return login_path, _logged_out_status()
+
+
+def _throttle_message(username: str) -> Optional[str]:
+    """
+    Consome uma tentativa de login do IP e do usuário.
+
+    :return: Mensagem de recusa se o limite estourou; None se pode seguir.
+    """
+    throttle = get_login_throttle()
+    if throttle is None:
+        return None
+    retry_after = throttle.check(request.remote_addr, username)
+    return throttled_message(retry_after) if retry_after else None
 
 
 def _clear_session() -> None:
@@ -97,62 +318,108 @@ def _clear_session() -> None:
     session.pop("username", None)
     session.pop("name", None)
     session.clear()
+    reset_current_user()
+
+
+# --- FORMULÁRIO DE LOGIN (no navegador) --------------------------------------
+# Enter nos campos, campos vazios e as mensagens de validação não precisam
+# do servidor: só uma tentativa com usuário e senha preenchidos grava
+# 'login-submit' e dispara check_credentials. Durante a checagem o botão
+# fica em loading (desabilitado) e novas tentativas são ignoradas.
+clientside_callback(
+    """
+    function (nClicks, userSubmit, passwordSubmit, username, password,
+              loading, submitted) {
+        const noUpdate = window.dash_clientside.no_update;
+        if (loading) {
+            return [noUpdate, noUpdate, noUpdate, noUpdate];
+        }
+        const shown = {display: "block"};
+        const hidden = {display: "none"};
+        if (!username || !password) {
+            return [
+                noUpdate,
+                password ? hidden : shown,
+                username ? "" : "Preencha usuário e senha.",
+                username ? hidden : shown,
+            ];
+        }
+        const attempt = ((submitted && submitted.attempt) || 0) + 1;
+        return [{attempt: attempt}, hidden, "", hidden];
+    }
+    """,
+    Output("login-submit", "data"),
+    Output("password-error", "style"),
+    Output("error-message", "children", allow_duplicate=True),
+    Output("error-message", "style", allow_duplicate=True),
+    Input("login-button", "n_clicks"),
+    Input("username", "n_submit"),
+    Input("password", "n_submit"),
+    State("username", "value"),
+    State("password", "value"),
+    State("login-button", "loading"),
+    State("login-submit", "data"),
+    prevent_initial_call=True,
+)
+
+# Aplicado pelo renderer enquanto check_credentials roda
+_LOGIN_RUNNING = [(Output("login-button", "loading"), True, False)]
 
 
 # --- LOGIN -------------------------------------------------------------------
-@callback(
+@_sync_io_callback(
     Output("login-status", "data"),
     Output("url", "pathname"),
     Output("error-message", "children"),
     Output("error-message", "style"),
-    Input("login-button", "n_clicks"),
+    Input("login-submit", "data"),
     State("username", "value"),
     State("password", "value"),
+    running=_LOGIN_RUNNING,
     prevent_initial_call=True,
 )
 def check_credentials(
-    n_clicks: int,
+    submit: Optional[Dict[str, int]],
     username: str,
     password: str,
 ) -> Tuple[Dict[str, Any], Union[str, Any], str, Dict[str, str]]:
-    print("to aqui")
-
     """Valida no Keycloak e redireciona ou mostra erro."""
-    if not n_clicks:
+    if not submit:
         raise PreventUpdate
 
-    print(username, password)
+    logger.info("Tentativa de login", extra={"event": "auth.login", "username": username})
 
     if not username or not password:
-        return (
-            {"logged_in": False, "token": None},
-            no_update,
-            "Preencha usuário e senha.",
-            {"display": "block"},
-        )
+        return _login_failed("Preencha usuário e senha.")
+
+    # Recusa local, sem chamada ao Keycloak
+    refused = _throttle_message(username)
+    if refused:
+        LOGINS.inc(outcome="throttled")
+        return _login_failed(refused)
 
     try:
-        token_bundle = keycloak_openid.token(username, password)  # ROPC
-        _save_tokens_to_session(token_bundle)
+        token_bundle = get_gateway().call(
+            "token", get_keycloak_client().token, username, password,  # ROPC
+        )
+        _save_tokens_to_session(token_bundle, login=True)
+        LOGINS.inc(outcome="success")
+        return _login_succeeded()
 
-        home_path = f"{Config.ROOT_PATH_PREFIX.rstrip('/')}"
-        # No front guardamos só o flag; token fica na sessão Flask
-        return {"logged_in": True, "token": None}, home_path, "", {"display": "none"}
+    except KeycloakUnavailableError as exc:
+        logger.warning("Keycloak indisponível no login: %s", exc)
+        LOGINS.inc(outcome="unavailable")
+        return _login_failed(UNAVAILABLE_MESSAGE)
 
     except Exception as exc:
-        print("falha")
-
         logger.warning("Falha de autenticação no Keycloak: %s", exc)
+        LOGINS.inc(outcome="failure")
         _clear_session()
-        return (
-            {"logged_in": False, "token": None},
-            no_update,
-            "Usuário e/ou senha incorretos.",
-            {"display": "block"},
-        )
+        return _login_failed("Usuário e/ou senha incorretos.")
 
 
 # --- LOGOUT ------------------------------------------------------------------
+# Sem I/O no request (a revogação vai para a fila): serve aos dois modos
 @callback(
     Output("url", "pathname", allow_duplicate=True),
     Output("login-status", "data", allow_duplicate=True),
@@ -160,78 +427,117 @@ def check_credentials(
     prevent_initial_call=True,
 )
 def handle_logout(n_clicks: int):
-
-    print("logoutando aq")
-    """Revoga refresh_token no Keycloak, limpa sessão e manda para /login."""
+    """
+    Limpa a sessão e manda para /login; a revogação do refresh_token no
+    Keycloak fica com a fila em segundo plano.
+    """
     if not n_clicks:
         raise PreventUpdate
 
+    user = get_current_user()
+    logger.info("Logout", extra={"event": "auth.logout",
+                                 "username": user.username if user else None})
+
     token_state = session.get("kc") or {}
     refresh_token = token_state.get("refresh_token")
-    try:
-        if refresh_token:
-            keycloak_openid.logout(refresh_token)
-    except Exception as exc:
-        logger.warning("Falha ao revogar sessão no Keycloak: %s", exc)
+    if refresh_token:
+        get_revocation_queue().submit(refresh_token)
 
     _clear_session()
-
-    login_path = f"{Config.ROOT_PATH_PREFIX.rstrip('/')}"
-    return login_path, {"logged_in": False, "token": None}
-
-
-# --- ENTER para enviar -------------------------------------------------------
-@callback(
-    Output("login-button", "n_clicks", allow_duplicate=True),
-    Input("password", "n_submit"),
-    Input("username", "n_submit"),
-    State("login-button", "n_clicks"),
-    prevent_initial_call=True,
-)
-def handle_enter(password_submit: int, username_submit: int, n_clicks: Optional[int]) -> int:
-    """Permite submeter o login com Enter nos campos."""
-    # Dispara um clique sintético
-    return (n_clicks or 0) + 1
+    return _logout_redirect()
 
 
 # --- REFRESH automático (opcional) ------------------------------------------
 # Para ativar, inclua no seu layout base:
-#   dcc.Interval(id="auth-keeper", interval=30*1000, n_intervals=0)
-@callback(
-    Output("login-status", "data", allow_duplicate=True),
-    Input("auth-keeper", "n_intervals"),
-    State("login-status", "data"),
-    prevent_initial_call=True,
+#   dcc.Interval(id="auth-keeper", disabled=True, n_intervals=0)
+# O intervalo é definido por schedule_refresh a partir da expiração do token.
+# schedule_refresh roda no navegador: o 'refresh_at' do 'login-status' já
+# traz a hora da renovação, e o carregamento da página (com o login-status
+# restaurado do sessionStorage) não custa uma ida ao servidor. Se a sessão
+# Flask sumiu, o primeiro tick percebe e derruba o login.
+clientside_callback(
+    """
+    function schedule_refresh(loginStatus) {
+        const noUpdate = window.dash_clientside.no_update;
+        if (!loginStatus || !loginStatus.logged_in || !loginStatus.refresh_at) {
+            return [noUpdate, true];
+        }
+        const delay = loginStatus.refresh_at - Date.now() / 1000;
+        return [Math.min(Math.max(delay, %d), %d) * 1000, false];
+    }
+    """ % (_MIN_REFRESH_DELAY, _MAX_REFRESH_DELAY),
+    Output("auth-keeper", "interval"),
+    Output("auth-keeper", "disabled"),
+    Input("login-status", "data"),
 )
-def refresh_access_token(_tick: int, login_status: Dict[str, Any]):
+
+
+def _refresh_without_io(login_status: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
-    Renova o access_token quando perto da expiração.
-    Mantém o 'login-status' como está (só atualiza sessão Flask).
-    Se refresh falhar/expirar, derruba a sessão.
+    Resolve o tick do auth-keeper sem chamar o Keycloak.
+
+    :return: Novo 'login-status', ou None se é preciso renovar o token.
+    :raises PreventUpdate: Se não há nada a atualizar no cliente.
     """
     if not login_status or not login_status.get("logged_in"):
         raise PreventUpdate
 
     kc = session.get("kc") or {}
     now = _now_ts()
+    # Um por sessão a cada poucos minutos: amostrado (LOG_SAMPLE_RATES)
+    logger.info("Tick do auth-keeper", extra={
+        "event": "auth.refresh_tick",
+        "access_expires_in": kc.get("access_expires_at", 0) - now,
+        "degraded": "degraded_until" in kc,
+    })
 
     # Se refresh já expirou, forçamos logout client-side
     if kc.get("refresh_expires_at", 0) <= now:
         logger.info("Refresh token expirado; limpando sessão.")
+        FORCED_LOGOUTS.inc(reason="refresh_expired")
         _clear_session()
-        return {"logged_in": False, "token": None}
+        return _logged_out_status()
 
-    # Se access_token ainda está válido, nada a fazer
-    if kc.get("access_expires_at", 0) > now:
-        raise PreventUpdate
+    # Se access_token ainda está válido (ou, no modo degradado, a próxima
+    # tentativa não chegou), só reagenda se outra aba já renovou
+    if _refresh_deadline(kc) > now:
+        status = _logged_in_status()
+        if status["refresh_at"] == login_status.get("refresh_at"):
+            raise PreventUpdate
+        return status
+
+    return None
+
+
+@_sync_io_callback(
+    Output("login-status", "data", allow_duplicate=True),
+    Input("auth-keeper", "n_intervals"),
+    State("login-status", "data"),
+    prevent_initial_call=True,
+)
+def refresh_access_token(_tick: int, login_status: Dict[str, Any]):
+    """
+    Renova o access_token quando perto da expiração.
+    Atualiza o 'refresh_at' do 'login-status' para reagendar o auth-keeper.
+    Se o Keycloak estiver fora do ar, mantém a sessão (modo degradado) e
+    reagenda a tentativa; se o refresh for recusado ou expirar, derruba a
+    sessão.
+    """
+    status = _refresh_without_io(login_status)
+    if status is not None:
+        return status
 
     # Está para expirar: tenta renovar
+    kc = session.get("kc") or {}
     try:
-        new_bundle = keycloak_openid.refresh_token(kc.get("refresh_token"))
-        _save_tokens_to_session(new_bundle)
+        _refresh_session_tokens(kc)
         # Mantém o login-status como True, sem expor token ao front
-        return no_update  # ou {"logged_in": True, "token": None}
+        return _logged_in_status()
     except Exception as exc:
+        if _keep_through_outage(kc, exc):
+            return _logged_in_status()
         logger.warning("Falha ao renovar token; limpando sessão: %s", exc)
+        FORCED_LOGOUTS.inc(
+            reason="keycloak_unavailable" if is_outage(exc) else "refresh_failed")
         _clear_session()
-        return {"logged_in": False, "token": None}
+        return _logged_out_status()
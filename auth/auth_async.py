@@ -0,0 +1,184 @@
+"""
+Variante assíncrona dos callbacks de login e refresh.
+
+Ligada por `Config.AUTH_ASYNC`: substitui `check_credentials` e
+`refresh_access_token` de `auth.auth` por corrotinas que usam os métodos
+`a_*` do python-keycloak (httpx). O logout não faz I/O na requisição
+(ver `auth.revocation`) e é o mesmo nos dois modos. Há um cliente por event
+loop; sob um servidor ASGI (ver `asgi.py`) todas as requisições
+compartilham o mesmo loop e, portanto, o mesmo pool de conexões. Servido
+por WSGI, o Flask roda cada callback assíncrono num loop novo: o cliente
+vale por uma chamada e é fechado quando o loop termina, então o pool não
+é reaproveitado (use `asgi.py` com `AUTH_ASYNC`).
+
+A verificação dos tokens recebidos (assinatura e, no cache frio, a busca
+do JWKS) e o limite de tentativas de login (SQLite, no backend
+compartilhado) são síncronos e rodam numa thread (`asyncio.to_thread`)
+para não travar o loop.
+"""
+import asyncio
+import logging
+import weakref
+from typing import Any, AsyncIterator, Dict, Optional
+
+import jwt
+from dash import callback, Input, Output, State
+from dash.exceptions import PreventUpdate
+from flask import session
+from keycloak import KeycloakOpenID
+
+from auth.auth import (
+    FORCED_LOGOUTS,
+    LOGINS,
+    REFRESHES,
+    UNAVAILABLE_MESSAGE,
+    _LOGIN_RUNNING,
+    _clear_session,
+    _keep_through_outage,
+    _logged_in_status,
+    _logged_out_status,
+    _login_failed,
+    _login_succeeded,
+    _refresh_without_io,
+    _save_tokens_to_session,
+    _throttle_message,
+    decode_token,
+    is_outage,
+)
+from auth.refresh import get_refresh_coordinator
+from auth.transport import (
+    KeycloakUnavailableError,
+    build_keycloak_client,
+    get_gateway,
+)
+
+logger = logging.getLogger(__name__)
+
+# O httpx.AsyncClient fica preso ao loop em que abriu as conexões
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, KeycloakOpenID]" = (
+    weakref.WeakKeyDictionary()
+)
+# Finalizadores dos clientes: o loop só guarda referência fraca a eles
+_closers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncIterator[None]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+async def _close_with_loop(client: KeycloakOpenID) -> AsyncIterator[None]:
+    """
+    Fecha o cliente quando o loop termina: o `asyncio.run` finaliza os
+    async generators pendentes (`shutdown_asyncgens`) antes de fechar o
+    loop, o que faz este `finally` rodar ainda dentro dele.
+    """
+    try:
+        yield
+    finally:
+        connection = client.connection
+        try:
+            await connection.aclose()
+        finally:
+            connection._s.close()
+
+
+async def _async_client() -> KeycloakOpenID:
+    """Cliente Keycloak do event loop corrente."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = build_keycloak_client()
+        closer = _closers[loop] = _close_with_loop(client)
+        await closer.__anext__()
+    return client
+
+
+async def _asave_tokens_to_session(token_bundle: Dict[str, Any],
+                                   login: bool = False) -> None:
+    """`_save_tokens_to_session` com a verificação do token fora do loop."""
+    claims = await asyncio.to_thread(decode_token, token_bundle.get("access_token"))
+    if claims is None:
+        raise jwt.InvalidTokenError("Access token rejeitado na verificação.")
+    _save_tokens_to_session(token_bundle, claims, login=login)
+
+
+# --- LOGIN -------------------------------------------------------------------
+@callback(
+    Output("login-status", "data"),
+    Output("url", "pathname"),
+    Output("error-message", "children"),
+    Output("error-message", "style"),
+    Input("login-submit", "data"),
+    State("username", "value"),
+    State("password", "value"),
+    running=_LOGIN_RUNNING,
+    prevent_initial_call=True,
+)
+async def check_credentials(submit: Optional[Dict[str, int]], username: str,
+                            password: str):
+    """Valida no Keycloak e redireciona ou mostra erro."""
+    if not submit:
+        raise PreventUpdate
+
+    logger.info("Tentativa de login", extra={"event": "auth.login", "username": username})
+
+    if not username or not password:
+        return _login_failed("Preencha usuário e senha.")
+
+    # Com o backend SQLite, a transação do token bucket pode esperar o
+    # busy timeout: fora do loop (o contexto da requisição vai junto)
+    refused = await asyncio.to_thread(_throttle_message, username)
+    if refused:
+        LOGINS.inc(outcome="throttled")
+        return _login_failed(refused)
+
+    try:
+        token_bundle = await get_gateway().acall(
+            "token", (await _async_client()).a_token, username, password,
+        )
+        await _asave_tokens_to_session(token_bundle, login=True)
+        LOGINS.inc(outcome="success")
+        return _login_succeeded()
+    except KeycloakUnavailableError as exc:
+        logger.warning("Keycloak indisponível no login: %s", exc)
+        LOGINS.inc(outcome="unavailable")
+        return _login_failed(UNAVAILABLE_MESSAGE)
+    except Exception as exc:
+        logger.warning("Falha de autenticação no Keycloak: %s", exc)
+        LOGINS.inc(outcome="failure")
+        _clear_session()
+        return _login_failed("Usuário e/ou senha incorretos.")
+
+
+# --- REFRESH -----------------------------------------------------------------
+@callback(
+    Output("login-status", "data", allow_duplicate=True),
+    Input("auth-keeper", "n_intervals"),
+    State("login-status", "data"),
+    prevent_initial_call=True,
+)
+async def refresh_access_token(_tick: int, login_status: Dict[str, Any]):
+    """Renova o access_token quando perto da expiração (ver `auth.auth`)."""
+    status: Optional[Dict[str, Any]] = _refresh_without_io(login_status)
+    if status is not None:
+        return status
+
+    kc = session.get("kc") or {}
+    try:
+        client = await _async_client()
+        new_bundle = await get_refresh_coordinator().arefresh(
+            kc.get("refresh_token"),
+            lambda token: get_gateway().acall(
+                "refresh_token", client.a_refresh_token, token,
+            ),
+        )
+        await _asave_tokens_to_session(new_bundle)
+        REFRESHES.inc(outcome="success")
+        return _logged_in_status()
+    except Exception as exc:
+        REFRESHES.inc(outcome="outage" if is_outage(exc) else "failure")
+        if _keep_through_outage(kc, exc):
+            return _logged_in_status()
+        logger.warning("Falha ao renovar token; limpando sessão: %s", exc)
+        FORCED_LOGOUTS.inc(
+            reason="keycloak_unavailable" if is_outage(exc) else "refresh_failed")
+        _clear_session()
+        return _logged_out_status()
@@ -0,0 +1,202 @@
+"""
+Contexto do usuário autenticado, resolvido uma vez por requisição.
+
+`current_user` é o `AuthUser` da sessão atual (ou None), montado a partir
+do access_token na primeira consulta e guardado em `flask.g`. As claims
+verificadas ficam num LRU por hash do token até o `exp`, então a mesma
+sessão em várias requisições (callbacks, abas, ticks do auth-keeper) não
+repete a verificação da assinatura.
+
+`requires_auth` protege rotas Flask e callbacks Dash (síncronos ou
+assíncronos) exigindo login e, opcionalmente, papéis.
+"""
+import functools
+import hashlib
+import inspect
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, NamedTuple, Optional, Tuple
+
+import jwt
+from dash.exceptions import PreventUpdate
+from flask import abort, g, has_request_context, request, session
+from werkzeug.local import LocalProxy
+
+from auth.jwks import JWKSError, get_verifier
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class AuthUser(NamedTuple):
+    """Usuário autenticado da requisição atual."""
+
+    username: str
+    name: str
+    email: Optional[str]
+    roles: FrozenSet[str]
+    client_roles: FrozenSet[str]
+    expires_at: int
+    claims: Dict[str, Any]
+
+    def has_role(self, role: str) -> bool:
+        """Papel de realm ou do client configurado (`KEYCLOAK_CLIENT_ID`)."""
+        return role in self.roles or role in self.client_roles
+
+    @classmethod
+    def from_claims(cls, claims: Dict[str, Any]) -> "AuthUser":
+        client = (claims.get("resource_access") or {}).get(
+            Config.KEYCLOAK_CLIENT_ID) or {}
+        username = claims.get("preferred_username") or claims.get("email") or ""
+        return cls(
+            username=username,
+            name=claims.get("name") or username,
+            email=claims.get("email"),
+            roles=frozenset((claims.get("realm_access") or {}).get("roles", ())),
+            client_roles=frozenset(client.get("roles", ())),
+            expires_at=int(claims.get("exp", 0)),
+            claims=claims,
+        )
+
+
+class ClaimsCache:
+    """
+    LRU de claims verificadas, por SHA-256 do token, válidas até o `exp`.
+
+    :param max_entries: Quantidade máxima de tokens lembrados.
+    """
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """
+        Claims do token, verificando só na primeira vez.
+
+        :raises jwt.InvalidTokenError: Se o token não for válido.
+        :raises JWKSError: Se o JWKS não puder ser obtido.
+        """
+        key = hashlib.sha256(token.encode()).hexdigest()
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._data.move_to_end(key)
+                    return entry[0]
+                del self._data[key]
+
+        claims = get_verifier().verify(token)
+        with self._lock:
+            self._data[key] = (claims, float(claims["exp"]))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return claims
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+claims_cache = ClaimsCache(Config.CLAIMS_CACHE_SIZE)
+
+_MISSING = object()
+
+
+def get_current_user() -> Optional[AuthUser]:
+    """
+    Usuário da sessão atual, com o access_token verificado.
+
+    Não renova tokens nem chama o Keycloak: access_token expirado ou
+    inválido resulta em None (ver `auth.auth.is_authenticated`). A exceção
+    é o modo degradado (Keycloak fora do ar): até `degraded_until`, o token
+    expirado vale pelas claims verificadas quando foi emitido.
+    """
+    if not has_request_context():
+        return None
+    user = g.get("auth_user", _MISSING)
+    if user is not _MISSING:
+        return user
+
+    user = None
+    kc = session.get("kc") or {}
+    access_token = kc.get("access_token")
+    if access_token:
+        try:
+            user = AuthUser.from_claims(claims_cache.verify(access_token))
+        except jwt.ExpiredSignatureError as exc:
+            if kc.get("degraded_until", 0) > time.time() and kc.get("claims"):
+                user = AuthUser.from_claims(kc["claims"])
+            else:
+                logger.warning("Token JWT rejeitado: %s", exc)
+        except jwt.InvalidTokenError as exc:
+            logger.warning("Token JWT rejeitado: %s", exc)
+        except JWKSError as exc:
+            logger.error("JWKS indisponível para verificar token", exc_info=exc)
+    g.auth_user = user
+    return user
+
+
+def reset_current_user() -> None:
+    """Descarta o usuário resolvido na requisição (tokens mudaram)."""
+    if has_request_context():
+        g.pop("auth_user", None)
+
+
+current_user: Optional[AuthUser] = LocalProxy(get_current_user)  # type: ignore[assignment]
+
+
+def _is_dash_callback() -> bool:
+    return request.path.endswith("_dash-update-component")
+
+
+def _deny(user: Optional[AuthUser]) -> None:
+    # Em callbacks o navegador não trata 401/403: só não atualiza a saída
+    if _is_dash_callback():
+        raise PreventUpdate
+    abort(401 if user is None else 403)
+
+
+def requires_auth(*roles: str) -> Callable[[Callable], Callable]:
+    """
+    Exige usuário autenticado (e todos os `roles`) para executar a função.
+
+    Em rota Flask responde 401 (sem login) ou 403 (sem papel); em callback
+    Dash levanta `PreventUpdate`. Deve ficar abaixo de `@callback` ou
+    `@app.route`::
+
+        @callback(Output("relatorio", "children"), Input("btn", "n_clicks"))
+        @requires_auth("analista")
+        def gerar_relatorio(n_clicks): ...
+
+    :param roles: Papéis de realm ou do client exigidos.
+    """
+
+    def check() -> None:
+        user = get_current_user()
+        if user is None or not all(user.has_role(role) for role in roles):
+            _deny(user)
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                check()
+                return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            check()
+            return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
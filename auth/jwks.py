@@ -0,0 +1,179 @@
+"""
+Verificação local de JWT com cache do JWKS do realm.
+"""
+import logging
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import jwt
+import requests
+
+from auth.transport import get_gateway, get_keycloak_client
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class JWKSError(Exception):
+    """Falha ao obter ou interpretar o JWKS do Keycloak."""
+
+
+class UnknownKeyError(jwt.InvalidTokenError):
+    """Token assinado com um `kid` que não existe no JWKS atual."""
+
+
+def realm_issuer() -> str:
+    """URL do emissor (`iss`) dos tokens do realm configurado."""
+    server_url = (Config.KEYCLOAK_SERVER_URL or "").rstrip("/")
+    return f"{server_url}/realms/{Config.KEYCLOAK_REALM_NAME}"
+
+
+def realm_jwks_url() -> str:
+    """Endpoint de certificados (JWKS) do realm configurado."""
+    return f"{realm_issuer()}/protocol/openid-connect/certs"
+
+
+class JWKSVerifier:
+    """
+    Valida assinatura, `exp`, `iss` e `aud` de tokens localmente.
+
+    As chaves ficam em memória indexadas por `kid`. Um `kid` desconhecido
+    provoca um novo download do JWKS, limitado a um a cada
+    `min_refresh_interval` segundos depois do último que deu certo, para
+    suportar rotação de chaves sem disparar uma enxurrada de requisições
+    ao Keycloak.
+    """
+
+    def __init__(
+        self,
+        jwks_url: str,
+        issuer: str,
+        audience: Optional[str],
+        algorithms: Iterable[str] = ("RS256",),
+        min_refresh_interval: float = 30.0,
+        leeway: int = 0,
+        fetcher: Optional[Callable[[], Dict[str, Any]]] = None,
+    ) -> None:
+        self.jwks_url = jwks_url
+        self.issuer = issuer
+        self.audience = audience
+        self.algorithms = list(algorithms)
+        self.min_refresh_interval = min_refresh_interval
+        self.leeway = leeway
+        self._fetcher = fetcher or self._fetch_jwks
+        self._keys: Dict[str, jwt.PyJWK] = {}
+        self._lock = threading.Lock()
+        self._last_fetch: Optional[float] = None
+
+    def _fetch_jwks(self) -> Dict[str, Any]:
+        try:
+            response = requests.get(self.jwks_url, timeout=5)
+            response.raise_for_status()
+            return response.json()
+        except (requests.RequestException, ValueError) as exc:
+            raise JWKSError(f"Falha ao obter JWKS de {self.jwks_url}") from exc
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Baixa o JWKS e substitui as chaves em cache.
+
+        :param force: Ignora o intervalo mínimo entre downloads.
+        :return: True se o JWKS foi de fato baixado.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if (
+                not force
+                and self._last_fetch is not None
+                and now - self._last_fetch < self.min_refresh_interval
+            ):
+                return False
+            try:
+                jwks = self._fetcher()
+            except JWKSError:
+                raise
+            except Exception as exc:
+                raise JWKSError("Falha ao obter JWKS do Keycloak") from exc
+            # Só um download que deu certo conta para o intervalo mínimo: com
+            # o Keycloak reiniciando, a próxima verificação tenta de novo (o
+            # circuit breaker do gateway limita as tentativas)
+            self._last_fetch = now
+
+            keys: Dict[str, jwt.PyJWK] = {}
+            for jwk_data in jwks.get("keys", []):
+                kid = jwk_data.get("kid")
+                # Keycloak publica também chaves de cifragem (use=enc)
+                if not kid or jwk_data.get("use", "sig") != "sig":
+                    continue
+                try:
+                    keys[kid] = jwt.PyJWK(jwk_data)
+                except jwt.PyJWKError as exc:
+                    logger.warning("Chave JWKS ignorada (kid=%s): %s", kid, exc)
+            self._keys = keys
+            logger.info("JWKS carregado com %d chave(s).", len(keys))
+            return True
+
+    @property
+    def key_count(self) -> int:
+        """Chaves de assinatura em cache."""
+        return len(self._keys)
+
+    def get_key(self, kid: Optional[str]) -> jwt.PyJWK:
+        """Retorna a chave do `kid`, recarregando o JWKS se necessário."""
+        key = self._keys.get(kid) if kid else None
+        if key is None and kid:
+            self.refresh()
+            key = self._keys.get(kid)
+        if key is None:
+            raise UnknownKeyError(f"kid desconhecido: {kid!r}")
+        return key
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """
+        Verifica o token e devolve suas claims.
+
+        :param token: JWT compacto.
+        :return: Claims do token.
+        :raises jwt.InvalidTokenError: Se o token não for válido.
+        :raises JWKSError: Se o JWKS não puder ser obtido.
+        """
+        header = jwt.get_unverified_header(token)
+        key = self.get_key(header.get("kid"))
+        claims = jwt.decode(
+            token,
+            key=key.key,
+            algorithms=self.algorithms,
+            issuer=self.issuer,
+            leeway=self.leeway,
+            options={"verify_aud": False, "require": ["exp", "iss"]},
+        )
+        self._check_audience(claims)
+        return claims
+
+    def _check_audience(self, claims: Dict[str, Any]) -> None:
+        # No Keycloak o client costuma aparecer em `azp`; `aud` só o contém
+        # quando há um audience mapper configurado.
+        if not self.audience:
+            return
+        aud = claims.get("aud") or []
+        if isinstance(aud, str):
+            aud = [aud]
+        if self.audience not in aud and claims.get("azp") != self.audience:
+            raise jwt.InvalidAudienceError("Audience inválida")
+
+
+@lru_cache(maxsize=1)
+def get_verifier() -> JWKSVerifier:
+    """Verificador compartilhado, configurado a partir de `Config`."""
+    return JWKSVerifier(
+        jwks_url=realm_jwks_url(),
+        issuer=realm_issuer(),
+        audience=Config.KEYCLOAK_AUDIENCE or Config.KEYCLOAK_CLIENT_ID,
+        min_refresh_interval=Config.JWKS_MIN_REFRESH_INTERVAL,
+        leeway=Config.JWT_LEEWAY,
+        fetcher=lambda: get_gateway().call(
+            "certs", get_keycloak_client().certs, idempotent=True,
+        ),
+    )
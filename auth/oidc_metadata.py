@@ -0,0 +1,219 @@
+"""
+Metadados OIDC do realm (discovery e JWKS) aquecidos e renovados em
+segundo plano.
+
+`start` baixa o `.well-known/openid-configuration` e o JWKS (nas chaves do
+`JWKSVerifier` compartilhado) numa thread, antes de o processo atender o
+primeiro login, e renova os dois antes de vencer `ttl`, com jitter para
+os workers não baterem no Keycloak juntos. Enquanto uma renovação falha,
+os dados antigos continuam valendo (stale-while-revalidate) e a thread
+tenta de novo com backoff exponencial.
+
+`status` descreve o estado do cache sem chamar o Keycloak; é a base do
+`/readyz` (ver health.py). O processo fica pronto depois do primeiro
+download completo e deixa de ficar se os dados passarem de `max_stale`
+sem renovação.
+
+Threads não atravessam o fork: com `preload_app`, o gunicorn inicia o
+cache em cada worker (`post_fork`). Nos demais servidores, `ensure_started`
+no primeiro probe faz o mesmo.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional
+
+from auth.jwks import get_verifier, realm_issuer
+from auth.transport import get_gateway, get_keycloak_client
+from config import Config
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+METADATA_REFRESHES = REGISTRY.counter(
+    "oidc_metadata_refreshes_total",
+    "Renovações do discovery e do JWKS por resultado.",
+    ("outcome",),
+)
+
+
+class OIDCMetadataError(Exception):
+    """Discovery do realm ainda não obtido (e o Keycloak não respondeu)."""
+
+
+def _fetch_discovery() -> Dict[str, Any]:
+    return get_gateway().call(
+        "well_known", get_keycloak_client().well_known, idempotent=True,
+    )
+
+
+def _refresh_jwks() -> int:
+    verifier = get_verifier()
+    verifier.refresh(force=True)
+    return verifier.key_count
+
+
+class OIDCMetadata:
+    """
+    Cache do discovery e do JWKS com renovação em segundo plano.
+
+    :param fetch_discovery: Baixa o documento de discovery.
+    :param refresh_jwks: Recarrega o JWKS; devolve o número de chaves.
+    :param ttl: Validade (s) dos dados; a renovação começa antes disso.
+    :param max_stale: Idade (s) a partir da qual o processo deixa de estar
+        pronto, se nenhuma renovação der certo.
+    :param backoff: Espera base (s) depois de uma falha; dobra a cada falha.
+    :param max_backoff: Teto da espera entre tentativas.
+    """
+
+    def __init__(
+        self,
+        fetch_discovery: Callable[[], Dict[str, Any]] = _fetch_discovery,
+        refresh_jwks: Callable[[], int] = _refresh_jwks,
+        ttl: float = 300.0,
+        max_stale: float = 3600.0,
+        backoff: float = 1.0,
+        max_backoff: float = 30.0,
+    ) -> None:
+        self.fetch_discovery = fetch_discovery
+        self.refresh_jwks = refresh_jwks
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._discovery: Optional[Dict[str, Any]] = None
+        self._jwks_keys = 0
+        self._loaded_at: Optional[float] = None
+        self._failures = 0
+        self._last_error: Optional[str] = None
+        self._refresh_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._first_attempt = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    # --- dados -----------------------------------------------------------
+
+    def refresh(self) -> bool:
+        """
+        Baixa discovery e JWKS. Em caso de falha, mantém os dados anteriores.
+
+        :return: True se os dois foram renovados.
+        """
+        with self._refresh_lock:
+            try:
+                discovery = self.fetch_discovery()
+                keys = self.refresh_jwks()
+            except Exception as exc:
+                self._failures += 1
+                self._last_error = f"{type(exc).__name__}: {exc}"
+                METADATA_REFRESHES.inc(outcome="error")
+                logger.warning("Falha ao renovar metadados OIDC (%d seguida(s)): %s",
+                               self._failures, exc)
+                return False
+            issuer = discovery.get("issuer")
+            if issuer and issuer.rstrip("/") != realm_issuer():
+                logger.warning("Issuer do discovery (%s) difere do configurado (%s).",
+                               issuer, realm_issuer())
+            self._discovery = discovery
+            self._jwks_keys = keys
+            self._loaded_at = time.time()
+            self._failures = 0
+            self._last_error = None
+            METADATA_REFRESHES.inc(outcome="ok")
+            return True
+
+    def discovery(self) -> Dict[str, Any]:
+        """
+        Documento de discovery em cache (mesmo vencido, enquanto renova).
+
+        :raises OIDCMetadataError: Se nunca foi obtido e o Keycloak não responde.
+        """
+        if self._discovery is None and not self.refresh():
+            raise OIDCMetadataError(f"Discovery indisponível: {self._last_error}")
+        return self._discovery
+
+    def endpoint(self, name: str) -> str:
+        """URL de um endpoint do discovery (ex.: `token_endpoint`)."""
+        return self.discovery()[name]
+
+    def age(self) -> Optional[float]:
+        """Segundos desde a última renovação completa, ou None."""
+        return None if self._loaded_at is None else time.time() - self._loaded_at
+
+    def status(self) -> Dict[str, Any]:
+        """Estado do cache, sem chamar o Keycloak."""
+        self.ensure_started()
+        age = self.age()
+        return {
+            "ready": age is not None and age <= self.max_stale,
+            "age_seconds": None if age is None else round(age, 1),
+            "stale": age is not None and age > self.ttl,
+            "jwks_keys": self._jwks_keys,
+            "consecutive_failures": self._failures,
+            "last_error": self._last_error,
+            "circuit": get_gateway().breaker.state,
+        }
+
+    # --- thread de renovação ---------------------------------------------
+
+    def _next_delay(self, ok: bool) -> float:
+        if ok:
+            # Antes de vencer, espalhado entre os workers
+            return self.ttl * random.uniform(0.75, 0.9)
+        step = min(self.max_backoff, self.backoff * 2 ** (self._failures - 1))
+        return step * random.uniform(0.5, 1.0)
+
+    def _run(self) -> None:
+        ok = self.refresh()
+        self._first_attempt.set()
+        while not self._stopping.wait(self._next_delay(ok)):
+            ok = self.refresh()
+
+    def start(self, wait: float = 0.0) -> None:
+        """
+        Inicia a thread de renovação neste processo (idempotente).
+
+        :param wait: Espera (s) pela primeira tentativa de download.
+        """
+        with self._start_lock:
+            if self._pid != os.getpid():
+                # Processo novo (fork): a thread do pai não existe aqui
+                self._pid = os.getpid()
+                self._first_attempt.clear()
+                self._stopping.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name="oidc-metadata", daemon=True,
+                )
+                self._thread.start()
+        if wait > 0 and not self._first_attempt.wait(wait):
+            logger.warning("Metadados OIDC ainda não obtidos após %.1f s.", wait)
+
+    def ensure_started(self) -> None:
+        """`start` sem espera; barato quando a thread já roda neste processo."""
+        if self._pid != os.getpid():
+            self.start()
+
+    def stop(self) -> None:
+        """Encerra a thread de renovação (os dados em cache continuam)."""
+        self._stopping.set()
+
+
+@lru_cache(maxsize=1)
+def get_oidc_metadata() -> OIDCMetadata:
+    """Cache do processo, configurado por `Config`."""
+    return OIDCMetadata(
+        ttl=Config.OIDC_METADATA_TTL,
+        max_stale=Config.OIDC_METADATA_MAX_STALE,
+    )
+
+
+REGISTRY.gauge(
+    "oidc_metadata_age_seconds",
+    "Idade do discovery/JWKS em cache (sem valor antes do primeiro download).",
+    lambda: get_oidc_metadata().age(),
+)
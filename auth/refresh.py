@@ -0,0 +1,270 @@
+"""
+Coordenação de refresh de tokens: uma única chamada ao Keycloak por
+refresh_token, mesmo com várias abas, callbacks simultâneos ou workers.
+
+O primeiro chamador renova; os concorrentes esperam e reutilizam o
+resultado. Entre threads a exclusão é feita com `threading.Lock`; entre
+processos, com `flock` em arquivos de lock e um SQLite com os resultados
+recentes, ambos em `Config.REFRESH_COORDINATION_DIR`.
+"""
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshLockTimeout(Exception):
+    """Outro chamador segurou o refresh por tempo demais."""
+
+
+def _token_key(refresh_token: str) -> str:
+    return hashlib.sha256(refresh_token.encode()).hexdigest()
+
+
+class RefreshCoordinator:
+    """
+    Single-flight de `refresh_token` por sessão.
+
+    :param shared_dir: Diretório compartilhado entre workers (opcional).
+        Sem ele a coordenação vale só dentro do processo.
+    :param result_ttl: Por quanto tempo (s) um resultado é reaproveitado
+        por quem chegar com o mesmo refresh_token antigo.
+    :param lock_timeout: Espera máxima (s) pelo refresh de outro chamador.
+    :param lock_stripes: Quantidade de arquivos de lock entre processos.
+    """
+
+    def __init__(
+        self,
+        shared_dir: Optional[str] = None,
+        result_ttl: float = 60.0,
+        lock_timeout: float = 15.0,
+        lock_stripes: int = 64,
+    ) -> None:
+        self.shared_dir = shared_dir
+        self.result_ttl = result_ttl
+        self.lock_timeout = lock_timeout
+        self.lock_stripes = lock_stripes
+
+        self._guard = threading.Lock()
+        self._locks: Dict[str, List[Any]] = {}  # key -> [Lock, refcount]
+        self._results: Dict[str, Tuple[Dict[str, Any], float]] = {}
+        self._local = threading.local()
+
+        if shared_dir:
+            # O banco guarda bundles completos (access e refresh token)
+            os.makedirs(shared_dir, mode=0o700, exist_ok=True)
+            path = os.path.join(shared_dir, "refresh.db")
+            # Criado já restrito; o SQLite dá a mesma permissão ao -wal/-shm
+            os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+            # A troca para WAL não respeita o busy timeout: feita uma vez,
+            # com os workers subindo juntos serializados pelo flock
+            fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                conn = self._db()
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS refresh_results ("
+                    " key TEXT PRIMARY KEY,"
+                    " bundle TEXT NOT NULL,"
+                    " expires_at REAL NOT NULL)"
+                )
+            finally:
+                os.close(fd)
+
+    # --- resultados recentes --------------------------------------------
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # Com preload_app, a conexão aberta no master não segue no fork
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(
+                os.path.join(self.shared_dir, "refresh.db"),
+                timeout=5,
+                isolation_level=None,
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._guard:
+            hit = self._results.get(key)
+            if hit is not None and hit[1] > now:
+                return hit[0]
+        if self.shared_dir:
+            row = self._db().execute(
+                "SELECT bundle FROM refresh_results"
+                " WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+            if row:
+                return json.loads(row[0])
+        return None
+
+    def _store(self, key: str, bundle: Dict[str, Any]) -> None:
+        now = time.time()
+        expires_at = now + self.result_ttl
+        with self._guard:
+            self._results = {
+                k: v for k, v in self._results.items() if v[1] > now
+            }
+            self._results[key] = (bundle, expires_at)
+        if self.shared_dir:
+            conn = self._db()
+            conn.execute("DELETE FROM refresh_results WHERE expires_at <= ?",
+                         (now,))
+            conn.execute(
+                "INSERT OR REPLACE INTO refresh_results (key, bundle, expires_at)"
+                " VALUES (?, ?, ?)",
+                (key, json.dumps(bundle), expires_at),
+            )
+
+    # --- exclusão mútua --------------------------------------------------
+
+    def _acquire(self, key: str) -> Optional[int]:
+        """Adquire o lock da chave (thread e, se configurado, processo)."""
+        deadline = time.monotonic() + self.lock_timeout
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        if not entry[0].acquire(timeout=self.lock_timeout):
+            self._drop(key)
+            raise RefreshLockTimeout("Timeout aguardando refresh em andamento")
+
+        if not self.shared_dir:
+            return None
+        stripe = int(key[:8], 16) % self.lock_stripes
+        path = os.path.join(self.shared_dir, f"refresh-{stripe:02d}.lock")
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    os.close(fd)
+                    self._release(key, None)
+                    raise RefreshLockTimeout(
+                        "Timeout aguardando refresh em outro worker"
+                    )
+                time.sleep(0.01)
+
+    def _release(self, key: str, fd: Optional[int]) -> None:
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        self._locks[key][0].release()
+        self._drop(key)
+
+    def _drop(self, key: str) -> None:
+        with self._guard:
+            entry = self._locks[key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    # --- API -------------------------------------------------------------
+
+    def refresh(
+        self,
+        refresh_token: str,
+        fetch: Callable[[str], Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """
+        Renova o token, garantindo uma única chamada `fetch` por token.
+
+        :param refresh_token: refresh_token atual da sessão.
+        :param fetch: Função que de fato chama o Keycloak.
+        :return: Novo bundle de tokens (possivelmente obtido por outro chamador).
+        """
+        key = _token_key(refresh_token)
+        bundle = self._lookup(key)
+        if bundle is not None:
+            return bundle
+
+        fd = self._acquire(key)
+        try:
+            # Quem estava na fila encontra o resultado do primeiro
+            bundle = self._lookup(key)
+            if bundle is None:
+                bundle = fetch(refresh_token)
+                self._store(key, bundle)
+            else:
+                logger.debug("Refresh reaproveitado de chamada concorrente.")
+            return bundle
+        finally:
+            self._release(key, fd)
+
+    async def arefresh(
+        self,
+        refresh_token: str,
+        fetch: Callable[[str], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """
+        Versão assíncrona de `refresh`: a espera pelo lock e o SQLite
+        compartilhado saem do loop, em threads.
+        """
+        key = _token_key(refresh_token)
+        bundle = await self._off_loop(self._lookup, key)
+        if bundle is not None:
+            return bundle
+
+        acquiring = asyncio.ensure_future(
+            asyncio.to_thread(self._acquire_and_lookup, key))
+        try:
+            fd, bundle = await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # A thread segue até conseguir o lock; sem devolvê-lo, todo
+            # refresh seguinte deste token ficaria esperando para sempre
+            acquiring.add_done_callback(lambda done: self._release_acquired(key, done))
+            raise
+        try:
+            if bundle is None:
+                bundle = await fetch(refresh_token)
+                await self._off_loop(self._store, key, bundle)
+            return bundle
+        finally:
+            self._release(key, fd)
+
+    def _acquire_and_lookup(self, key: str) -> Tuple[Optional[int], Optional[Dict[str, Any]]]:
+        fd = self._acquire(key)
+        try:
+            # Quem estava na fila encontra o resultado do primeiro
+            return fd, self._lookup(key)
+        except BaseException:
+            self._release(key, fd)
+            raise
+
+    def _release_acquired(self, key: str, done: "asyncio.Future") -> None:
+        """Devolve o lock pego por uma espera que foi cancelada."""
+        if done.cancelled() or done.exception() is not None:
+            return  # o lock não foi pego (ou já foi devolvido)
+        self._release(key, done.result()[0])
+
+    async def _off_loop(self, func: Callable[..., Any], *args: Any) -> Any:
+        # Sem diretório compartilhado, só há dicts em memória: roda direto
+        if not self.shared_dir:
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+
+@lru_cache(maxsize=1)
+def get_refresh_coordinator() -> RefreshCoordinator:
+    """Coordenador compartilhado, configurado a partir de `Config`."""
+    return RefreshCoordinator(
+        shared_dir=Config.REFRESH_COORDINATION_DIR or None,
+        result_ttl=Config.REFRESH_RESULT_TTL,
+    )
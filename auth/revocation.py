@@ -0,0 +1,248 @@
+"""
+Revogação de refresh tokens no Keycloak em segundo plano.
+
+O logout limpa a sessão local e só enfileira o refresh_token; workers em
+thread chamam o endpoint de logout do Keycloak pelo gateway. Falhas
+transitórias (rede, 5xx) voltam para a fila com backoff exponencial e
+jitter até `max_attempts`; com o circuito aberto o item espera a reabertura
+sem gastar tentativa. Recusas do Keycloak (ex.: token já inválido)
+encerram o item. Com a fila cheia, ou passado `max_age`, o token é
+descartado: ele expira sozinho em `refresh_expires_in`.
+
+No encerramento do processo a fila é drenada por no máximo
+`drain_timeout` segundos.
+"""
+import atexit
+import heapq
+import itertools
+import logging
+import queue
+import random
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from auth.transport import (
+    KeycloakUnavailableError,
+    get_gateway,
+    get_keycloak_client,
+    is_transient,
+)
+from config import Config
+from metrics import LATENCY_BUCKETS, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+REVOCATIONS = REGISTRY.counter(
+    "keycloak_revocations_total",
+    "Revogações de refresh token por resultado.",
+    ("outcome",),
+)
+REVOCATION_LAG = REGISTRY.histogram(
+    "keycloak_revocation_lag_seconds",
+    "Tempo entre o logout e a revogação confirmada no Keycloak.",
+    buckets=(*LATENCY_BUCKETS, 30.0, 60.0, 300.0),
+)
+
+
+class _Item(NamedTuple):
+    refresh_token: str
+    enqueued_at: float
+    attempt: int
+
+
+def _revoke_in_keycloak(refresh_token: str) -> None:
+    get_gateway().call(
+        "logout", get_keycloak_client().logout, refresh_token, idempotent=True,
+    )
+
+
+class RevocationQueue:
+    """
+    Fila limitada de revogações com workers em segundo plano.
+
+    :param revoke: Função que revoga um refresh_token no Keycloak.
+    :param maxsize: Capacidade da fila (itens além disso são descartados).
+    :param workers: Quantidade de threads de revogação.
+    :param max_attempts: Tentativas por token antes de desistir.
+    :param backoff: Espera base (s) entre tentativas; dobra a cada falha.
+    :param max_backoff: Teto da espera entre tentativas.
+    :param unavailable_delay: Espera (s) quando o gateway recusa a chamada
+        localmente (circuito aberto, bulkhead lotado).
+    :param max_age: Idade (s) a partir da qual não vale mais revogar.
+    :param drain_timeout: Tempo máximo (s) de drenagem em `shutdown`.
+    """
+
+    def __init__(
+        self,
+        revoke: Callable[[str], None] = _revoke_in_keycloak,
+        maxsize: int = 1000,
+        workers: int = 2,
+        max_attempts: int = 5,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        unavailable_delay: float = 30.0,
+        max_age: float = 1800.0,
+        drain_timeout: float = 5.0,
+    ) -> None:
+        self.revoke = revoke
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.unavailable_delay = unavailable_delay
+        self.max_age = max_age
+        self.drain_timeout = drain_timeout
+
+        self._queue: "queue.Queue[_Item]" = queue.Queue(maxsize=maxsize)
+        # Retentativas agendadas: (quando, desempate, item)
+        self._retries: List[Tuple[float, int, _Item]] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._deadline: Optional[float] = None
+
+    # --- API -------------------------------------------------------------
+
+    def submit(self, refresh_token: str) -> bool:
+        """
+        Enfileira a revogação sem bloquear.
+
+        :return: False se a fila estava cheia (ou encerrando) e o token foi
+            descartado.
+        """
+        if self._stopping.is_set():
+            REVOCATIONS.inc(outcome="dropped")
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(_Item(refresh_token, time.time(), 0))
+            return True
+        except queue.Full:
+            logger.warning("Fila de revogação cheia; token descartado.")
+            REVOCATIONS.inc(outcome="dropped")
+            return False
+
+    def depth(self) -> int:
+        """Itens aguardando revogação (na fila e em espera de retentativa)."""
+        return self._queue.qsize() + len(self._retries)
+
+    def shutdown(self, timeout: Optional[float] = None) -> int:
+        """
+        Para de aceitar itens e drena a fila por até `timeout` segundos.
+
+        :return: Quantidade de tokens que ficaram sem revogar.
+        """
+        timeout = self.drain_timeout if timeout is None else timeout
+        self._deadline = time.monotonic() + timeout
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(max(0.0, self._deadline - time.monotonic()))
+        left = self.depth()
+        if left:
+            logger.warning("%d revogações pendentes no encerramento.", left)
+            REVOCATIONS.inc(left, outcome="dropped")
+        return left
+
+    # --- workers ---------------------------------------------------------
+
+    def _ensure_started(self) -> None:
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(
+                    target=self._run, name=f"kc-revocation-{index}", daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _next_item(self) -> Optional[_Item]:
+        """Próximo item pronto: retentativa vencida ou item da fila."""
+        now = time.monotonic()
+        # Drenando, retentativas não esperam o backoff (o prazo é o limite)
+        draining = self._stopping.is_set()
+        with self._lock:
+            if self._retries and (draining or self._retries[0][0] <= now):
+                return heapq.heappop(self._retries)[2]
+            wait = self._retries[0][0] - now if self._retries else 0.5
+        if draining:
+            wait = 0.05
+        try:
+            return self._queue.get(timeout=min(wait, 0.5))
+        except queue.Empty:
+            return None
+
+    def _draining_expired(self) -> bool:
+        return self._deadline is not None and time.monotonic() >= self._deadline
+
+    def _run(self) -> None:
+        while not self._draining_expired():
+            item = self._next_item()
+            if item is None:
+                if self._stopping.is_set() and not self.depth():
+                    return
+                continue
+            self._process(item)
+
+    def _schedule(self, item: _Item, delay: float) -> None:
+        with self._lock:
+            heapq.heappush(self._retries,
+                           (time.monotonic() + delay, next(self._seq), item))
+
+    def _process(self, item: _Item) -> None:
+        if time.time() - item.enqueued_at > self.max_age:
+            REVOCATIONS.inc(outcome="expired")
+            return
+        try:
+            self.revoke(item.refresh_token)
+        except KeycloakUnavailableError:
+            # Recusa local do gateway: nenhuma chamada saiu, não conta tentativa
+            self._schedule(item, random.uniform(0.5, 1.0) * self.unavailable_delay)
+            REVOCATIONS.inc(outcome="deferred")
+            return
+        except Exception as exc:
+            if not is_transient(exc):
+                # Token já inválido/expirado no Keycloak: nada a revogar
+                logger.info("Keycloak recusou a revogação: %s", exc)
+                REVOCATIONS.inc(outcome="rejected")
+                return
+            if item.attempt + 1 >= self.max_attempts:
+                logger.warning("Revogação abandonada após %d tentativas: %s",
+                               item.attempt + 1, exc)
+                REVOCATIONS.inc(outcome="failed")
+                return
+            delay = random.uniform(
+                0, min(self.max_backoff, self.backoff * 2 ** item.attempt))
+            self._schedule(item._replace(attempt=item.attempt + 1), delay)
+            REVOCATIONS.inc(outcome="retried")
+            return
+        REVOCATIONS.inc(outcome="ok")
+        REVOCATION_LAG.observe(time.time() - item.enqueued_at)
+
+
+@lru_cache(maxsize=1)
+def get_revocation_queue() -> RevocationQueue:
+    """Fila do processo, configurada por `Config` e drenada no `atexit`."""
+    revocations = RevocationQueue(
+        maxsize=Config.REVOCATION_QUEUE_SIZE,
+        workers=Config.REVOCATION_WORKERS,
+        max_attempts=Config.REVOCATION_MAX_ATTEMPTS,
+        backoff=Config.REVOCATION_BACKOFF,
+        unavailable_delay=Config.KEYCLOAK_BREAKER_RESET,
+        max_age=Config.REVOCATION_MAX_AGE,
+        drain_timeout=Config.REVOCATION_DRAIN_TIMEOUT,
+    )
+    atexit.register(revocations.shutdown)
+    return revocations
+
+
+REGISTRY.gauge(
+    "keycloak_revocation_queue_depth",
+    "Revogações pendentes (fila e retentativas).",
+    lambda: get_revocation_queue().depth(),
+)
@@ -0,0 +1,199 @@
+"""
+Política de acesso por rota, compilada uma vez numa trie de prefixos.
+
+Regras vêm de `Config.ROUTE_RULES`, separadas por ";" ou quebra de linha:
+
+    /home/relatorios=analista;/home/admin=realm:admin,client:gestor;/home/ajuda=public
+
+- `prefixo=public`: liberado sem login;
+- `prefixo` (sem papéis): exige login;
+- `prefixo=papel,...`: exige login e todos os papéis. `realm:x` e
+  `client:x` restringem ao papel de realm ou do client; sem qualificador
+  vale qualquer um dos dois (como em `requires_auth`).
+
+Os prefixos casam por segmento ("/home/adm" não casa "/home/admin") e vale
+a regra mais específica. `Config.ROOT` inteiro exige login por padrão.
+
+`install_route_policy` aplica a política num `before_request` nas rotas
+que servem o HTML do Dash: sem login, a requisição recebe um redirect
+barato para a página de login antes de qualquer renderização ou download
+do bundle; sem papel, 403. `render_page` usa a mesma política para as
+navegações que não recarregam a página.
+"""
+import logging
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+
+from flask import Flask, Response, abort, redirect, request
+
+from auth.auth import is_authenticated
+from auth.context import AuthUser, get_current_user
+from config import Config
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+ROUTE_DENIALS = REGISTRY.counter(
+    "route_policy_denials_total",
+    "Páginas recusadas pela política de rotas antes de renderizar.",
+    ("reason",),
+)
+
+ALLOW = "allow"
+LOGIN = "login"
+FORBIDDEN = "forbidden"
+
+
+class RouteRule(NamedTuple):
+    """Regra de um prefixo de rota."""
+
+    prefix: str
+    public: bool
+    roles: FrozenSet[str]
+
+
+def _segments(path: str) -> List[str]:
+    return [part for part in path.split("/") if part]
+
+
+def normalize_path(path: str) -> str:
+    """Caminho sem barras repetidas nem barra final ("/" continua "/")."""
+    return "/" + "/".join(_segments(path))
+
+
+def parse_rules(text: str) -> List[RouteRule]:
+    """
+    Lê regras no formato de `Config.ROUTE_RULES`.
+
+    :raises ValueError: Regra sem prefixo absoluto.
+    """
+    rules = []
+    for entry in text.replace("\n", ";").split(";"):
+        entry = entry.strip()
+        if not entry:
+            continue
+        prefix, _, spec = entry.partition("=")
+        prefix = prefix.strip()
+        if not prefix.startswith("/"):
+            raise ValueError(
+                f"Regra de rota inválida (prefixo deve começar com /): {entry!r}"
+            )
+        names = frozenset(name.strip() for name in spec.split(",") if name.strip())
+        public = "public" in names
+        rules.append(RouteRule(normalize_path(prefix), public,
+                               frozenset() if public else names))
+    return rules
+
+
+def _has_role(user: AuthUser, role: str) -> bool:
+    scope, _, name = role.partition(":")
+    if scope == "realm" and name:
+        return name in user.roles
+    if scope == "client" and name:
+        return name in user.client_roles
+    return user.has_role(role)
+
+
+class _Node:
+    __slots__ = ("children", "rule")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_Node"] = {}
+        self.rule: Optional[RouteRule] = None
+
+
+class RoutePolicy:
+    """
+    Regras de rota numa trie por segmento do caminho.
+
+    O custo de `match` depende da profundidade do caminho, não do número de
+    regras. Regras repetidas para o mesmo prefixo: vale a última.
+    """
+
+    def __init__(self, rules: Iterable[RouteRule]) -> None:
+        self._root = _Node()
+        self.size = 0
+        for rule in rules:
+            node = self._root
+            for part in _segments(rule.prefix):
+                node = node.children.setdefault(part, _Node())
+            if node.rule is None:
+                self.size += 1
+            node.rule = rule
+
+    def match(self, path: str) -> Optional[RouteRule]:
+        """Regra do prefixo mais específico que cobre `path`, ou None."""
+        node = self._root
+        rule = node.rule
+        for part in path.split("/"):
+            if not part:
+                continue
+            node = node.children.get(part)
+            if node is None:
+                break
+            if node.rule is not None:
+                rule = node.rule
+        return rule
+
+    def decide(self, path: str, user: Optional[AuthUser]) -> str:
+        """
+        `ALLOW`, `LOGIN` (precisa autenticar) ou `FORBIDDEN` (falta papel).
+
+        :param user: Usuário autenticado, ou None.
+        """
+        return rule_decision(self.match(path), user)
+
+
+def rule_decision(rule: Optional[RouteRule], user: Optional[AuthUser]) -> str:
+    """Decisão de `RoutePolicy.decide` para uma regra já encontrada."""
+    if rule is None or rule.public:
+        return ALLOW
+    if user is None:
+        return LOGIN
+    if all(_has_role(user, role) for role in rule.roles):
+        return ALLOW
+    return FORBIDDEN
+
+
+@lru_cache(maxsize=1)
+def get_route_policy() -> RoutePolicy:
+    """Política do processo: `Config.ROOT` exige login, mais `ROUTE_RULES`."""
+    root = RouteRule(normalize_path(Config.ROOT), False, frozenset())
+    policy = RoutePolicy([root, *parse_rules(Config.ROUTE_RULES)])
+    logger.info("Política de rotas com %d prefixos.", policy.size)
+    return policy
+
+
+def install_route_policy(server: Flask, policy: RoutePolicy,
+                         page_endpoints: Iterable[str], login_url: str) -> None:
+    """
+    Aplica `policy` antes de servir as páginas do Dash.
+
+    :param server: Servidor Flask do app.
+    :param page_endpoints: Endpoints que servem o HTML do Dash (os demais,
+        como `_dash-update-component` e assets, não passam pela política).
+    :param login_url: Página que mostra o login; nunca é redirecionada.
+    """
+    page_endpoints = frozenset(page_endpoints)
+    login_path = normalize_path(login_url)
+
+    @server.before_request
+    def _enforce_route_policy() -> Optional[Response]:
+        if request.endpoint not in page_endpoints:
+            return None
+        path = normalize_path(request.path)
+        if path == login_path:
+            return None
+        rule = policy.match(path)
+        if rule is None or rule.public:
+            return None
+        # Só páginas protegidas olham a sessão (e, se preciso, renovam o token)
+        user = get_current_user() if is_authenticated() else None
+        decision = rule_decision(rule, user)
+        if decision == LOGIN:
+            ROUTE_DENIALS.inc(reason="login")
+            return redirect(login_url)
+        if decision == FORBIDDEN:
+            ROUTE_DENIALS.inc(reason="forbidden")
+            abort(403)
+        return None
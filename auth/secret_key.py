@@ -0,0 +1,133 @@
+"""
+Chave de assinatura das sessões, estável entre workers e reinícios.
+
+Ordem de precedência:
+
+1. `SECRET_KEY`, com chaves antigas em `SECRET_KEY_FALLBACKS` (separadas
+   por vírgula);
+2. `SECRET_KEY_FILE`: a primeira linha é a chave atual e as demais são
+   chaves antigas ainda aceitas. Se o arquivo não existir, é criado (0600)
+   com uma chave aleatória; entre workers que sobem juntos, o primeiro a
+   criar vence e os outros leem o mesmo arquivo;
+3. nada configurado: chave aleatória do processo. Serve para
+   desenvolvimento; cada reinício (e cada worker, sem `preload_app`)
+   invalida as sessões.
+
+Rotação: `python -m auth.secret_key rotate <arquivo>` põe uma chave nova
+na primeira linha e mantém as anteriores como fallback. Cookies assinados
+com uma chave antiga continuam valendo enquanto ela estiver na lista; ela
+pode sair depois de `SESSION_DEFAULT_TTL` (ou da validade do refresh
+token). Os workers leem o arquivo ao subir, então a rotação vale a partir
+do próximo reload.
+"""
+import argparse
+import logging
+import os
+import secrets
+from typing import List, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _generate() -> str:
+    return secrets.token_hex(32)
+
+
+def _read_keys(path: str) -> List[str]:
+    with open(path, encoding="utf-8") as fh:
+        return [line.strip() for line in fh if line.strip()]
+
+
+def _write_tmp(path: str, keys: List[str]) -> str:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as fh:
+        fh.write("\n".join(keys) + "\n")
+    return tmp
+
+
+def _write_keys(path: str, keys: List[str]) -> None:
+    # Temporário + rename: quem lê nunca vê o arquivo pela metade
+    os.replace(_write_tmp(path, keys), path)
+
+
+def _create_key_file(path: str) -> None:
+    """Cria o arquivo com uma chave nova, se ainda não existir."""
+    if os.path.exists(path):
+        return
+    tmp = _write_tmp(path, [_generate()])
+    try:
+        # link() falha se o arquivo já existe: entre workers, o primeiro vence
+        os.link(tmp, path)
+        logger.info("Chave de sessão criada em %s.", path)
+    except FileExistsError:
+        pass
+    finally:
+        os.unlink(tmp)
+
+
+def load_key_file(path: str) -> List[str]:
+    """
+    Lê (ou cria) o arquivo de chaves.
+
+    :param path: Caminho do arquivo, uma chave por linha (atual primeiro).
+    :return: Chaves, da atual para a mais antiga.
+    """
+    _create_key_file(path)
+    keys = _read_keys(path)
+    if not keys:
+        raise RuntimeError(f"Arquivo de chave de sessão vazio: {path}")
+    return keys
+
+
+def load_secret_keys() -> Tuple[str, List[str]]:
+    """
+    Chave atual e chaves antigas aceitas, conforme `Config`.
+
+    :return: (SECRET_KEY, SECRET_KEY_FALLBACKS) no formato do Flask (as
+        fallbacks da mais antiga para a mais nova).
+    """
+    if Config.SECRET_KEY:
+        fallbacks = [k.strip() for k in Config.SECRET_KEY_FALLBACKS.split(",")
+                     if k.strip()]
+        return Config.SECRET_KEY, fallbacks
+    if Config.SECRET_KEY_FILE:
+        current, *older = load_key_file(Config.SECRET_KEY_FILE)
+        return current, older[::-1]
+    logger.warning(
+        "SECRET_KEY/SECRET_KEY_FILE não configurados: usando uma chave "
+        "aleatória; sessões não sobrevivem a reinícios nem valem entre workers."
+    )
+    return _generate(), []
+
+
+def rotate_key_file(path: str, keep: int = 2) -> List[str]:
+    """
+    Põe uma chave nova no topo do arquivo, mantendo `keep` antigas.
+
+    :return: Chaves gravadas, da atual para a mais antiga.
+    """
+    keys = _read_keys(path) if os.path.exists(path) else []
+    keys = [_generate(), *keys[:keep]]
+    _write_keys(path, keys)
+    return keys
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    sub = parser.add_subparsers(dest="command", required=True)
+    rotate = sub.add_parser("rotate", help="gera uma chave nova no arquivo")
+    rotate.add_argument("path", nargs="?", default=Config.SECRET_KEY_FILE)
+    rotate.add_argument("--keep", type=int, default=2,
+                        help="chaves antigas mantidas como fallback")
+    args = parser.parse_args()
+    if not args.path:
+        parser.error("informe o arquivo ou defina SECRET_KEY_FILE")
+    keys = rotate_key_file(args.path, args.keep)
+    print(f"{args.path}: chave nova + {len(keys) - 1} antiga(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+"""
+Tokens de serviço (grant client credentials) para jobs e carga de dados no
+servidor, sem uma ida ao Keycloak por chamada.
+
+`get_service_token(scope, audience)` devolve o access token do client
+(`KEYCLOAK_CLIENT_ID`/`KEYCLOAK_CLIENT_SECRET_KEY`) em cache por
+scope/audience:
+
+- o token é usado até `Config.SERVICE_TOKEN_SKEW` s antes de expirar;
+- passada a fração `Config.SERVICE_TOKEN_REFRESH_AHEAD` da vida dele, quem
+  pede recebe o token atual e uma thread busca o próximo; só sem token
+  válido a chamada espera pelo Keycloak;
+- chamadas concorrentes pela mesma chave resultam numa única busca
+  (single-flight). Se a renovação em segundo plano falhar, o token atual
+  segue valendo e a nova tentativa espera `retry_delay` s.
+
+Com `SERVICE_TOKEN_STORE=file` ou `sqlite`, os tokens ficam também num
+arquivo local (permissão 0600) compartilhado pelos workers da máquina, e a
+busca é serializada entre processos com `flock`: quem chega depois do
+lock reaproveita o token que outro worker acabou de buscar.
+"""
+import abc
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from config import Config
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SERVICE_TOKEN_LOOKUPS = REGISTRY.counter(
+    "service_token_lookups_total",
+    "Pedidos de token de serviço: em cache, em cache com renovação "
+    "antecipada ou esperando o Keycloak.",
+    ("result",),
+)
+SERVICE_TOKEN_FETCHES = REGISTRY.counter(
+    "service_token_fetches_total",
+    "Buscas de token de serviço no Keycloak por resultado.",
+    ("outcome",),
+)
+
+# {"access_token": ..., "expires_at": epoch, "refresh_at": epoch}
+TokenEntry = Dict[str, Any]
+
+
+class ServiceTokenError(Exception):
+    """Timeout esperando a busca de token de outra thread ou worker."""
+
+
+@contextlib.contextmanager
+def _flock(path: str, timeout: float) -> Iterator[None]:
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise ServiceTokenError(
+                        "Timeout aguardando token de serviço em outro worker")
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+class TokenStore(abc.ABC):
+    """Interface dos backends compartilhados entre processos."""
+
+    @abc.abstractmethod
+    def load(self, key: str) -> Optional[TokenEntry]:
+        """Token guardado para a chave, se ainda não expirou."""
+
+    @abc.abstractmethod
+    def save(self, key: str, entry: TokenEntry) -> None:
+        """Grava o token da chave, visível para os outros processos."""
+
+    @abc.abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove o token da chave, se existir."""
+
+    @abc.abstractmethod
+    def lock(self, key: str, timeout: float):
+        """Exclusão entre processos durante a busca da chave."""
+
+
+class FileTokenStore(TokenStore):
+    """Um arquivo JSON por chave (escrita atômica) num diretório 0700."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def _path(self, key: str, suffix: str = ".json") -> str:
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def load(self, key: str) -> Optional[TokenEntry]:
+        try:
+            with open(self._path(key)) as fh:
+                entry = json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return None
+        return entry if entry.get("expires_at", 0) > time.time() else None
+
+    def save(self, key: str, entry: TokenEntry) -> None:
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as fh:
+            json.dump(entry, fh)
+        os.replace(tmp, path)
+
+    def delete(self, key: str) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._path(key))
+
+    def lock(self, key: str, timeout: float):
+        return _flock(self._path(key, ".lock"), timeout)
+
+
+class SQLiteTokenStore(TokenStore):
+    """
+    Tokens num SQLite (WAL) com permissão 0600; lock em `<path>.lock`.
+
+    Os arquivos `-wal`/`-shm` seguem a umask do processo: deixe o banco num
+    diretório só do usuário do app (criado aqui com 0700 se não existir).
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        # Cria o arquivo já restrito: guarda tokens
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+        # Workers abrindo o banco novo ao mesmo tempo: a troca para WAL não
+        # respeita o busy timeout e falharia com "database is locked". O
+        # modo WAL fica gravado no arquivo, então basta fazer isto uma vez.
+        with _flock(f"{path}.lock", 30.0):
+            conn = self._conn()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS service_tokens ("
+                " key TEXT PRIMARY KEY,"
+                " entry TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def load(self, key: str) -> Optional[TokenEntry]:
+        row = self._conn().execute(
+            "SELECT entry FROM service_tokens WHERE key = ? AND expires_at > ?",
+            (key, time.time()),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, key: str, entry: TokenEntry) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM service_tokens WHERE expires_at <= ?", (time.time(),))
+        conn.execute(
+            "INSERT OR REPLACE INTO service_tokens (key, entry, expires_at)"
+            " VALUES (?, ?, ?)",
+            (key, json.dumps(entry), entry["expires_at"]),
+        )
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM service_tokens WHERE key = ?", (key,))
+
+    def lock(self, key: str, timeout: float):
+        return _flock(f"{self.path}.lock", timeout)
+
+
+class _Flight:
+    """Uma busca em andamento; quem chega depois espera `done`."""
+
+    __slots__ = ("done", "entry", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.entry: Optional[TokenEntry] = None
+        self.error: Optional[BaseException] = None
+
+
+class ServiceTokenProvider:
+    """
+    Cache de tokens client credentials por scope/audience.
+
+    :param fetch: Busca no Keycloak: `fetch(scope, audience)` -> bundle
+        com `access_token` e `expires_in`.
+    :param store: Backend compartilhado entre processos (None: só memória).
+    :param namespace: Entra na chave (ex.: o client id), para clients
+        diferentes não dividirem tokens no mesmo store.
+    :param skew: Antecedência (s) com que o token deixa de ser usado.
+    :param refresh_ahead: Fração da vida do token a partir da qual ele é
+        renovado em segundo plano.
+    :param retry_delay: Espera (s) depois de uma renovação antecipada
+        que falhou.
+    :param lock_timeout: Espera máxima (s) pela busca de outro chamador.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str, str], Dict[str, Any]],
+        store: Optional[TokenStore] = None,
+        namespace: str = "",
+        skew: float = 30.0,
+        refresh_ahead: float = 0.75,
+        retry_delay: float = 5.0,
+        lock_timeout: float = 15.0,
+    ) -> None:
+        self.fetch = fetch
+        self.store = store
+        self.namespace = namespace
+        self.skew = skew
+        self.refresh_ahead = refresh_ahead
+        self.retry_delay = retry_delay
+        self.lock_timeout = lock_timeout
+        self._entries: Dict[str, TokenEntry] = {}
+        self._flights: Dict[str, _Flight] = {}
+        self._guard = threading.Lock()
+        self._pid = os.getpid()
+
+    def _key(self, scope: str, audience: str) -> str:
+        raw = f"{self.namespace}\x00{scope}\x00{audience}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    # --- API -------------------------------------------------------------
+
+    def get_token(self, scope: str = "", audience: str = "") -> str:
+        """
+        Access token para `scope`/`audience`, do cache quando possível.
+
+        :raises ServiceTokenError: Timeout esperando outra busca.
+        :raises KeycloakUnavailableError: Sem token válido e Keycloak fora.
+        """
+        key = self._key(scope, audience)
+        entry = self._entries.get(key)
+        now = time.time()
+        if entry is not None and entry["expires_at"] > now:
+            if entry["refresh_at"] <= now:
+                SERVICE_TOKEN_LOOKUPS.inc(result="refresh_ahead")
+                self._refresh_in_background(key, scope, audience)
+            else:
+                SERVICE_TOKEN_LOOKUPS.inc(result="hit")
+            return entry["access_token"]
+        SERVICE_TOKEN_LOOKUPS.inc(result="miss")
+        return self._refresh(key, scope, audience)["access_token"]
+
+    def invalidate(self, scope: str = "", audience: str = "") -> None:
+        """Descarta o token (ex.: a API o recusou com 401)."""
+        key = self._key(scope, audience)
+        with self._guard:
+            self._entries.pop(key, None)
+        if self.store is not None:
+            self.store.delete(key)
+
+    # --- busca -------------------------------------------------------------
+
+    def _start_flight(self, key: str) -> Tuple[_Flight, bool]:
+        """Busca em andamento para a chave e se este chamador a conduz."""
+        with self._guard:
+            if self._pid != os.getpid():
+                # Processo novo (fork): buscas do pai não terminam aqui
+                self._pid = os.getpid()
+                self._flights.clear()
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            return flight, True
+
+    def _run_flight(self, flight: _Flight, key: str, scope: str,
+                    audience: str) -> TokenEntry:
+        try:
+            lock = self.store.lock(key, self.lock_timeout) if self.store \
+                else contextlib.nullcontext()
+            with lock:
+                # Outro worker pode ter buscado enquanto esperávamos o lock
+                entry = self.store.load(key) if self.store else None
+                if entry is None or entry["refresh_at"] <= time.time():
+                    entry = self._fetch(scope, audience)
+                    if self.store is not None:
+                        self.store.save(key, entry)
+            with self._guard:
+                self._entries[key] = entry
+            flight.entry = entry
+            return entry
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._guard:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+
+    def _fetch(self, scope: str, audience: str) -> TokenEntry:
+        started = time.time()
+        try:
+            bundle = self.fetch(scope, audience)
+        except Exception:
+            SERVICE_TOKEN_FETCHES.inc(outcome="failure")
+            raise
+        SERVICE_TOKEN_FETCHES.inc(outcome="success")
+        lifetime = float(bundle.get("expires_in", 0))
+        expires_at = started + max(0.0, lifetime - self.skew)
+        return {
+            "access_token": bundle["access_token"],
+            "expires_at": expires_at,
+            "refresh_at": min(started + lifetime * self.refresh_ahead, expires_at),
+        }
+
+    def _refresh(self, key: str, scope: str, audience: str) -> TokenEntry:
+        flight, leader = self._start_flight(key)
+        if leader:
+            return self._run_flight(flight, key, scope, audience)
+        if not flight.done.wait(self.lock_timeout):
+            raise ServiceTokenError("Timeout aguardando token de serviço")
+        if flight.error is not None:
+            raise flight.error
+        return flight.entry
+
+    def _refresh_in_background(self, key: str, scope: str, audience: str) -> None:
+        flight, leader = self._start_flight(key)
+        if not leader:
+            return
+
+        def run() -> None:
+            try:
+                self._run_flight(flight, key, scope, audience)
+            except Exception as exc:
+                logger.warning("Falha ao renovar token de serviço: %s", exc)
+                with self._guard:
+                    entry = self._entries.get(key)
+                    if entry is not None:
+                        # Segue com o token atual; tenta de novo mais tarde
+                        self._entries[key] = {
+                            **entry, "refresh_at": time.time() + self.retry_delay,
+                        }
+
+        threading.Thread(target=run, name="service-token-refresh", daemon=True).start()
+
+
+def fetch_client_credentials(scope: str = "", audience: str = "") -> Dict[str, Any]:
+    """Busca um token client credentials no Keycloak, pelo gateway."""
+    from auth.transport import get_gateway, get_keycloak_client
+
+    extra = {"audience": audience} if audience else {}
+    return get_gateway().call(
+        "client_credentials", get_keycloak_client().token,
+        grant_type="client_credentials", scope=scope, idempotent=True, **extra,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_service_token_provider() -> ServiceTokenProvider:
+    """Provider do processo, configurado a partir de `Config`."""
+    backend = Config.SERVICE_TOKEN_STORE
+    if backend == "sqlite":
+        store: Optional[TokenStore] = SQLiteTokenStore(Config.SERVICE_TOKEN_STORE_PATH)
+    elif backend == "file":
+        store = FileTokenStore(Config.SERVICE_TOKEN_STORE_PATH)
+    elif backend == "memory":
+        store = None
+    else:
+        raise ValueError(f"SERVICE_TOKEN_STORE desconhecido: {backend!r}")
+    return ServiceTokenProvider(
+        fetch_client_credentials,
+        store=store,
+        namespace=f"{Config.KEYCLOAK_SERVER_URL}|{Config.KEYCLOAK_REALM_NAME}"
+                  f"|{Config.KEYCLOAK_CLIENT_ID}",
+        skew=Config.SERVICE_TOKEN_SKEW,
+        refresh_ahead=Config.SERVICE_TOKEN_REFRESH_AHEAD,
+    )
+
+
+def get_service_token(scope: str = "", audience: str = "") -> str:
+    """Access token de serviço do client configurado (ver o módulo)."""
+    return get_service_token_provider().get_token(scope, audience)
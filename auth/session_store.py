@@ -0,0 +1,300 @@
+"""
+Sessões Flask guardadas no servidor.
+
+O cookie passa a carregar apenas um id de sessão opaco (assinado); tokens,
+claims e metadados ficam em um backend plugável:
+
+- `MemorySessionStore`: LRU em processo, com expiração por TTL.
+- `SQLiteSessionStore`: arquivo SQLite compartilhável entre workers.
+"""
+import abc
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from flask import Flask, Request, Response
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(abc.ABC):
+    """Interface mínima de um backend de sessão."""
+
+    @abc.abstractmethod
+    def get(self, sid: str) -> Optional[str]:
+        """Retorna o payload serializado da sessão ou None."""
+
+    @abc.abstractmethod
+    def set(self, sid: str, payload: str, expires_at: float) -> None:
+        """Grava o payload até o timestamp `expires_at` (epoch, segundos)."""
+
+    @abc.abstractmethod
+    def delete(self, sid: str) -> None:
+        """Remove a sessão, se existir."""
+
+    @abc.abstractmethod
+    def __len__(self) -> int:
+        """Quantidade de sessões ainda válidas."""
+
+
+class MemorySessionStore(SessionStore):
+    """LRU em processo; entradas expiram em `expires_at` ou por pressão."""
+
+    def __init__(self, max_entries: int = 10_000) -> None:
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is None:
+                return None
+            payload, expires_at = entry
+            if expires_at <= time.time():
+                del self._data[sid]
+                return None
+            self._data.move_to_end(sid)
+            return payload
+
+    def set(self, sid: str, payload: str, expires_at: float) -> None:
+        with self._lock:
+            self._data[sid] = (payload, expires_at)
+            self._data.move_to_end(sid)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, sid: str) -> None:
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def purge_expired(self) -> int:
+        """Remove entradas expiradas; retorna quantas saíram."""
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, (_, exp) in self._data.items() if exp <= now]
+            for sid in expired:
+                del self._data[sid]
+        return len(expired)
+
+    def __len__(self) -> int:
+        # Sessões vencidas só saem no get ou por pressão da LRU: sem a
+        # limpeza, o gauge sessions_active contaria sessões já encerradas
+        self.purge_expired()
+        return len(self._data)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessões em um arquivo SQLite (modo WAL), compartilhado entre processos.
+
+    Cada thread mantém sua própria conexão.
+    """
+
+    # Limpa expirados a cada N gravações para não pesar no caminho quente
+    _PURGE_EVERY = 500
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " sid TEXT PRIMARY KEY,"
+                " payload TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS sessions_expires_at"
+                " ON sessions (expires_at)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # Com preload_app, a conexão aberta no master não segue no fork
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, sid: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT payload FROM sessions WHERE sid = ? AND expires_at > ?",
+            (sid, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, sid: str, payload: str, expires_at: float) -> None:
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO sessions (sid, payload, expires_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(sid) DO UPDATE SET"
+            " payload = excluded.payload, expires_at = excluded.expires_at",
+            (sid, payload, expires_at),
+        )
+        self._writes += 1
+        if self._writes % self._PURGE_EVERY == 0:
+            self.purge_expired()
+
+    def delete(self, sid: str) -> None:
+        self._conn().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def purge_expired(self) -> int:
+        """Remove sessões expiradas; retorna quantas saíram."""
+        cursor = self._conn().execute(
+            "DELETE FROM sessions WHERE expires_at <= ?", (time.time(),)
+        )
+        return cursor.rowcount
+
+    def __len__(self) -> int:
+        row = self._conn().execute(
+            "SELECT COUNT(*) FROM sessions WHERE expires_at > ?", (time.time(),)
+        ).fetchone()
+        return row[0]
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Sessão cujo conteúdo vive no `SessionStore`; o cookie tem só o id."""
+
+    def __init__(self, initial: Optional[Dict[str, Any]] = None,
+                 sid: Optional[str] = None, new: bool = False) -> None:
+        def on_update(self: "ServerSideSession") -> None:
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid or secrets.token_urlsafe(32)
+        self.new = new
+        self.modified = False
+        self.previous_sid: Optional[str] = None
+
+    def regenerate(self) -> None:
+        """
+        Troca o id mantendo o conteúdo (no login): um id plantado no
+        navegador antes da autenticação não passa a valer a sessão logada.
+        O registro do id anterior é apagado no `save_session`.
+        """
+        if not self.new and self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.new = True
+        self.modified = True
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """`SessionInterface` do Flask sobre um `SessionStore`."""
+
+    salt = "kc-session-id"
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store: SessionStore, default_ttl: int = 1800) -> None:
+        self.store = store
+        self.default_ttl = default_ttl
+
+    def _signer(self, app: Flask) -> Signer:
+        keys = list(app.config.get("SECRET_KEY_FALLBACKS") or [])
+        keys.append(app.secret_key)  # chave atual no topo
+        return Signer(keys, salt=self.salt, key_derivation="hmac")
+
+    def _expires_at(self, session: ServerSideSession) -> float:
+        # A sessão vale enquanto o refresh_token valer
+        refresh_expires_at = (session.get("kc") or {}).get("refresh_expires_at")
+        if refresh_expires_at:
+            return float(refresh_expires_at)
+        return time.time() + self.default_ttl
+
+    def open_session(self, app: Flask, request: Request) -> ServerSideSession:
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            payload = self.store.get(sid) if sid else None
+            if payload is not None:
+                return ServerSideSession(self.serializer.loads(payload), sid=sid)
+        # Nunca reaproveita um id vindo do cliente sem dados no servidor
+        return ServerSideSession(new=True)
+
+    def save_session(self, app: Flask, session: SessionMixin,
+                     response: Response) -> None:
+        assert isinstance(session, ServerSideSession)
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if session.previous_sid is not None:
+            self.store.delete(session.previous_sid)
+
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(
+                    name, domain=domain, path=path, secure=secure,
+                    samesite=samesite, httponly=httponly,
+                )
+                response.vary.add("Cookie")
+            return
+
+        if session.modified:
+            self.store.set(
+                session.sid,
+                self.serializer.dumps(dict(session)),
+                self._expires_at(session),
+            )
+
+        if session.new or self.should_set_cookie(app, session):
+            response.set_cookie(
+                name,
+                self._signer(app).sign(session.sid).decode(),
+                expires=self.get_expiration_time(app, session),
+                httponly=httponly,
+                domain=domain,
+                path=path,
+                secure=secure,
+                samesite=samesite,
+            )
+            response.vary.add("Cookie")
+
+
+def build_session_store(backend: str) -> Optional[SessionStore]:
+    """Cria o backend de sessão configurado ("cookie" devolve None)."""
+    backend = (backend or "cookie").lower()
+    if backend == "cookie":
+        return None
+    if backend == "memory":
+        return MemorySessionStore(max_entries=Config.SESSION_MAX_ENTRIES)
+    if backend == "sqlite":
+        return SQLiteSessionStore(Config.SESSION_SQLITE_PATH)
+    raise ValueError(f"SESSION_BACKEND desconhecido: {backend!r}")
+
+
+def install_session_interface(app: Flask) -> Optional[SessionStore]:
+    """Troca a sessão por cookie do Flask pelo backend de `Config`."""
+    store = build_session_store(Config.SESSION_BACKEND)
+    if store is not None:
+        app.session_interface = ServerSideSessionInterface(
+            store, default_ttl=Config.SESSION_DEFAULT_TTL,
+        )
+        logger.info("Sessões no servidor (backend=%s).", Config.SESSION_BACKEND)
+    return store
@@ -0,0 +1,227 @@
+"""
+Limite de tentativas de login antes de chegar ao Keycloak.
+
+Cada tentativa consome uma ficha de dois token buckets: um por IP do
+cliente e outro por usuário. Se qualquer um estiver vazio, a tentativa é
+recusada localmente, sem chamada ao Keycloak, com o tempo até a próxima
+ficha. O consumo é atômico entre os dois buckets: uma tentativa recusada
+por um deles não gasta ficha do outro.
+
+O estado fica em memória (por processo) ou, com `LOGIN_THROTTLE_BACKEND=
+sqlite`, num arquivo SQLite compartilhado pelos workers da máquina.
+"""
+import abc
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# (chave, capacidade, fichas por segundo)
+Bucket = Tuple[str, float, float]
+
+
+def _refill(tokens: float, updated_at: float, capacity: float, rate: float,
+            now: float) -> float:
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+
+def _wait_time(buckets: List[Bucket], levels: List[float]) -> float:
+    """Segundos até todos os buckets terem ao menos uma ficha."""
+    return max(
+        (1.0 - tokens) / rate if rate > 0 else math.inf
+        for (_, _, rate), tokens in zip(buckets, levels)
+    )
+
+
+class BucketStore(abc.ABC):
+    """Interface dos backends de token bucket."""
+
+    @abc.abstractmethod
+    def take(self, buckets: List[Bucket]) -> float:
+        """
+        Consome uma ficha de cada bucket, só se todos tiverem saldo.
+
+        :return: 0 se consumiu; senão, segundos até poder tentar de novo.
+        """
+
+
+class MemoryBucketStore(BucketStore):
+    """Buckets em memória, descartando os menos recentes acima de `max_entries`."""
+
+    def __init__(self, max_entries: int = 100_000) -> None:
+        self.max_entries = max_entries
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, buckets: List[Bucket]) -> float:
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key, capacity, rate in buckets:
+                tokens, updated_at = self._buckets.get(key, (capacity, now))
+                levels.append(_refill(tokens, updated_at, capacity, rate, now))
+
+            allowed = all(tokens >= 1.0 for tokens in levels)
+            for (key, _, _), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens - 1.0 if allowed else tokens, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return 0.0 if allowed else _wait_time(buckets, levels)
+
+
+class SQLiteBucketStore(BucketStore):
+    """
+    Buckets num SQLite compartilhado entre processos.
+
+    Cada `take` roda numa transação `BEGIN IMMEDIATE`, então leitura,
+    recarga e consumo são atômicos entre workers.
+    """
+
+    _PURGE_EVERY = 1000
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS login_buckets ("
+            " key TEXT PRIMARY KEY,"
+            " tokens REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, buckets: List[Bucket]) -> float:
+        # Relógio de parede: é o único comparável entre processos
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            levels = []
+            for key, capacity, rate in buckets:
+                row = conn.execute(
+                    "SELECT tokens, updated_at FROM login_buckets WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                tokens, updated_at = row if row else (capacity, now)
+                levels.append(_refill(tokens, updated_at, capacity, rate, now))
+
+            allowed = all(tokens >= 1.0 for tokens in levels)
+            conn.executemany(
+                "INSERT OR REPLACE INTO login_buckets (key, tokens, updated_at)"
+                " VALUES (?, ?, ?)",
+                [(key, tokens - 1.0 if allowed else tokens, now)
+                 for (key, _, _), tokens in zip(buckets, levels)],
+            )
+            self._writes += 1
+            if self._writes % self._PURGE_EVERY == 0:
+                self._purge(conn, buckets, now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return 0.0 if allowed else _wait_time(buckets, levels)
+
+    @staticmethod
+    def _purge(conn: sqlite3.Connection, buckets: List[Bucket],
+               now: float) -> None:
+        # Bucket parado há tempo suficiente para encher já equivale a não existir
+        full_after = max(capacity / rate for _, capacity, rate in buckets if rate > 0)
+        conn.execute("DELETE FROM login_buckets WHERE updated_at < ?",
+                     (now - full_after,))
+
+
+class LoginThrottle:
+    """
+    Token buckets por IP e por usuário para tentativas de login.
+
+    :param store: Backend dos buckets.
+    :param ip_burst: Tentativas seguidas permitidas por IP.
+    :param ip_per_minute: Reposição de tentativas por IP, por minuto.
+    :param user_burst: Tentativas seguidas permitidas por usuário.
+    :param user_per_minute: Reposição de tentativas por usuário, por minuto.
+    """
+
+    def __init__(
+        self,
+        store: BucketStore,
+        ip_burst: float = 20,
+        ip_per_minute: float = 20,
+        user_burst: float = 5,
+        user_per_minute: float = 5,
+    ) -> None:
+        self.store = store
+        self.ip_limit = (float(ip_burst), ip_per_minute / 60.0)
+        self.user_limit = (float(user_burst), user_per_minute / 60.0)
+
+    def check(self, client_ip: Optional[str], username: str) -> float:
+        """
+        Registra uma tentativa de login.
+
+        :param client_ip: IP do cliente (None se desconhecido).
+        :param username: Usuário digitado.
+        :return: 0 se a tentativa pode seguir para o Keycloak; senão,
+            segundos até a próxima tentativa ser aceita.
+        """
+        buckets = [
+            (f"user:{username.strip().lower()}", *self.user_limit),
+            (f"ip:{client_ip or '-'}", *self.ip_limit),
+        ]
+        retry_after = self.store.take(buckets)
+        if retry_after:
+            logger.warning(
+                "Login limitado (ip=%s, usuário=%s); tentar em %.0fs.",
+                client_ip, username, retry_after,
+            )
+        return retry_after
+
+
+def throttled_message(retry_after: float) -> str:
+    """Mensagem de login recusado pelo limite de tentativas."""
+    return (
+        "Muitas tentativas de login. "
+        f"Tente novamente em {max(1, math.ceil(retry_after))} s."
+    )
+
+
+@lru_cache(maxsize=1)
+def get_login_throttle() -> Optional[LoginThrottle]:
+    """Limitador configurado por `Config`; None com o backend "off"."""
+    backend = Config.LOGIN_THROTTLE_BACKEND
+    if backend == "off":
+        return None
+    if backend == "sqlite":
+        store: BucketStore = SQLiteBucketStore(Config.LOGIN_THROTTLE_SQLITE_PATH)
+    elif backend == "memory":
+        store = MemoryBucketStore()
+    else:
+        raise ValueError(f"LOGIN_THROTTLE_BACKEND desconhecido: {backend!r}")
+    return LoginThrottle(
+        store,
+        ip_burst=Config.LOGIN_IP_BURST,
+        ip_per_minute=Config.LOGIN_IP_PER_MINUTE,
+        user_burst=Config.LOGIN_USER_BURST,
+        user_per_minute=Config.LOGIN_USER_PER_MINUTE,
+    )
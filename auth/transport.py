@@ -0,0 +1,466 @@
+"""
+Transporte HTTP para o Keycloak: pool de conexões, timeouts, retries,
+bulkhead e circuit breaker, todos configurados por `Config`.
+
+Toda chamada ao Keycloak deve passar por `get_gateway().call(...)` (ou
+`acall` nas corrotinas), que:
+
+- limita as requisições simultâneas ao Keycloak (bulkhead), com fila
+  única por ordem de chegada para threads e corrotinas; a vaga é devolvida
+  antes da espera entre tentativas;
+- falha rápido com `KeycloakUnavailableError` enquanto o circuito está
+  aberto;
+- repete com backoff exponencial e jitter as falhas transitórias. Operações
+  não idempotentes (password grant, refresh) só são repetidas quando a
+  conexão nem chegou a ser aberta.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional, TypeVar
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+from config import Config
+from metrics import REGISTRY
+from profiling import phase
+
+if TYPE_CHECKING:
+    from keycloak import KeycloakOpenID
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+KEYCLOAK_SECONDS = REGISTRY.histogram(
+    "keycloak_request_duration_seconds",
+    "Duração de cada tentativa de chamada ao Keycloak.",
+    ("operation", "outcome"),
+)
+KEYCLOAK_REJECTED = REGISTRY.counter(
+    "keycloak_rejected_total",
+    "Chamadas ao Keycloak recusadas localmente (bulkhead ou circuito aberto).",
+    ("operation", "reason"),
+)
+
+
+class KeycloakUnavailableError(Exception):
+    """Keycloak indisponível: circuito aberto ou bulkhead lotado."""
+
+
+def _causes(exc: BaseException):
+    while exc is not None:
+        yield exc
+        exc = exc.__cause__ or exc.__context__
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Falha de rede, timeout ou 5xx (e não uma recusa do Keycloak)."""
+    # Import tardio: python-keycloak e httpx só entram no primeiro uso
+    import httpx
+    from keycloak.exceptions import KeycloakError
+
+    for cause in _causes(exc):
+        if isinstance(cause, (requests.ConnectionError, requests.Timeout,
+                              httpx.TransportError)):
+            return True
+        if isinstance(cause, KeycloakError):
+            code = cause.response_code
+            if code is not None:
+                return code >= 500
+    return False
+
+
+def _never_sent(exc: BaseException) -> bool:
+    """A requisição falhou antes de a conexão ser aberta."""
+    import httpx
+
+    for cause in _causes(exc):
+        if isinstance(cause, (requests.exceptions.ConnectTimeout,
+                              httpx.ConnectError, httpx.ConnectTimeout)):
+            return True
+        if isinstance(cause, requests.ConnectionError) and cause.args:
+            # requests embrulha o MaxRetryError do urllib3
+            reason = getattr(cause.args[0], "reason", cause.args[0])
+            if isinstance(reason, (NewConnectionError, ConnectTimeoutError)):
+                return True
+    return False
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker simples (fechado, aberto, meio-aberto).
+
+    :param failure_threshold: Falhas transitórias seguidas que abrem o circuito.
+    :param reset_timeout: Segundos aberto antes de deixar uma tentativa passar.
+    """
+
+    def __init__(self, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Indica se uma chamada pode seguir para o Keycloak."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probing:
+                # Uma única chamada de teste por vez
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def abandon(self) -> None:
+        """
+        A chamada liberada por `allow` foi interrompida sem resultado
+        (cancelada, timeout do worker): não conta como sucesso nem falha,
+        mas devolve a vaga de teste do meio-aberto.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if (self._opened_at is not None
+                    or self._failures >= self.failure_threshold):
+                if self._opened_at is None:
+                    logger.warning("Circuito do Keycloak aberto após %d falhas.",
+                                   self._failures)
+                self._opened_at = time.monotonic()
+
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+        self.granted = False
+
+    def wake(self) -> None:
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class Bulkhead:
+    """
+    Vagas de chamadas simultâneas, em ordem de chegada, para threads e
+    corrotinas: quem libera passa a vaga direto para o primeiro da fila.
+    Com um semáforo comum, corrotinas tentando sem bloquear perdiam
+    sempre para as threads já bloqueadas nele.
+
+    :param slots: Quantidade de vagas.
+    """
+
+    def __init__(self, slots: int) -> None:
+        self.slots = slots
+        self.in_use = 0
+        self._waiters: "deque[_Waiter]" = deque()
+        self._lock = threading.Lock()
+
+    def _enter(self, waiter: _Waiter) -> bool:
+        """Pega uma vaga livre ou entra na fila (com o lock)."""
+        with self._lock:
+            if self.in_use < self.slots and not self._waiters:
+                self.in_use += 1
+                return True
+            self._waiters.append(waiter)
+            return False
+
+    def _leave(self, waiter: _Waiter) -> bool:
+        """Sai da fila depois do timeout; True se a vaga chegou antes."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def acquire(self, timeout: float) -> bool:
+        waiter = _Waiter()
+        if self._enter(waiter) or waiter.event.wait(timeout):
+            return True
+        return self._leave(waiter)
+
+    async def aacquire(self, timeout: float) -> bool:
+        waiter = _Waiter(asyncio.get_running_loop())
+        if self._enter(waiter):
+            return True
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return self._leave(waiter)
+        except BaseException:
+            # Cancelada: a vaga que chegou junto volta para a fila
+            if self._leave(waiter):
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                try:
+                    waiter.wake()
+                    return
+                except RuntimeError:  # event loop já fechado
+                    continue
+            self.in_use -= 1
+
+
+class KeycloakGateway:
+    """
+    Executa chamadas ao Keycloak com bulkhead, retries e circuit breaker.
+
+    :param max_in_flight: Máximo de chamadas simultâneas ao Keycloak.
+    :param bulkhead_timeout: Espera máxima (s) por uma vaga no bulkhead.
+    :param retries: Tentativas extras para falhas transitórias.
+    :param backoff: Base (s) do backoff exponencial com jitter.
+    """
+
+    def __init__(
+        self,
+        breaker: CircuitBreaker,
+        max_in_flight: int = 20,
+        bulkhead_timeout: float = 2.0,
+        retries: int = 2,
+        backoff: float = 0.2,
+    ) -> None:
+        self.breaker = breaker
+        self.bulkhead_timeout = bulkhead_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.bulkhead = Bulkhead(max_in_flight)
+
+    def _delay(self, attempt: int) -> float:
+        # "Full jitter": espalha as novas tentativas de vários clientes
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    def _should_retry(self, exc: BaseException, attempt: int,
+                      idempotent: bool) -> bool:
+        if attempt >= self.retries or not is_transient(exc):
+            return False
+        return idempotent or _never_sent(exc)
+
+    def _check_breaker(self, op: str) -> bool:
+        """:return: Se a chamada é a de teste do circuito meio-aberto."""
+        probe = self.breaker.state == "half-open"
+        if not self.breaker.allow():
+            KEYCLOAK_REJECTED.inc(operation=op, reason="circuit_open")
+            raise KeycloakUnavailableError(
+                f"Keycloak indisponível (circuito aberto) em {op}"
+            )
+        return probe
+
+    def _record(self, op: str, started: float,
+                exc: Optional[BaseException]) -> None:
+        if exc is None:
+            outcome = "ok"
+        elif is_transient(exc):
+            outcome = "transient"
+        else:
+            outcome = "error"
+        KEYCLOAK_SECONDS.observe(time.perf_counter() - started,
+                                 operation=op, outcome=outcome)
+        if outcome == "transient":
+            self.breaker.record_failure()
+        else:
+            # Respostas 4xx mostram que o Keycloak está de pé
+            self.breaker.record_success()
+
+    def call(self, op: str, func: Callable[..., T], *args: Any,
+             idempotent: bool = False, **kwargs: Any) -> T:
+        """
+        Chama `func(*args, **kwargs)` sob as políticas do gateway.
+
+        :param op: Nome da operação (para logs e métricas).
+        :param idempotent: Se a operação pode ser repetida com segurança.
+        :raises KeycloakUnavailableError: Circuito aberto ou bulkhead lotado.
+        """
+        with phase("keycloak"):
+            return self._call(op, func, *args, idempotent=idempotent, **kwargs)
+
+    def _call(self, op: str, func: Callable[..., T], *args: Any,
+              idempotent: bool = False, **kwargs: Any) -> T:
+        attempt = 0
+        while True:
+            # A vaga vale por tentativa: o backoff entre elas não a ocupa
+            if not self.bulkhead.acquire(self.bulkhead_timeout):
+                self._reject_bulkhead(op)
+            try:
+                probe = self._check_breaker(op)
+                started = time.perf_counter()
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as exc:
+                    self._record(op, started, exc)
+                    if not self._should_retry(exc, attempt, idempotent):
+                        raise
+                    logger.info("Repetindo %s após falha transitória: %s", op, exc)
+                except BaseException:
+                    # Interrompida (SystemExit do worker, KeyboardInterrupt)
+                    if probe:
+                        self.breaker.abandon()
+                    raise
+                else:
+                    self._record(op, started, None)
+                    return result
+            finally:
+                self.bulkhead.release()
+            time.sleep(self._delay(attempt))
+            attempt += 1
+
+    async def acall(self, op: str, func: Callable[..., Awaitable[T]],
+                    *args: Any, idempotent: bool = False, **kwargs: Any) -> T:
+        """Versão assíncrona de `call` para os métodos `a_*`."""
+        with phase("keycloak"):
+            return await self._acall(op, func, *args, idempotent=idempotent, **kwargs)
+
+    async def _acall(self, op: str, func: Callable[..., Awaitable[T]],
+                     *args: Any, idempotent: bool = False, **kwargs: Any) -> T:
+        attempt = 0
+        while True:
+            if not await self.bulkhead.aacquire(self.bulkhead_timeout):
+                self._reject_bulkhead(op)
+            try:
+                probe = self._check_breaker(op)
+                started = time.perf_counter()
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as exc:
+                    self._record(op, started, exc)
+                    if not self._should_retry(exc, attempt, idempotent):
+                        raise
+                    logger.info("Repetindo %s após falha transitória: %s", op, exc)
+                except BaseException:
+                    # Cancelada (cliente ASGI desconectou)
+                    if probe:
+                        self.breaker.abandon()
+                    raise
+                else:
+                    self._record(op, started, None)
+                    return result
+            finally:
+                self.bulkhead.release()
+            await asyncio.sleep(self._delay(attempt))
+            attempt += 1
+
+    @staticmethod
+    def _reject_bulkhead(op: str) -> None:
+        KEYCLOAK_REJECTED.inc(operation=op, reason="bulkhead")
+        raise KeycloakUnavailableError(
+            f"Muitas chamadas simultâneas ao Keycloak em {op}"
+        )
+
+
+class _TimeoutHTTPAdapter(HTTPAdapter):
+    """Adapter do requests com timeout de conexão e de leitura separados."""
+
+    def __init__(self, connect_timeout: float, read_timeout: float,
+                 **kwargs: Any) -> None:
+        self._timeout = (connect_timeout, read_timeout)
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        kwargs["timeout"] = self._timeout
+        return super().send(request, **kwargs)
+
+
+def build_keycloak_client() -> "KeycloakOpenID":
+    """Cria um cliente Keycloak com o transporte configurado em `Config`."""
+    import httpx
+    from keycloak import KeycloakOpenID
+
+    client = KeycloakOpenID(
+        server_url=Config.KEYCLOAK_SERVER_URL,
+        client_id=Config.KEYCLOAK_CLIENT_ID,
+        realm_name=Config.KEYCLOAK_REALM_NAME,
+        client_secret_key=Config.KEYCLOAK_CLIENT_SECRET_KEY,
+        # Retries ficam no gateway; o padrão do python-keycloak repete POSTs
+        max_retries=0,
+        pool_maxsize=Config.KEYCLOAK_POOL_MAXSIZE,
+    )
+    connection = client.connection
+    # Vale para o httpx (async); no requests o adapter abaixo separa os dois
+    connection.timeout = httpx.Timeout(
+        Config.KEYCLOAK_READ_TIMEOUT, connect=Config.KEYCLOAK_CONNECT_TIMEOUT,
+    )
+    adapter = _TimeoutHTTPAdapter(
+        Config.KEYCLOAK_CONNECT_TIMEOUT,
+        Config.KEYCLOAK_READ_TIMEOUT,
+        pool_connections=1,
+        pool_maxsize=Config.KEYCLOAK_POOL_MAXSIZE,
+        max_retries=0,
+    )
+    for protocol in ("https://", "http://"):
+        connection._s.mount(protocol, adapter)
+    return client
+
+
+@lru_cache(maxsize=1)
+def get_keycloak_client() -> "KeycloakOpenID":
+    """
+    Cliente Keycloak compartilhado pelo processo (chamadas síncronas).
+
+    Criado no primeiro uso, e não no import, para acelerar o boot.
+    """
+    return build_keycloak_client()
+
+
+@lru_cache(maxsize=1)
+def get_gateway() -> KeycloakGateway:
+    """Gateway compartilhado pelo processo."""
+    return KeycloakGateway(
+        CircuitBreaker(
+            failure_threshold=Config.KEYCLOAK_BREAKER_THRESHOLD,
+            reset_timeout=Config.KEYCLOAK_BREAKER_RESET,
+        ),
+        max_in_flight=Config.KEYCLOAK_MAX_IN_FLIGHT,
+        bulkhead_timeout=Config.KEYCLOAK_BULKHEAD_TIMEOUT,
+        retries=Config.KEYCLOAK_RETRIES,
+        backoff=Config.KEYCLOAK_RETRY_BACKOFF,
+    )
+
+
+REGISTRY.gauge(
+    "keycloak_circuit_open",
+    "1 enquanto o circuito do Keycloak está aberto.",
+    lambda: float(get_gateway().breaker.state == "open"),
+)
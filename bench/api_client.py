@@ -0,0 +1,381 @@
+"""
+Cliente das APIs protegidas (`auth.api_client`) contra uma API falsa que
+só aceita access tokens válidos do Keycloak falso.
+
+- "keepalive": chamadas em sequência com um `requests.get` por chamada
+  (uma conexão nova cada) e com o cliente (pool por host); conta as
+  conexões abertas na API;
+- "batch": `--batch` chamadas com `--api-latency` s de latência, uma
+  depois da outra e com `batch`;
+- "proactive_refresh": token da sessão dentro da margem de renovação; a
+  chamada renova antes e a API não vê 401;
+- "unauthorized_batch": a API passa a recusar o token atual; o lote
+  recebe 401, renova uma vez e repete;
+- "unauthorized_concurrent": o mesmo com várias requisições simultâneas
+  da mesma sessão; o single-flight faz um refresh só;
+- "empty_allowlist": cliente sem `base_url` nem `allowed_hosts`; a
+  chamada é recusada antes de sair e a API não recebe nada;
+- "cleartext": o host da API autorizado só em https (`base_url` https ou
+  entrada "host:porta" em `allowed_hosts`); a chamada em http:// é
+  recusada e a API não recebe nada.
+
+Sai com código 1 se o pool não reaproveitar conexões, se o lote não for
+ao menos 3x mais rápido que a sequência ou se algum cenário de token
+chamar o Keycloak mais de uma vez ou devolver erro, ou se o cliente sem
+hosts autorizados mandar o token para algum lugar, ou se o token sair
+em http para um host autorizado só em https.
+
+Uso:
+    python -m bench.api_client [--iterations 200] [--batch 8]
+        [--api-latency 0.05] [--concurrency 8]
+"""
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import jwt
+import requests
+
+from bench.fake_oidc import FakeOIDCServer
+from bench.suite import Suite, Worker, _login
+
+
+class FakeApiServer:
+    """
+    API protegida falsa: `GET /items/<n>` com "Authorization: Bearer" de um
+    access token do Keycloak falso (assinatura e `exp` conferidos).
+
+    :param oidc: Keycloak falso que emite os tokens.
+    :param latency: Atraso artificial (s) em cada resposta.
+
+    `rejected` recusa tokens específicos com 401 (chave girada, token
+    revogado); `calls` conta respostas e conexões abertas.
+    """
+
+    def __init__(self, oidc: FakeOIDCServer, latency: float = 0.0) -> None:
+        self.oidc = oidc
+        self.latency = latency
+        self.rejected: Set[str] = set()
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def __enter__(self) -> "FakeApiServer":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.calls[name] += 1
+
+    def _handler(self) -> type:
+        # O servidor de desenvolvimento do werkzeug fecha a conexão a cada
+        # resposta; o http.server mantém keep-alive em HTTP/1.1
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Cabeçalhos e corpo saem em escritas separadas: com Nagle, o
+            # keep-alive esperaria o ACK atrasado do cliente (~40 ms)
+            disable_nagle_algorithm = True
+
+            def setup(self) -> None:
+                super().setup()
+                api._count("connections")
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def _reply(self, status: int, body: bytes = b"") -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self) -> None:
+                header = self.headers.get("Authorization", "")
+                token = header[7:] if header.startswith("Bearer ") else ""
+                try:
+                    claims = jwt.decode(token, api.oidc._private_key.public_key(),
+                                        algorithms=["RS256"], audience="account")
+                except jwt.InvalidTokenError:
+                    claims = None
+                if claims is None or token in api.rejected:
+                    api._count("unauthorized")
+                    return self._reply(401)
+                if api.latency:
+                    time.sleep(api.latency)
+                api._count("ok")
+                self._reply(200, json.dumps({
+                    "path": self.path, "user": claims.get("preferred_username"),
+                }).encode())
+
+        return Handler
+
+
+def _check(failures: List[str], condition: bool, message: str) -> None:
+    if not condition:
+        failures.append(message)
+
+
+def _in_session(suite: Suite, worker: Worker, run: Callable[[], Any]) -> Any:
+    """Roda `run` no contexto de uma requisição com a sessão do worker."""
+    server = suite.dash_app.server
+    name = server.config["SESSION_COOKIE_NAME"]
+    headers = {"Cookie": f"{name}={worker.session_cookie()}"}
+    with server.test_request_context("/", headers=headers) as ctx:
+        result = run()
+        server.session_interface.save_session(server, ctx.session,
+                                              server.response_class())
+    return result
+
+
+def _session_kc(suite: Suite, worker: Worker) -> Dict[str, Any]:
+    from flask import session
+
+    return _in_session(suite, worker, lambda: dict(session["kc"]))
+
+
+def _timed(run: Callable[[], Any]) -> float:
+    started = time.perf_counter()
+    run()
+    return time.perf_counter() - started
+
+
+def keepalive(suite: Suite, worker: Worker, api: FakeApiServer,
+              args: argparse.Namespace, failures: List[str]) -> Dict[str, Any]:
+    from auth.api_client import get_api_client
+
+    client = get_api_client()
+    token = _session_kc(suite, worker)["access_token"]
+    url = f"{api.url}items/1"
+
+    before = api.calls["connections"]
+    naive = [_timed(lambda: requests.get(
+        url, headers={"Authorization": f"Bearer {token}"}, timeout=5).raise_for_status())
+        for _ in range(args.iterations)]
+    naive_connections = api.calls["connections"] - before
+
+    def pooled_call() -> float:
+        return _timed(lambda: client.get("/items/1").raise_for_status())
+
+    before = api.calls["connections"]
+    pooled = [_in_session(suite, worker, pooled_call) for _ in range(args.iterations)]
+    pooled_connections = api.calls["connections"] - before
+
+    _check(failures, pooled_connections <= 2,
+           f"cliente abriu {pooled_connections} conexões em {args.iterations} chamadas")
+    return {
+        "per_call_p50_ms": round(statistics.median(naive) * 1000, 3),
+        "pooled_p50_ms": round(statistics.median(pooled) * 1000, 3),
+        "per_call_connections": naive_connections,
+        "pooled_connections": pooled_connections,
+    }
+
+
+def batch(suite: Suite, worker: Worker, api: FakeApiServer,
+          args: argparse.Namespace, failures: List[str]) -> Dict[str, Any]:
+    from auth.api_client import ApiCall, get_api_client
+
+    client = get_api_client()
+    calls = [ApiCall("GET", f"/items/{i}") for i in range(args.batch)]
+    api.latency = args.api_latency
+
+    def sequential() -> None:
+        for call in calls:
+            client.get(call.url).raise_for_status()
+
+    def batched() -> None:
+        responses = client.batch(calls)
+        assert [r.json()["path"] for r in responses] == \
+            [f"/items/{i}" for i in range(args.batch)]
+
+    rounds = 5
+    seq = statistics.median(_in_session(suite, worker, lambda: _timed(sequential))
+                            for _ in range(rounds))
+    par = statistics.median(_in_session(suite, worker, lambda: _timed(batched))
+                            for _ in range(rounds))
+    api.latency = 0.0
+    _check(failures, par * 3 <= seq,
+           f"lote de {args.batch} levou {par:.3f}s contra {seq:.3f}s em sequência")
+    return {"calls": args.batch, "api_latency_s": args.api_latency,
+            "sequential_ms": round(seq * 1000, 1), "batch_ms": round(par * 1000, 1)}
+
+
+def proactive_refresh(suite: Suite, worker: Worker, api: FakeApiServer,
+                      args: argparse.Namespace, failures: List[str]) -> Dict[str, Any]:
+    from flask import session
+
+    from auth.api_client import get_api_client
+
+    client = get_api_client()
+
+    def near_expiry() -> None:
+        session["kc"] = {**session["kc"],
+                         "access_expires_at": int(time.time()) + client.refresh_margin - 1}
+
+    _in_session(suite, worker, near_expiry)
+    old = _session_kc(suite, worker)["access_token"]
+    refreshes = api.oidc.calls["refresh_token"]
+    unauthorized = api.calls["unauthorized"]
+    status = _in_session(suite, worker, lambda: client.get("/items/1").status_code)
+    refreshes = api.oidc.calls["refresh_token"] - refreshes
+    kc = _session_kc(suite, worker)
+    _check(failures, status == 200, f"chamada com token perto de vencer deu {status}")
+    _check(failures, refreshes == 1, f"{refreshes} refresh(es) antes da chamada")
+    _check(failures, api.calls["unauthorized"] == unauthorized,
+           "a API recebeu o token que estava para vencer")
+    _check(failures, kc["access_token"] != old, "token da sessão não foi trocado")
+    return {"status": status, "keycloak_refreshes": refreshes,
+            "api_401": api.calls["unauthorized"] - unauthorized}
+
+
+def unauthorized_batch(suite: Suite, worker: Worker, api: FakeApiServer,
+                       args: argparse.Namespace, failures: List[str]) -> Dict[str, Any]:
+    from auth.api_client import ApiCall, get_api_client
+
+    client = get_api_client()
+    api.rejected.add(_session_kc(suite, worker)["access_token"])
+    refreshes = api.oidc.calls["refresh_token"]
+    unauthorized = api.calls["unauthorized"]
+    statuses = _in_session(suite, worker, lambda: [
+        r.status_code for r in client.batch(
+            [ApiCall("GET", f"/items/{i}") for i in range(args.batch)])])
+    refreshes = api.oidc.calls["refresh_token"] - refreshes
+    _check(failures, statuses == [200] * args.batch, f"lote depois do 401: {statuses}")
+    _check(failures, refreshes == 1, f"{refreshes} refresh(es) para o lote recusado")
+    return {"statuses": dict(Counter(statuses)), "keycloak_refreshes": refreshes,
+            "api_401": api.calls["unauthorized"] - unauthorized}
+
+
+def unauthorized_concurrent(suite: Suite, worker: Worker, api: FakeApiServer,
+                            args: argparse.Namespace,
+                            failures: List[str]) -> Dict[str, Any]:
+    from auth.api_client import get_api_client
+
+    client = get_api_client()
+    api.rejected.add(_session_kc(suite, worker)["access_token"])
+    refreshes = api.oidc.calls["refresh_token"]
+    unauthorized = api.calls["unauthorized"]
+    start = threading.Barrier(args.concurrency)
+
+    def request(_: int) -> Optional[int]:
+        def run() -> int:
+            start.wait()
+            return client.get("/items/1").status_code
+        return _in_session(suite, worker, run)
+
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        statuses = list(pool.map(request, range(args.concurrency)))
+    refreshes = api.oidc.calls["refresh_token"] - refreshes
+    _check(failures, statuses == [200] * args.concurrency,
+           f"requisições simultâneas depois do 401: {statuses}")
+    _check(failures, refreshes == 1,
+           f"{refreshes} refresh(es) para {args.concurrency} requisições recusadas")
+    return {"statuses": dict(Counter(statuses)), "keycloak_refreshes": refreshes,
+            "api_401": api.calls["unauthorized"] - unauthorized}
+
+
+def empty_allowlist(suite: Suite, worker: Worker, api: FakeApiServer,
+                    args: argparse.Namespace, failures: List[str]) -> Dict[str, Any]:
+    from auth.api_client import ApiCall, ApiClient
+
+    client = ApiClient()
+    before = sum(api.calls.values())
+    outcomes = {}
+    for name, run in (("get", lambda: client.get(f"{api.url}items/1")),
+                      ("batch", lambda: client.batch([ApiCall("GET", f"{api.url}items/1")]))):
+        try:
+            _in_session(suite, worker, run)
+            outcomes[name] = "sent"
+        except ValueError:
+            outcomes[name] = "ValueError"
+    client.close()
+    reached = sum(api.calls.values()) - before
+    _check(failures, set(outcomes.values()) == {"ValueError"},
+           f"cliente sem hosts autorizados: {outcomes}")
+    _check(failures, reached == 0, f"a API recebeu {reached} chamada(s) sem allowlist")
+    return {**outcomes, "api_calls": reached}
+
+
+def cleartext(suite: Suite, worker: Worker, api: FakeApiServer,
+              args: argparse.Namespace, failures: List[str]) -> Dict[str, Any]:
+    from auth.api_client import ApiClient
+
+    netloc = api.url.split("://", 1)[1].rstrip("/")
+    clients = {
+        "https_base_url": ApiClient(base_url=f"https://{netloc}/"),
+        "bare_allowed_host": ApiClient(allowed_hosts=[netloc]),
+    }
+    before = sum(api.calls.values())
+    outcomes = {}
+    for name, client in clients.items():
+        try:
+            _in_session(suite, worker, lambda: client.get(f"{api.url}items/1"))
+            outcomes[name] = "sent"
+        except ValueError:
+            outcomes[name] = "ValueError"
+        client.close()
+    reached = sum(api.calls.values()) - before
+    _check(failures, set(outcomes.values()) == {"ValueError"},
+           f"token em http para host autorizado só em https: {outcomes}")
+    _check(failures, reached == 0, f"a API recebeu {reached} chamada(s) em http")
+    return {**outcomes, "api_calls": reached}
+
+
+SCENARIOS = {
+    "keepalive": keepalive,
+    "batch": batch,
+    "proactive_refresh": proactive_refresh,
+    "unauthorized_batch": unauthorized_batch,
+    "unauthorized_concurrent": unauthorized_concurrent,
+    "empty_allowlist": empty_allowlist,
+    "cleartext": cleartext,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--api-latency", type=float, default=0.05,
+                        help="latência (s) da API falsa no cenário de lote")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    failures: List[str] = []
+    report: Dict[str, Any] = {}
+    with FakeOIDCServer() as oidc, FakeApiServer(oidc) as api:
+        os.environ["API_BASE_URL"] = api.url
+        suite = Suite(oidc, "client")
+        worker = Worker(suite)
+        _login(worker)
+        for name, scenario in SCENARIOS.items():
+            report[name] = scenario(suite, worker, api, args, failures)
+    report["failures"] = failures
+    print(json.dumps(report, indent=2))
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Carga de login contra um Keycloak falso com latência artificial,
+comparando os callbacks síncronos e assíncronos (`AUTH_ASYNC`), ambos
+servidos por uvicorn via `asgi.py`.
+
+"wsgi_clients" faz logins assíncronos servidos por WSGI (um event loop
+por chamada) e confere que cada cliente Keycloak criado para um loop foi
+fechado com ele.
+
+Sai com código 1 se algum login for recusado (bulkhead cheio, circuito
+aberto) em vez de concluído ou se algum cliente ficar aberto.
+
+Uso:
+    python -m bench.async_login [--latency 0.2] [--concurrency 1 8 32 64]
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+
+import requests
+
+from bench.fake_oidc import FakeOIDCServer
+
+LOGIN_BODY = {
+    "output": "..login-status.data...url.pathname..."
+              "error-message.children...error-message.style..",
+    "outputs": [
+        {"id": "login-status", "property": "data"},
+        {"id": "url", "property": "pathname"},
+        {"id": "error-message", "property": "children"},
+        {"id": "error-message", "property": "style"},
+    ],
+    "inputs": [{"id": "login-submit", "property": "data", "value": {"attempt": 1}}],
+    "changedPropIds": ["login-submit.data"],
+    "state": [
+        {"id": "username", "property": "value", "value": "bench"},
+        {"id": "password", "property": "value", "value": "secret"},
+    ],
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def app_env(oidc: FakeOIDCServer, **extra: str) -> dict:
+    """Variáveis de ambiente para subir o app apontando para o servidor falso."""
+    env = dict(os.environ)
+    env.update({
+        "root": "/home/",
+        "ROOT_PATH_PREFIX": "/home",
+        "KEYCLOAK_SERVER_URL": oidc.url,
+        "KEYCLOAK_REALM_NAME": oidc.realm,
+        "KEYCLOAK_CLIENT_ID": "bench",
+        "KEYCLOAK_CLIENT_SECRET_KEY": "bench",
+    })
+    env.update(extra)
+    return env
+
+
+def _wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"servidor não respondeu em {url}")
+
+
+def _login(url: str) -> Tuple[float, bool]:
+    """:return: Duração e se o login foi concluído (não recusado)."""
+    start = time.perf_counter()
+    resp = requests.post(url, json=LOGIN_BODY, timeout=60)
+    resp.raise_for_status()
+    # Login recusado só atualiza a mensagem de erro (login-status fica igual)
+    status = resp.json()["response"].get("login-status", {}).get("data") or {}
+    return time.perf_counter() - start, bool(status.get("logged_in"))
+
+
+def _measure(url: str, concurrency: int, per_worker: int) -> dict:
+    total = concurrency * per_worker
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: _login(url), range(total)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(duration for duration, _ in results)
+    return {
+        "concurrency": concurrency,
+        "logins_per_s": round(total / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        "rejected": sum(1 for _, ok in results if not ok),
+    }
+
+
+def run_wsgi_clients(calls: int) -> dict:
+    """Roda num subprocesso com `AUTH_ASYNC`: logins pelo Flask, sem ASGI."""
+    import app
+    from auth import auth_async
+
+    created = []
+    build = auth_async.build_keycloak_client
+
+    def tracked_build():
+        created.append(build())
+        return created[-1]
+
+    auth_async.build_keycloak_client = tracked_build
+    client = app.server.test_client()
+    url = f"{app.prefix}_dash-update-component"
+    logged_in = 0
+    for _ in range(calls):
+        status = client.post(url, json=LOGIN_BODY).get_json()["response"]
+        logged_in += bool(status.get("login-status", {}).get("data", {}).get("logged_in"))
+    return {"calls": calls, "logged_in": logged_in, "clients": len(created),
+            "open_clients": sum(not c.connection.async_s.is_closed for c in created)}
+
+
+def wsgi_clients(oidc: FakeOIDCServer, calls: int = 20) -> dict:
+    env = app_env(oidc, AUTH_ASYNC="true", LOGIN_THROTTLE_BACKEND="off")
+    out = subprocess.run(
+        [sys.executable, "-m", "bench.async_login", "--one-wsgi", str(calls)],
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+        check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--concurrency", type=int, nargs="+",
+                        default=[1, 8, 32, 64])
+    parser.add_argument("--per-worker", type=int, default=4)
+    parser.add_argument("--one-wsgi", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.one_wsgi:
+        print(json.dumps(run_wsgi_clients(args.one_wsgi)))
+        return
+
+    report = {}
+    with FakeOIDCServer(latency=args.latency) as oidc:
+        for mode in ("sync", "async"):
+            port = _free_port()
+            env = app_env(oidc, AUTH_ASYNC="true" if mode == "async" else "false",
+                          LOGIN_THROTTLE_BACKEND="off")
+            proc = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "asgi:application",
+                 "--port", str(port), "--log-level", "warning"],
+                env=env, stdout=subprocess.DEVNULL,
+            )
+            try:
+                base = f"http://127.0.0.1:{port}/home/"
+                _wait_ready(base)
+                url = f"{base}_dash-update-component"
+                report[mode] = [
+                    _measure(url, c, args.per_worker) for c in args.concurrency
+                ]
+            finally:
+                proc.terminate()
+                proc.wait()
+        report["wsgi_clients"] = wsgi_clients(oidc)
+    failures = [f"{mode}: {r['rejected']} de {r['concurrency'] * args.per_worker}"
+                f" logins recusados com concorrência {r['concurrency']}"
+                for mode in ("sync", "async") for r in report[mode] if r["rejected"]]
+    clients = report["wsgi_clients"]
+    if clients["logged_in"] != clients["calls"] or clients["open_clients"]:
+        failures.append(f"WSGI: {clients['open_clients']} de {clients['clients']}"
+                        f" clientes abertos, {clients['logged_in']} logins"
+                        f" em {clients['calls']}")
+    report["failures"] = failures
+    print(json.dumps(report, indent=2))
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Custo de resolver o usuário autenticado por requisição (auth.context),
+com e sem o cache de claims, e conferência do `requires_auth` em rotas.
+
+"uncached" esvazia o cache de claims a cada requisição (reproduz a
+verificação de assinatura a cada consulta); "cached" é o caminho normal.
+
+Uso:
+    python -m bench.auth_context [--requests 2000]
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from bench.async_login import app_env
+from bench.fake_oidc import FakeOIDCServer
+
+
+def _measure(dash_app, requests: int, clear_cache: bool) -> dict:
+    from flask import session
+    from auth.auth import is_authenticated
+    from auth.context import claims_cache, current_user
+
+    latencies = []
+    for _ in range(requests):
+        if clear_cache:
+            claims_cache.clear()
+        with dash_app.server.test_request_context("/"):
+            session.update(_SESSION)
+            start = time.perf_counter()
+            # Três consultas na mesma requisição, como render_page + callbacks
+            assert is_authenticated()
+            assert current_user.username == "bench"
+            assert current_user.has_role("offline_access")
+            latencies.append((time.perf_counter() - start) * 1e6)
+    latencies.sort()
+    return {
+        "p50_us": round(statistics.median(latencies), 1),
+        "p95_us": round(latencies[int(len(latencies) * 0.95) - 1], 1),
+    }
+
+
+_SESSION: dict = {}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    with FakeOIDCServer() as server:
+        os.environ.update(app_env(server))
+        import app as dash_app
+        from flask import session
+        from auth.auth import _save_tokens_to_session
+        from auth.context import requires_auth
+        from auth.transport import get_keycloak_client
+
+        @dash_app.server.route("/bench/leitura")
+        @requires_auth("offline_access")
+        def leitura():
+            return "ok"
+
+        @dash_app.server.route("/bench/admin")
+        @requires_auth("admin")
+        def admin():
+            return "ok"
+
+        bundle = get_keycloak_client().token("bench", "secret")
+        with dash_app.server.test_request_context("/"):
+            _save_tokens_to_session(bundle)
+            _SESSION.update(session)
+
+        report = {
+            "uncached": _measure(dash_app, args.requests, clear_cache=True),
+            "cached": _measure(dash_app, args.requests, clear_cache=False),
+        }
+
+        client = dash_app.server.test_client()
+        anonymous = client.get("/bench/leitura").status_code
+        with client.session_transaction() as sess:
+            sess.update(_SESSION)
+        report["routes"] = {
+            "anonymous": anonymous,
+            "with_role": client.get("/bench/leitura").status_code,
+            "missing_role": client.get("/bench/admin").status_code,
+        }
+
+    print(json.dumps(report, indent=2))
+    if report["routes"] != {"anonymous": 401, "with_role": 200,
+                            "missing_role": 403}:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
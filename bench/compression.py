@@ -0,0 +1,254 @@
+"""
+Carga da página de login com e sem compressão (compression.py), contra o
+Keycloak falso.
+
+A carga é o que o navegador pede ao abrir `/home/`: o HTML, os bundles do
+Dash (`_dash-component-suites`), `_dash-layout`, `_dash-dependencies` e o
+callback de `render_page`. Para cada `Accept-Encoding` (identity, gzip e
+br, se o pacote `brotli` estiver instalado) mede bytes transferidos e
+tempo de servidor, com o cache de bundles comprimidos vazio ("cold") e
+já preenchido ("warm"); a latência total soma o tempo de transferência
+estimado em alguns links. "revisit" é a segunda visita: bundles no cache
+do navegador (imutáveis) e layout/dependências revalidados por ETag.
+
+Confere também o conteúdo descomprimido, 304 com a ETag da versão
+comprimida, `Vary`, o limite de tamanho e o flush por pedaço numa
+resposta em streaming. Sai com código 1 se alguma conferência falhar.
+
+Uso:
+    python -m bench.compression [--iterations 20]
+"""
+import argparse
+import gzip
+import json
+import re
+import statistics
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from flask import Flask, Response
+
+from bench.fake_oidc import FakeOIDCServer
+from bench.suite import Suite, callback_body
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Links para estimar o tempo de transferência (bits/s)
+LINKS = {"3g": 1.6e6, "4g": 12e6, "broadband": 50e6}
+
+Resource = Tuple[str, str, Optional[dict]]  # (nome, caminho, corpo do POST)
+
+
+def _decode(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "br":
+        return brotli.decompress(body)
+    if encoding == "gzip":
+        return gzip.decompress(body)
+    return body
+
+
+def _resources(suite: Suite) -> List[Resource]:
+    client = suite.dash_app.server.test_client()
+    prefix = suite.prefix
+    html = client.get(prefix).get_data(as_text=True)
+    local = [url for url in re.findall(r'(?:src|href)="([^"]+)"', html)
+             if url.startswith(prefix)]
+    render = suite._deps["url.pathname"]
+    body = callback_body(render, "url.pathname", {"url.pathname": prefix},
+                         {"login-status.data": {"logged_in": False}})
+    return ([("index", prefix, None)]
+            + [(url.rsplit("/", 1)[-1].split("?")[0], url, None) for url in local]
+            + [("_dash-layout", f"{prefix}_dash-layout", None),
+               ("_dash-dependencies", f"{prefix}_dash-dependencies", None),
+               ("render_page", f"{prefix}_dash-update-component", body)])
+
+
+def _fetch(client, resource: Resource, headers: Dict[str, str]):
+    _, path, body = resource
+    start = time.perf_counter()
+    if body is None:
+        resp = client.get(path, headers=headers)
+    else:
+        resp = client.post(path, json=body, headers=headers)
+    return resp, (time.perf_counter() - start) * 1000
+
+
+def _load(client, resources: List[Resource], accept: str,
+          etags: Optional[Dict[str, str]] = None) -> dict:
+    """Uma carga da página; com `etags`, a revisita (só o que não é imutável)."""
+    total_bytes = 0
+    server_ms = 0.0
+    requests = 0
+    for resource in resources:
+        name = resource[0]
+        headers = {"Accept-Encoding": accept}
+        if etags is not None:
+            if "_dash-component-suites" in resource[1]:
+                continue  # imutável: o navegador nem pergunta
+            if name in etags:
+                headers["If-None-Match"] = etags[name]
+        resp, elapsed = _fetch(client, resource, headers)
+        total_bytes += len(resp.get_data())
+        server_ms += elapsed
+        requests += 1
+    return {"requests": requests, "bytes": total_bytes,
+            "server_ms": round(server_ms, 2)}
+
+
+def _with_links(entry: dict) -> dict:
+    for link, bps in LINKS.items():
+        entry[f"total_ms_{link}"] = round(entry["server_ms"]
+                                          + entry["bytes"] * 8 / bps * 1000, 1)
+    return entry
+
+
+def _check(failures: List[str], condition: bool, message: str) -> None:
+    if not condition:
+        failures.append(message)
+
+
+def _check_bodies(client, resources: List[Resource], encodings: List[str],
+                  min_size: int, failures: List[str]) -> Dict[str, dict]:
+    sizes: Dict[str, dict] = {}
+    for resource in resources:
+        name = resource[0]
+        identity, _ = _fetch(client, resource, {"Accept-Encoding": "identity"})
+        plain = identity.get_data()
+        sizes[name] = {"identity": len(plain)}
+        for encoding in encodings:
+            resp, _ = _fetch(client, resource, {"Accept-Encoding": encoding})
+            used = resp.headers.get("Content-Encoding")
+            sizes[name][encoding] = len(resp.get_data())
+            # O callback devolve JSON com ids gerados: compara só o tamanho
+            same = (len(_decode(resp.get_data(), used)) == len(plain)
+                    if resource[2] is not None
+                    else _decode(resp.get_data(), used) == plain)
+            _check(failures, same, f"{name} ({encoding}): conteúdo diferente")
+            if len(plain) < min_size:
+                _check(failures, used is None,
+                       f"{name}: {len(plain)} bytes comprimidos abaixo do limite")
+            elif resp.mimetype in ("application/json", "text/html",
+                                   "application/javascript"):
+                _check(failures, used == encoding,
+                       f"{name}: esperado {encoding}, veio {used}")
+            if used:
+                _check(failures, "Accept-Encoding" in resp.headers.get("Vary", ""),
+                       f"{name}: Vary sem Accept-Encoding")
+    return sizes
+
+
+def _check_etags(client, resources: List[Resource], encodings: List[str],
+                 failures: List[str]) -> Dict[str, str]:
+    etags = {}
+    for resource in resources:
+        name = resource[0]
+        if name not in ("_dash-layout", "_dash-dependencies"):
+            continue
+        for encoding in ["identity", *encodings]:
+            first, _ = _fetch(client, resource, {"Accept-Encoding": encoding})
+            etag = first.headers.get("ETag")
+            _check(failures, bool(etag) and not etag.startswith("W/"),
+                   f"{name} ({encoding}): sem ETag forte")
+            if not etag:
+                continue
+            again, _ = _fetch(client, resource, {"Accept-Encoding": encoding,
+                                                 "If-None-Match": etag})
+            _check(failures, again.status_code == 304 and not again.get_data(),
+                   f"{name} ({encoding}): revalidação deu {again.status_code}")
+            _check(failures, again.headers.get("ETag") == etag,
+                   f"{name} ({encoding}): 304 com ETag {again.headers.get('ETag')}")
+            etags[name] = etag
+        stale, _ = _fetch(client, resource, {"If-None-Match": '"outra-versao"'})
+        _check(failures, stale.status_code == 200,
+               f"{name}: ETag diferente não devolveu 200")
+    return etags
+
+
+def _check_streaming(failures: List[str]) -> dict:
+    """Cada pedaço de um gerador sai comprimido e decodificável na hora."""
+    from compression import CompressionMiddleware
+
+    parts = [f"linha {i}: ".encode() + b"x" * 400 + b"\n" for i in range(5)]
+    server = Flask(__name__)
+    server.add_url_rule("/stream", "stream",
+                        lambda: Response(iter(parts), mimetype="text/plain"))
+    server.wsgi_app = CompressionMiddleware(server.wsgi_app, 1024, 0)
+    resp = server.test_client().get("/stream", headers={"Accept-Encoding": "gzip"},
+                                    buffered=False)
+    decoder = zlib.decompressobj(31)
+    decoded = [decoder.decompress(chunk) for chunk in resp.response]
+    resp.close()
+    _check(failures, resp.headers.get("Content-Encoding") == "gzip",
+           "streaming: resposta sem gzip")
+    _check(failures, decoded[:len(parts)] == parts,
+           "streaming: pedaços não decodificam um a um")
+    return {"parts_in": len(parts), "parts_out": len(decoded),
+            "each_part_decodable": decoded[:len(parts)] == parts}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    encodings = ["gzip"] + (["br"] if brotli is not None else [])
+    failures: List[str] = []
+    with FakeOIDCServer() as oidc:
+        suite = Suite(oidc, "client")
+        from config import Config
+
+        server = suite.dash_app.server
+        middleware = server.wsgi_app
+        client = server.test_client()
+        resources = _resources(suite)
+
+        report = {"resources": _check_bodies(client, resources, encodings,
+                                             Config.COMPRESSION_MIN_SIZE,
+                                             failures)}
+        etags = _check_etags(client, resources, encodings, failures)
+
+        loads = {}
+        for accept in ["identity", *encodings]:
+            entry = {}
+            if accept != "identity":
+                middleware.cache.clear()
+                entry["cold"] = _with_links(_load(client, resources, accept))
+            runs = [_load(client, resources, accept) for _ in range(args.iterations)]
+            warm = dict(runs[0], server_ms=round(
+                statistics.median(r["server_ms"] for r in runs), 2))
+            entry["warm"] = _with_links(warm)
+            loads[accept] = entry
+
+        best = encodings[-1]
+        # O navegador guarda a ETag da versão que recebeu (a comprimida)
+        revisit_etags = {}
+        for name in etags:
+            resource = next(r for r in resources if r[0] == name)
+            resp, _ = _fetch(client, resource, {"Accept-Encoding": best})
+            revisit_etags[name] = resp.headers["ETag"]
+        runs = [_load(client, resources, best, revisit_etags)
+                for _ in range(args.iterations)]
+        revisit = dict(runs[0], server_ms=round(
+            statistics.median(r["server_ms"] for r in runs), 2))
+        loads[f"revisit_{best}"] = _with_links(revisit)
+
+        report["page_load"] = loads
+        identity_bytes = loads["identity"]["warm"]["bytes"]
+        report["saved_pct"] = {
+            accept: round(100 * (1 - loads[accept]["warm"]["bytes"] / identity_bytes), 1)
+            for accept in encodings
+        }
+        report["streaming"] = _check_streaming(failures)
+        report["failures"] = failures
+
+    print(json.dumps(report, indent=2))
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Stand-in local do Keycloak para benchmarks.
+
+Sobe um servidor WSGI em thread (localhost, porta livre) com os endpoints
+de token (password, refresh e client credentials), logout, certificados (JWKS) e discovery
+(`.well-known/openid-configuration`) do realm. Os access tokens são JWT
+RS256 de verdade, então passam pela verificação de `auth.jwks`; refresh
+tokens revogados no logout passam a ser recusados com `invalid_grant`.
+
+Latência e falhas podem ser injetadas por endpoint com `inject`.
+
+Também roda sozinho, para apontar o app em desenvolvimento:
+    python -m bench.fake_oidc [--port 8080] [--latency 0.05]
+"""
+import argparse
+import json
+import random
+import secrets
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, NamedTuple, Optional, Set
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from werkzeug.serving import WSGIRequestHandler, make_server
+from werkzeug.wrappers import Request, Response
+
+# Senha que o servidor falso sempre recusa
+BAD_PASSWORD = "wrong"
+
+# Endpoints aceitos por `inject` (mesmos nomes usados em `calls`)
+ENDPOINTS = ("password", "refresh_token", "client_credentials", "logout", "certs",
+             "well_known")
+
+
+class Fault(NamedTuple):
+    """Falha injetada em um endpoint."""
+
+    status: Optional[int] = None
+    rate: float = 1.0
+    latency: float = 0.0
+    error: str = "unavailable"
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+
+class FakeOIDCServer:
+    """
+    Servidor OIDC falso.
+
+    :param realm: Nome do realm servido.
+    :param latency: Atraso artificial (s) em cada resposta.
+    :param port: Porta fixa (0 escolhe uma livre).
+    :param access_ttl: Validade (s) dos access tokens emitidos.
+    :param refresh_ttl: Validade (s) dos refresh tokens emitidos.
+
+    `latency` e `fail_status` (falha em todos os endpoints) podem ser
+    trocados com o servidor no ar para simular lentidão ou queda do
+    Keycloak; `inject` faz o mesmo por endpoint.
+    """
+
+    def __init__(self, realm: str = "bench", latency: float = 0.0,
+                 port: int = 0, access_ttl: int = 300,
+                 refresh_ttl: int = 1800) -> None:
+        self.realm = realm
+        self.latency = latency
+        self.port = port
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+        self.fail_status: Optional[int] = None
+        self.faults: Dict[str, Fault] = {}
+        self.calls: Counter = Counter()
+        self._revoked: Set[str] = set()
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+        self._kid = secrets.token_hex(8)
+        self._private_key = rsa.generate_private_key(
+            public_exponent=65537, key_size=2048,
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    @property
+    def issuer(self) -> str:
+        return f"{self.url}realms/{self.realm}"
+
+    def __enter__(self) -> "FakeOIDCServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        self._server = make_server(
+            "127.0.0.1", self.port, self._app, threaded=True,
+            request_handler=_QuietHandler,
+        )
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+    def inject(self, endpoint: str, status: Optional[int] = 503,
+               rate: float = 1.0, latency: float = 0.0,
+               error: str = "unavailable") -> None:
+        """
+        Injeta falha e/ou latência em um endpoint.
+
+        :param endpoint: Um de `ENDPOINTS`.
+        :param status: Status HTTP da falha (None: só latência).
+        :param rate: Fração das chamadas afetadas (0 a 1).
+        :param latency: Atraso extra (s) nas chamadas afetadas.
+        :param error: Campo `error` do corpo (ex.: "invalid_grant").
+        """
+        if endpoint not in ENDPOINTS:
+            raise ValueError(f"endpoint desconhecido: {endpoint!r}")
+        self.faults[endpoint] = Fault(status, rate, latency, error)
+
+    def clear_faults(self) -> None:
+        """Remove todas as falhas injetadas."""
+        self.faults.clear()
+        self.fail_status = None
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.calls[name] += 1
+
+    def _fault(self, endpoint: str) -> Optional[Fault]:
+        fault = self.faults.get(endpoint)
+        if fault is None or random.random() >= fault.rate:
+            return None
+        if fault.latency:
+            time.sleep(fault.latency)
+        return fault if fault.status else None
+
+    def _well_known(self) -> Dict[str, Any]:
+        base = f"{self.issuer}/protocol/openid-connect"
+        return {
+            "issuer": self.issuer,
+            "authorization_endpoint": f"{base}/auth",
+            "token_endpoint": f"{base}/token",
+            "end_session_endpoint": f"{base}/logout",
+            "jwks_uri": f"{base}/certs",
+            "userinfo_endpoint": f"{base}/userinfo",
+            "grant_types_supported": ["password", "refresh_token",
+                                      "client_credentials"],
+            "id_token_signing_alg_values_supported": ["RS256"],
+        }
+
+    def _jwks(self) -> Dict[str, Any]:
+        jwk = json.loads(
+            jwt.algorithms.RSAAlgorithm.to_jwk(self._private_key.public_key())
+        )
+        jwk.update({"kid": self._kid, "use": "sig", "alg": "RS256"})
+        return {"keys": [jwk]}
+
+    def _token_bundle(self, client_id: str, username: str) -> Dict[str, Any]:
+        now = int(time.time())
+        access_token = jwt.encode(
+            {
+                "iss": self.issuer,
+                "aud": "account",
+                "azp": client_id,
+                "exp": now + self.access_ttl,
+                "iat": now,
+                "sub": secrets.token_hex(8),
+                "preferred_username": username,
+                "name": username.title(),
+                "realm_access": {"roles": ["offline_access"]},
+            },
+            self._private_key,
+            algorithm="RS256",
+            headers={"kid": self._kid},
+        )
+        return {
+            "access_token": access_token,
+            "refresh_token": secrets.token_urlsafe(32),
+            "expires_in": self.access_ttl,
+            "refresh_expires_in": self.refresh_ttl,
+            "token_type": "Bearer",
+            "session_state": secrets.token_hex(8),
+            "scope": "openid profile email",
+        }
+
+    def _app(self, environ, start_response):
+        request = Request(environ)
+        base = f"/realms/{self.realm}/protocol/openid-connect"
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.fail_status:
+            self._count(f"fail_{self.fail_status}")
+            return Response(
+                json.dumps({"error": "unavailable"}), status=self.fail_status,
+                mimetype="application/json",
+            )(environ, start_response)
+
+        if request.path == f"{base}/token" and request.method == "POST":
+            endpoint = request.form.get("grant_type", "")
+        elif request.path == f"{base}/logout" and request.method == "POST":
+            endpoint = "logout"
+        elif request.path == f"{base}/certs":
+            endpoint = "certs"
+        elif request.path == f"/realms/{self.realm}/.well-known/openid-configuration":
+            endpoint = "well_known"
+        else:
+            return Response("not found", status=404)(environ, start_response)
+
+        self._count(endpoint)
+        fault = self._fault(endpoint)
+        if fault is not None:
+            return Response(
+                json.dumps({"error": fault.error}), status=fault.status,
+                mimetype="application/json",
+            )(environ, start_response)
+
+        status = 200
+        if endpoint == "password":
+            if request.form.get("password") == BAD_PASSWORD:
+                status = 401
+                body = {"error": "invalid_grant",
+                        "error_description": "Invalid user credentials"}
+            else:
+                body = self._token_bundle(
+                    request.form.get("client_id", ""),
+                    request.form.get("username") or "bench",
+                )
+        elif endpoint == "refresh_token":
+            if request.form.get("refresh_token") in self._revoked:
+                status = 400
+                body = {"error": "invalid_grant",
+                        "error_description": "Session not active"}
+            else:
+                body = self._token_bundle(request.form.get("client_id", ""),
+                                          "bench")
+        elif endpoint == "client_credentials":
+            client_id = request.form.get("client_id", "")
+            body = self._token_bundle(client_id, f"service-account-{client_id}")
+            # Como no Keycloak: sem refresh token para client credentials
+            del body["refresh_token"], body["session_state"]
+            body["refresh_expires_in"] = 0
+            body["scope"] = request.form.get("scope") or "profile email"
+        elif endpoint == "logout":
+            with self._lock:
+                self._revoked.add(request.form.get("refresh_token", ""))
+            return Response(status=204)(environ, start_response)
+        elif endpoint == "certs":
+            body = self._jwks()
+        elif endpoint == "well_known":
+            body = self._well_known()
+        else:
+            return Response("unsupported grant", status=400)(environ, start_response)
+
+        return Response(
+            json.dumps(body), status=status, mimetype="application/json",
+        )(environ, start_response)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--realm", default="bench")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeOIDCServer(args.realm, args.latency, args.port)
+    server.start()
+    print(f"KEYCLOAK_SERVER_URL={server.url}")
+    print(f"KEYCLOAK_REALM_NAME={server.realm}")
+    print(f"issuer: {server.issuer}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
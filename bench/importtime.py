@@ -0,0 +1,87 @@
+"""
+Relatório de tempo de import do app (`python -X importtime`) com orçamento.
+
+Sai com código 1 se o melhor de N imports de `app` passar do orçamento,
+para servir de gate no CI.
+
+Uso:
+    python -m bench.importtime [--runs 5] [--budget-ms 1500] [--top 15]
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+APP_ENV = {
+    "root": "/home/",
+    "ROOT_PATH_PREFIX": "/home",
+    "KEYCLOAK_SERVER_URL": "http://127.0.0.1:9/",
+    "KEYCLOAK_CLIENT_ID": "bench",
+    "KEYCLOAK_REALM_NAME": "bench",
+}
+
+
+def _import_app() -> Tuple[int, List[Tuple[str, int, int]]]:
+    env = dict(os.environ)
+    for key, value in APP_ENV.items():
+        env.setdefault(key, value)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    modules = []
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, _, name = match.groups()
+        modules.append((name, int(self_us), int(cumulative_us)))
+        if name == "app":
+            total_us = int(cumulative_us)
+    return total_us, modules
+
+
+def _by_package(modules: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    totals: Dict[str, int] = defaultdict(int)
+    for name, self_us, _ in modules:
+        totals[name.split(".")[0]] += self_us
+    return totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float,
+                        default=float(os.getenv("IMPORT_BUDGET_MS", "1500")))
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [_import_app() for _ in range(args.runs)]
+    best_us, modules = min(runs, key=lambda run: run[0])
+    packages = sorted(_by_package(modules).items(), key=lambda kv: -kv[1])
+
+    report = {
+        "best_ms": round(best_us / 1000, 1),
+        "runs_ms": [round(total / 1000, 1) for total, _ in runs],
+        "budget_ms": args.budget_ms,
+        "top_packages_ms": {
+            name: round(us / 1000, 1) for name, us in packages[:args.top]
+        },
+    }
+    print(json.dumps(report, indent=2))
+    if best_us / 1000 > args.budget_ms:
+        raise SystemExit(
+            f"import do app levou {best_us / 1000:.0f} ms "
+            f"(orçamento {args.budget_ms:.0f} ms)"
+        )
+
+
+if __name__ == "__main__":
+    main()
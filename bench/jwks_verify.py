@@ -0,0 +1,104 @@
+"""
+Microbenchmark da verificação local de JWT (auth.jwks.JWKSVerifier).
+
+Confere também que um primeiro download do JWKS que falhou (Keycloak
+reiniciando) não bloqueia o próximo pelo `min_refresh_interval`; sai com
+código 1 se bloquear.
+
+Uso:
+    python -m bench.jwks_verify [--seconds 3]
+"""
+import argparse
+import json
+import time
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from auth.jwks import JWKSError, JWKSVerifier
+
+ISSUER = "http://localhost:8080/realms/bench"
+AUDIENCE = "bench-client"
+
+
+def _build_verifier_and_token(fetch_failures: int = 0):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update({"kid": "bench-kid", "use": "sig", "alg": "RS256"})
+    failures = [fetch_failures]
+
+    def fetch() -> dict:
+        if failures[0]:
+            failures[0] -= 1
+            raise ConnectionError("Keycloak reiniciando")
+        return {"keys": [jwk]}
+
+    verifier = JWKSVerifier(
+        jwks_url="",
+        issuer=ISSUER,
+        audience=AUDIENCE,
+        fetcher=fetch,
+    )
+    now = int(time.time())
+    token = jwt.encode(
+        {
+            "iss": ISSUER,
+            "azp": AUDIENCE,
+            "aud": "account",
+            "exp": now + 3600,
+            "iat": now,
+            "preferred_username": "bench",
+        },
+        private_key,
+        algorithm="RS256",
+        headers={"kid": "bench-kid"},
+    )
+    return verifier, token
+
+
+def _rate(fn, seconds: float) -> float:
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        fn()
+        count += 1
+    return count / seconds
+
+
+def failed_first_fetch() -> str:
+    """Verificação logo depois de um download do JWKS que falhou."""
+    verifier, token = _build_verifier_and_token(fetch_failures=1)
+    try:
+        verifier.verify(token)
+    except JWKSError:
+        pass
+    try:
+        verifier.verify(token)
+        return "ok"
+    except jwt.InvalidTokenError as exc:
+        return type(exc).__name__
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    verifier, token = _build_verifier_and_token()
+    verifier.verify(token)  # aquece o cache de chaves
+
+    result = {
+        "verify_per_s": round(_rate(lambda: verifier.verify(token), args.seconds)),
+        "unverified_decode_per_s": round(_rate(
+            lambda: jwt.decode(token, options={"verify_signature": False}),
+            args.seconds,
+        )),
+        "after_failed_fetch": failed_first_fetch(),
+    }
+    print(json.dumps(result, indent=2))
+    if result["after_failed_fetch"] != "ok":
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Sessões durante uma queda do Keycloak, com e sem o modo degradado
+(`KEYCLOAK_OUTAGE_GRACE`), contra o Keycloak falso.
+
+Cada cliente (um test client com o seu cookie) faz login, com os logins
+espalhados por alguns segundos, e depois segue o auth-keeper como o
+navegador: dispara o tick no intervalo que `schedule_refresh` daria a
+partir do `refresh_at`. Os access tokens vencem poucos segundos depois
+do login; em seguida o Keycloak passa a responder 503 por `--outage` s.
+Clientes deslogados tentam o login de novo a cada `--relogin` s, como o
+usuário jogado de volta para a tela de login.
+
+Modos, cada um num subprocesso (a configuração é lida no import):
+
+- "baseline": `KEYCLOAK_OUTAGE_GRACE=0`, o refresh que falha derruba a
+  sessão;
+- "degraded": sessões seguem com as claims já verificadas e o refresh é
+  retentado com backoff e jitter.
+
+Relata logouts forçados, requisições ao Keycloak no pior segundo depois
+da volta e o tempo até todas as sessões estarem com token novo. Sai com
+código 1 se o modo degradado derrubar alguma sessão ou se o pico dele
+não ficar abaixo do "baseline".
+
+Uso:
+    python -m bench.keycloak_outage [--clients 100] [--outage 30]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from bench.fake_oidc import FakeOIDCServer
+from bench.suite import Suite, Worker
+
+TICK = "auth-keeper.n_intervals"
+MODES = {
+    "baseline": {"KEYCLOAK_OUTAGE_GRACE": "0"},
+    "degraded": {"KEYCLOAK_OUTAGE_GRACE": "60", "KEYCLOAK_OUTAGE_RETRY_BASE": "5",
+                 "KEYCLOAK_OUTAGE_RETRY_MAX": "20"},
+}
+# Validade dos primeiros tokens: com o desconto de 30 s (_TOKEN_SKEW), o
+# refresh vence 5 s depois do login
+_ACCESS_TTL = 35
+# Intervalo mínimo e máximo do auth-keeper (ver `schedule_refresh`)
+_MIN_DELAY, _MAX_DELAY = 5, 3600
+_LOGGED_OUT = {"logged_in": False, "token": None}
+
+
+def _check(failures: List[str], condition: bool, message: str) -> None:
+    if not condition:
+        failures.append(message)
+
+
+class Client(threading.Thread):
+    """Um navegador: login, ticks do auth-keeper e novo login se cair."""
+
+    def __init__(self, suite: Suite, start_at: float, relogin: float,
+                 stop: threading.Event) -> None:
+        super().__init__(daemon=True)
+        self.worker = Worker(suite)
+        self.start_at = start_at
+        self.relogin = relogin
+        self.stop = stop
+        self.status: Dict[str, Any] = _LOGGED_OUT
+        self.forced_logouts = 0
+        self.errors = 0
+
+    def _login(self) -> None:
+        response = self.worker.call(
+            "login-submit.data", {"login-submit.data": {"attempt": 1}},
+            {"username.value": "bench", "password.value": "secret"},
+        )
+        status = (response.get("login-status") or {}).get("data")
+        if status and status.get("logged_in"):
+            self.status = status
+
+    def _tick(self) -> None:
+        response = self.worker.call(TICK, {TICK: 1},
+                                    {"login-status.data": self.status})
+        status = (response.get("login-status") or {}).get("data")
+        if status is None:
+            return  # PreventUpdate: nada mudou
+        if not status.get("logged_in"):
+            self.forced_logouts += 1
+        self.status = status
+
+    def run(self) -> None:
+        if self.stop.wait(max(0.0, self.start_at - time.time())):
+            return
+        delay = 0.0
+        while not self.stop.is_set():
+            try:
+                if not self.status.get("logged_in"):
+                    self._login()
+                    if not self.status.get("logged_in"):
+                        self.stop.wait(self.relogin)
+                        continue
+                else:
+                    self._tick()
+            except Exception:
+                self.errors += 1
+            if self.status.get("logged_in"):
+                # Intervalo que schedule_refresh programaria no dcc.Interval
+                delay = min(max(self.status["refresh_at"] - time.time(),
+                                _MIN_DELAY), _MAX_DELAY)
+            self.stop.wait(delay)
+
+
+def _session_kc(suite: Suite, worker: Worker) -> Dict[str, Any]:
+    server = suite.dash_app.server
+    cookie = worker.session_cookie()
+    if not cookie:
+        return {}
+    name = server.config["SESSION_COOKIE_NAME"]
+    with server.test_request_context("/", headers={"Cookie": f"{name}={cookie}"}) as ctx:
+        return server.session_interface.open_session(server, ctx.request).get("kc") or {}
+
+
+def _healthy(suite: Suite, client: Client) -> bool:
+    """Logado, fora do modo degradado e com o access token válido."""
+    if not client.status.get("logged_in"):
+        return False
+    kc = _session_kc(suite, client.worker)
+    return "degraded_until" not in kc and kc.get("access_expires_at", 0) > time.time()
+
+
+class Sampler(threading.Thread):
+    """Conta as requisições ao Keycloak a cada 100 ms."""
+
+    def __init__(self, oidc: FakeOIDCServer, stop: threading.Event) -> None:
+        super().__init__(daemon=True)
+        self.oidc = oidc
+        self.stop = stop
+        self.samples: List[tuple] = []
+
+    def run(self) -> None:
+        while not self.stop.wait(0.1):
+            self.samples.append((time.time(), sum(self.oidc.calls.values())))
+
+    def peak_per_second(self, since: float) -> int:
+        points = [(t, n) for t, n in self.samples if t >= since]
+        peak = 0
+        for i, (t, n) in enumerate(points):
+            later = [m for u, m in points[i:] if u <= t + 1.0]
+            peak = max(peak, later[-1] - n)
+        return peak
+
+    def count_between(self, start: float, end: float) -> int:
+        inside = [n for t, n in self.samples if start <= t <= end]
+        return inside[-1] - inside[0] if inside else 0
+
+
+def run_mode(mode: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """Roda num subprocesso: um modo do começo ao fim."""
+    with FakeOIDCServer(access_ttl=_ACCESS_TTL) as oidc:
+        os.environ.update(MODES[mode], KEYCLOAK_BREAKER_RESET="5")
+        suite = Suite(oidc, "client")
+        from auth.auth import FORCED_LOGOUTS, REFRESHES
+
+        stop = threading.Event()
+        begin = time.time() + 0.5
+        clients = [Client(suite, begin + random.uniform(0, args.spread),
+                          args.relogin, stop) for _ in range(args.clients)]
+        sampler = Sampler(oidc, stop)
+        sampler.start()
+        for client in clients:
+            client.start()
+
+        # Todos logados antes da queda; os tokens vencem durante ela
+        time.sleep(begin + args.spread + 1.0 - time.time())
+        logged_in_before = sum(c.status.get("logged_in", False) for c in clients)
+        oidc.access_ttl = 300  # depois da volta, sem refresh no meio da medição
+        outage_start = time.time()
+        oidc.fail_status = 503
+        time.sleep(args.outage)
+        logged_in_during = sum(c.status.get("logged_in", False) for c in clients)
+        oidc.fail_status = None
+        recovered_at = time.time()
+
+        recovered_in: Optional[float] = None
+        while time.time() - recovered_at < args.timeout:
+            if all(_healthy(suite, c) for c in clients):
+                recovered_in = round(time.time() - recovered_at, 1)
+                break
+            time.sleep(0.5)
+        end = time.time()
+        stop.set()
+        for client in clients:
+            client.join(5)
+
+        return {
+            "mode": mode,
+            "clients": args.clients,
+            "logged_in_before_outage": logged_in_before,
+            "logged_in_at_end_of_outage": logged_in_during,
+            "forced_logouts": sum(c.forced_logouts for c in clients),
+            "forced_logouts_metric": {
+                key[0]: value for key, value in FORCED_LOGOUTS.collect().items()
+            },
+            "refresh_outcomes": {
+                key[0]: value for key, value in REFRESHES.collect().items()
+            },
+            "keycloak_requests_during_outage": sampler.count_between(
+                outage_start, recovered_at),
+            "keycloak_peak_per_second_after_recovery": sampler.peak_per_second(
+                recovered_at),
+            "keycloak_requests_after_recovery": sampler.count_between(
+                recovered_at, end),
+            "seconds_until_all_sessions_recovered": recovered_in,
+            "client_errors": sum(c.errors for c in clients),
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--outage", type=float, default=30.0,
+                        help="duração (s) da queda do Keycloak")
+    parser.add_argument("--spread", type=float, default=5.0,
+                        help="janela (s) em que os logins se espalham")
+    parser.add_argument("--relogin", type=float, default=5.0,
+                        help="intervalo (s) entre tentativas de login de quem caiu")
+    parser.add_argument("--timeout", type=float, default=60.0,
+                        help="espera máxima (s) pela recuperação das sessões")
+    parser.add_argument("--one", choices=tuple(MODES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.one:
+        print(json.dumps(run_mode(args.one, args)))
+        return
+
+    report: Dict[str, Any] = {}
+    for mode in MODES:
+        out = subprocess.run(
+            [sys.executable, "-m", "bench.keycloak_outage", "--one", mode,
+             *sys.argv[1:]],
+            capture_output=True, text=True, check=True,
+        )
+        report[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    failures: List[str] = []
+    baseline, degraded = report["baseline"], report["degraded"]
+    _check(failures, degraded["forced_logouts"] == 0,
+           f"modo degradado derrubou {degraded['forced_logouts']} sessão(ões)")
+    _check(failures, degraded["seconds_until_all_sessions_recovered"] is not None,
+           "sessões não se recuperaram depois da volta do Keycloak")
+    _check(failures, degraded["keycloak_peak_per_second_after_recovery"]
+           < baseline["keycloak_peak_per_second_after_recovery"],
+           "pico de requisições depois da volta não ficou abaixo do baseline")
+    report["failures"] = failures
+    print(json.dumps(report, indent=2))
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Latência dos callbacks de autenticação com o stdout lento, logando direto
+no stream ou pela fila de `logging_setup`, contra o Keycloak falso.
+
+O stdout é trocado por um stream em que cada escrita espera
+`--write-delay` s (pipe cheio, coletor de logs atrasado). Cada modo roda
+num subprocesso (a configuração é lida no import):
+
+- "sync": `LOG_ASYNC=false`, sem amostragem; cada registro é escrito na
+  thread da requisição, como com o `logging.basicConfig` de antes;
+- "queue": `LOG_ASYNC=true`, sem amostragem;
+- "queue_sampled": `LOG_ASYNC=true` com a amostragem padrão dos ticks do
+  auth-keeper.
+
+Mede p50/p95/p99 do login (`check_credentials`) e do tick do auth-keeper
+(`refresh_access_token`) e confere, na saída de "queue_sampled", que
+tokens e senhas saem redigidos, que toda linha é JSON e que a fração de
+ticks escritos segue a amostragem. Sai com código 1 se alguma conferência
+falhar.
+
+Uso:
+    python -m bench.logging_latency [--iterations 200] [--write-delay 0.002]
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List
+
+from bench.fake_oidc import FakeOIDCServer
+from bench.suite import Suite, Worker, _LOGGED_IN, _login
+
+MODES = {
+    "sync": {"LOG_ASYNC": "false", "LOG_SAMPLE_RATES": ""},
+    "queue": {"LOG_ASYNC": "true", "LOG_SAMPLE_RATES": ""},
+    "queue_sampled": {"LOG_ASYNC": "true"},
+}
+TICK = "auth-keeper.n_intervals"
+_PASSWORD = "hunter2-bench"
+
+
+class SlowStream:
+    """Stream de texto em que cada escrita demora `delay` s."""
+
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.lines: List[str] = []
+        self._lock = threading.Lock()
+
+    def write(self, text: str) -> int:
+        time.sleep(self.delay)
+        with self._lock:
+            self.lines.extend(line for line in text.splitlines() if line)
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+def _percentiles(timings: List[float]) -> Dict[str, float]:
+    timings = sorted(timings)
+    return {f"p{pct}_ms": round(timings[min(len(timings) - 1,
+                                            int(len(timings) * pct / 100))] * 1000, 3)
+            for pct in (50, 95, 99)}
+
+
+def _timed(call, iterations: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+    return _percentiles(timings)
+
+
+def _checks(lines: List[str], ticks: int, token: str) -> Dict[str, Any]:
+    from config import Config
+    from logging_setup import parse_sample_rates
+
+    entries = []
+    for line in lines:
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            pass
+    output = "\n".join(lines)
+    rate = parse_sample_rates(Config.LOG_SAMPLE_RATES).get("auth.refresh_tick", 1.0)
+    written = sum(entry.get("event") == "auth.refresh_tick" for entry in entries)
+    return {
+        "lines": len(lines),
+        "all_json": len(entries) == len(lines),
+        "token_leaked": token in output or token.split(".")[2] in output,
+        "password_leaked": _PASSWORD in output,
+        "redacted_fields": next((entry for entry in entries
+                                 if entry.get("event") == "bench.redaction"), None),
+        "ticks": ticks,
+        "ticks_written": written,
+        "expected_ticks_written": round(ticks * rate, 1),
+    }
+
+
+def run_mode(mode: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """Roda num subprocesso: sobe o app com o stdout lento e mede."""
+    stream = SlowStream(args.write_delay)
+    sys.stdout = stream
+    with FakeOIDCServer() as oidc:
+        os.environ.update(MODES[mode])
+        suite = Suite(oidc, "client")
+        from logging_setup import LOG_DROPPED, _pipeline
+
+        worker = Worker(suite)
+        login = _timed(lambda: _login(worker), args.iterations)
+        # access_token válido: o tick só reagenda (o caso mais frequente)
+        tick = _timed(lambda: worker.call(TICK, {TICK: 1},
+                                          {"login-status.data": _LOGGED_IN}),
+                      args.iterations * 5)
+
+        token = oidc._token_bundle("bench", "bench")["access_token"]
+        logging.getLogger("bench").warning(
+            "refresh recusado: Authorization: Bearer %s password=%s", token, _PASSWORD,
+            extra={"event": "bench.redaction", "client_secret": "s3cr3t",
+                   "payload": {"refresh_token": token, "user": "bench"}},
+        )
+        started = time.perf_counter()
+        if _pipeline is not None:
+            _pipeline.stop()  # espera a fila esvaziar
+        drain_s = time.perf_counter() - started
+
+    report = {
+        "mode": mode,
+        "login": login,
+        "refresh_tick": tick,
+        "records_dropped": sum(LOG_DROPPED.collect().values()),
+        "drain_after_run_s": round(drain_s, 2),
+    }
+    if mode == "queue_sampled":
+        report["checks"] = _checks(stream.lines, args.iterations * 5, token)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--write-delay", type=float, default=0.002,
+                        help="espera (s) de cada escrita no stdout")
+    parser.add_argument("--one", choices=tuple(MODES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.one:
+        report = run_mode(args.one, args)
+        sys.__stdout__.write(json.dumps(report) + "\n")
+        return
+
+    report: Dict[str, Any] = {"write_delay_s": args.write_delay}
+    for mode in MODES:
+        out = subprocess.run(
+            [sys.executable, "-m", "bench.logging_latency", "--one", mode,
+             *sys.argv[1:]],
+            capture_output=True, text=True, check=True,
+        )
+        report[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    failures: List[str] = []
+    checks = report["queue_sampled"]["checks"]
+    if not checks["all_json"]:
+        failures.append("linhas de log que não são JSON")
+    if checks["token_leaked"] or checks["password_leaked"]:
+        failures.append("token ou senha na saída do log")
+    fields = checks["redacted_fields"] or {}
+    if fields.get("client_secret") != "[REDACTED]" or \
+            fields.get("payload", {}).get("refresh_token") != "[REDACTED]":
+        failures.append("campos extras sensíveis não foram redigidos")
+    if checks["ticks_written"] > max(10, 3 * checks["expected_ticks_written"]):
+        failures.append("amostragem dos ticks não reduziu a saída")
+    for callback in ("login", "refresh_tick"):
+        if report["queue"][callback]["p95_ms"] >= report["sync"][callback]["p95_ms"]:
+            failures.append(f"{callback}: p95 com a fila não ficou abaixo do síncrono")
+    report["failures"] = failures
+    print(json.dumps(report, indent=2))
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
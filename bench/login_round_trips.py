@@ -0,0 +1,180 @@
+"""
+Requisições de callback ao servidor por tentativa de login, simulando o
+renderer do Dash sobre o grafo de `_dash-dependencies`.
+
+Cada cenário altera propriedades do formulário como o navegador faria
+(clique, Enter nos campos) e segue a cascata de callbacks: callbacks do
+servidor viram POSTs em `_dash-update-component` (contados); callbacks
+clientside são executados no Node (`node` precisa estar no PATH). Como
+no renderer, só disparam callbacks cujas saídas estão na página de login,
+e a cascata para na troca de `url.pathname`, quando a página recarrega.
+
+Uso:
+    python -m bench.login_round_trips
+"""
+import json
+import shutil
+import subprocess
+from collections import deque
+from typing import Any, Dict, List, Set, Tuple
+
+from bench.fake_oidc import BAD_PASSWORD, FakeOIDCServer
+from bench.suite import Suite, Worker, callback_body
+
+_NO_UPDATE = {"__no_update__": True}
+
+_NODE_RUNNER = """
+const [scripts, namespace, name, args] = JSON.parse(
+    require("fs").readFileSync(0, "utf8"));
+global.window = {dash_clientside: {no_update: %s,
+                                   PreventUpdate: {prevent: true}}};
+for (const script of scripts) eval(script);
+let result;
+try {
+    result = window.dash_clientside[namespace][name](...args);
+} catch (e) {
+    if (e === window.dash_clientside.PreventUpdate) result = null;
+    else throw e;
+}
+process.stdout.write(JSON.stringify(result === undefined ? null : result));
+""" % json.dumps(_NO_UPDATE)
+
+
+def _run_clientside(scripts: List[str], namespace: str, name: str,
+                    args: List[Any]) -> Any:
+    out = subprocess.run(["node", "-e", _NODE_RUNNER],
+                         input=json.dumps([scripts, namespace, name, args]),
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+
+def _specs(output: str) -> List[str]:
+    specs = output.strip(".").split("...") if output.startswith("..") else [output]
+    return [spec.split("@")[0] for spec in specs]
+
+
+def _key(item: Dict[str, str]) -> str:
+    return f"{item['id']}.{item['property']}"
+
+
+def _component_ids(component: Any) -> Set[str]:
+    ids = set()
+    stack = [component]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (list, tuple)):
+            stack.extend(node)
+            continue
+        if not hasattr(node, "to_plotly_json"):
+            continue
+        if getattr(node, "id", None):
+            ids.add(node.id)
+        stack.append(getattr(node, "children", None))
+    return ids
+
+
+class Browser:
+    """Estado das propriedades da página de login e a cascata de callbacks."""
+
+    def __init__(self, suite: Suite, deps: List[Dict[str, Any]],
+                 page_ids: Set[str]) -> None:
+        self.worker = Worker(suite)
+        self.suite = suite
+        # O renderer só dispara callbacks cujas saídas estão na página
+        self.deps = [dep for dep in deps
+                     if {spec.rsplit(".", 1)[0] for spec in _specs(dep["output"])}
+                     <= page_ids]
+        self.props: Dict[str, Any] = {
+            "username.value": None, "password.value": None,
+            "username.n_submit": 0, "password.n_submit": 0,
+            "login-button.n_clicks": None, "login-button.loading": False,
+            "login-submit.data": None, "login-status.data": {"logged_in": False},
+        }
+        self.server_calls: List[str] = []
+
+    def _server(self, dep: Dict[str, Any], trigger: str) -> Dict[str, Any]:
+        self.server_calls.append(dep["output"])
+        inputs = {_key(i): self.props.get(_key(i)) for i in dep["inputs"]}
+        state = {_key(s): self.props.get(_key(s)) for s in dep["state"]}
+        body = callback_body(dep, trigger, inputs, state)
+        resp = self.worker.http.post(
+            f"{self.suite.prefix}_dash-update-component", json=body)
+        if resp.status_code == 204:  # PreventUpdate
+            return {}
+        response = resp.json["response"]
+        return {f"{cid}.{prop}": value for cid, props in response.items()
+                for prop, value in props.items()}
+
+    def _clientside(self, dep: Dict[str, Any]) -> Dict[str, Any]:
+        function = dep["clientside_function"]
+        args = [self.props.get(_key(item)) for item in dep["inputs"] + dep["state"]]
+        # Funções inline ficam nos scripts que o Dash gera para a página
+        result = _run_clientside(self.suite.dash_app.app._inline_scripts,
+                                 function["namespace"], function["function_name"],
+                                 args)
+        if result is None:
+            return {}
+        specs = _specs(dep["output"])
+        values = result if len(specs) > 1 else [result]
+        return {spec: value for spec, value in zip(specs, values)
+                if value != _NO_UPDATE}
+
+    def fire(self, changes: Dict[str, Any]) -> None:
+        """Altera propriedades ("id.prop": valor) e segue a cascata."""
+        self.props.update(changes)
+        pending = deque(changes)
+        while pending:
+            changed = pending.popleft()
+            if changed == "url.pathname":
+                return  # a página recarrega
+            for dep in self.deps:
+                if changed not in {_key(i) for i in dep["inputs"]}:
+                    continue
+                if dep.get("clientside_function"):
+                    updates = self._clientside(dep)
+                else:
+                    updates = self._server(dep, changed)
+                self.props.update(updates)
+                pending.extend(updates)
+
+
+def _scenarios() -> List[Tuple[str, Dict[str, Any], Dict[str, Any]]]:
+    filled = {"username.value": "bench", "password.value": "secret"}
+    return [
+        ("click", filled, {"login-button.n_clicks": 1}),
+        ("enter_in_password", filled, {"password.n_submit": 1}),
+        ("click_wrong_password", {**filled, "password.value": BAD_PASSWORD},
+         {"login-button.n_clicks": 1}),
+        ("click_empty_password", {"username.value": "bench"},
+         {"login-button.n_clicks": 1}),
+        ("enter_empty_fields", {}, {"username.n_submit": 1}),
+    ]
+
+
+def main() -> None:
+    if shutil.which("node") is None:
+        raise SystemExit("node não encontrado no PATH")
+    report = {}
+    with FakeOIDCServer() as oidc:
+        suite = Suite(oidc, "client")
+        deps = suite.dash_app.server.test_client().get(
+            f"{suite.prefix}_dash-dependencies").json
+        # Página de login: layout base + conteúdo de render_page
+        page_ids = _component_ids([suite.dash_app.serve_layout(),
+                                   suite.dash_app.create_login_layout()])
+        for name, fields, event in _scenarios():
+            browser = Browser(suite, deps, page_ids)
+            browser.props.update(fields)
+            browser.fire(event)
+            report[name] = {
+                "server_requests": len(browser.server_calls),
+                "callbacks": [_specs(o)[0] for o in browser.server_calls],
+                "error": browser.props.get("error-message.children") or None,
+                "password_error_shown": (browser.props.get("password-error.style")
+                                         or {}).get("display") == "block",
+            }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Enxurrada de tentativas de login contra um Keycloak falso, para conferir
+que o limitador (auth.throttle) segura as chamadas ao endpoint de token.
+
+Cenários:
+- "same_user": um IP martelando o mesmo usuário (Enter repetido, bot);
+- "user_spray": um IP testando muitos usuários diferentes;
+- "sqlite_workers": vários processos compartilhando o backend SQLite.
+
+Sai com código 1 se alguma contagem passar do limite teórico
+(burst + taxa × duração).
+
+Uso:
+    python -m bench.login_throttle [--attempts 200] [--processes 4]
+"""
+import argparse
+import copy
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+
+from bench.async_login import LOGIN_BODY, app_env
+from bench.fake_oidc import FakeOIDCServer
+
+USER_BURST, USER_PER_MINUTE = 5, 5
+IP_BURST, IP_PER_MINUTE = 20, 20
+
+
+def _body(username: str) -> dict:
+    body = copy.deepcopy(LOGIN_BODY)
+    body["state"] = [
+        {"id": "username", "property": "value", "value": username},
+        {"id": "password", "property": "value", "value": "wrong"},
+    ]
+    return body
+
+
+def _bound(burst: float, per_minute: float, elapsed: float) -> int:
+    return int(burst + per_minute / 60.0 * elapsed) + 1
+
+
+def _flood(dash_app, server: FakeOIDCServer, attempts: int, ip: str,
+           usernames) -> dict:
+    client = dash_app.server.test_client()
+    url = f"{dash_app.prefix}_dash-update-component"
+    server.calls.clear()
+    refused = 0
+    refused_ms = []
+    start = time.perf_counter()
+    for i in range(attempts):
+        t0 = time.perf_counter()
+        resp = client.post(url, json=_body(usernames(i)),
+                           environ_base={"REMOTE_ADDR": ip})
+        message = resp.json["response"]["error-message"]["children"]
+        if message.startswith("Muitas tentativas"):
+            refused += 1
+            refused_ms.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - start
+    refused_ms.sort()
+    return {
+        "attempts": attempts,
+        "upstream_calls": server.calls["password"],
+        "refused": refused,
+        "refused_p50_ms": round(refused_ms[len(refused_ms) // 2], 3)
+        if refused_ms else None,
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+def _sqlite_worker(path: str, attempts: int, barrier, allowed) -> None:
+    logging.getLogger("auth.throttle").setLevel(logging.ERROR)
+    from auth.throttle import LoginThrottle, SQLiteBucketStore
+
+    throttle = LoginThrottle(SQLiteBucketStore(path), IP_BURST, IP_PER_MINUTE,
+                             USER_BURST, USER_PER_MINUTE)
+    barrier.wait()
+    count = sum(1 for _ in range(attempts)
+                if not throttle.check("10.0.0.9", "alvo"))
+    with allowed.get_lock():
+        allowed.value += count
+
+
+def _sqlite_workers(processes: int, attempts: int) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "throttle.db")
+        barrier = ctx.Barrier(processes)
+        allowed = ctx.Value("i", 0)
+        pool = [ctx.Process(target=_sqlite_worker,
+                            args=(path, attempts, barrier, allowed))
+                for _ in range(processes)]
+        start = time.perf_counter()
+        for proc in pool:
+            proc.start()
+        for proc in pool:
+            proc.join()
+        elapsed = time.perf_counter() - start
+    return {
+        "attempts": processes * attempts,
+        "upstream_calls": allowed.value,
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--attempts", type=int, default=200)
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    # Uma linha de log por recusa; aqui só interessam as contagens
+    logging.getLogger("auth.throttle").setLevel(logging.ERROR)
+    failures = []
+    with FakeOIDCServer() as server:
+        os.environ.update(app_env(server, LOGIN_THROTTLE_BACKEND="memory"))
+        import app as dash_app
+        from config import Config
+
+        Config.LOGIN_USER_BURST, Config.LOGIN_USER_PER_MINUTE = USER_BURST, USER_PER_MINUTE
+        Config.LOGIN_IP_BURST, Config.LOGIN_IP_PER_MINUTE = IP_BURST, IP_PER_MINUTE
+
+        same_user = _flood(dash_app, server, args.attempts, "10.0.0.1",
+                           lambda i: "alvo")
+        spray = _flood(dash_app, server, args.attempts, "10.0.0.2",
+                       lambda i: f"user{i}")
+
+    workers = _sqlite_workers(args.processes, args.attempts)
+
+    for name, result, (burst, per_minute) in (
+        ("same_user", same_user, (USER_BURST, USER_PER_MINUTE)),
+        ("user_spray", spray, (IP_BURST, IP_PER_MINUTE)),
+        ("sqlite_workers", workers, (USER_BURST, USER_PER_MINUTE)),
+    ):
+        result["bound"] = _bound(burst, per_minute, result["elapsed_s"])
+        if result["upstream_calls"] > result["bound"]:
+            failures.append(f"{name}: {result['upstream_calls']} chamadas "
+                            f"> limite {result['bound']}")
+
+    print(json.dumps({
+        "same_user": same_user,
+        "user_spray": spray,
+        "sqlite_workers": workers,
+        "failures": failures,
+    }, indent=2))
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Custo de registrar métricas (metrics.Histogram.observe / Counter.inc)
+com 1 e N threads, comparando as faixas de lock com um lock único.
+
+Uso:
+    python -m bench.metrics_overhead [--ops 200000] [--threads 8]
+"""
+import argparse
+import json
+import threading
+import time
+
+import metrics
+
+
+def _single_lock(metric):
+    lock_and_values = (threading.Lock(), {})
+    metric._stripes = [lock_and_values]
+    metric._stripe = lambda: lock_and_values
+    return metric
+
+
+def _rate(fn, ops: int, threads: int) -> float:
+    per_thread = ops // threads
+    barrier = threading.Barrier(threads + 1)
+
+    def run() -> None:
+        barrier.wait()
+        for _ in range(per_thread):
+            fn()
+
+    pool = [threading.Thread(target=run) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return round(per_thread * threads / elapsed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ops", type=int, default=200_000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    report = {}
+    for variant, wrap in (("striped", lambda m: m), ("single_lock", _single_lock)):
+        histogram = wrap(metrics.Histogram("h", "bench", ("operation",)))
+        counter = wrap(metrics.Counter("c", "bench", ("outcome",)))
+        report[variant] = {
+            f"{kind}_per_s_{threads}t": _rate(fn, args.ops, threads)
+            for kind, fn in (
+                ("observe", lambda: histogram.observe(0.042, operation="token")),
+                ("inc", lambda: counter.inc(outcome="success")),
+            )
+            for threads in (1, args.threads)
+        }
+        # Nenhuma observação perdida entre as threads
+        expected = args.ops + (args.ops // args.threads) * args.threads
+        observed = sum(sum(counts) for counts, _ in histogram.collect().values())
+        if observed != expected:
+            raise SystemExit(f"{variant}: {observed} observações, esperado {expected}")
+
+    registry = metrics.Registry()
+    histogram = registry.histogram("h", "bench", ("operation",))
+    for op in ("token", "refresh_token", "logout", "certs"):
+        for _ in range(1000):
+            histogram.observe(0.05, operation=op)
+    start = time.perf_counter()
+    for _ in range(100):
+        registry.render()
+    report["render_ms"] = round((time.perf_counter() - start) * 10, 3)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Sessões entre workers do gunicorn (`gunicorn.conf.py` + `wsgi.py`) contra
+o Keycloak falso.
+
+Cada cliente faz login uma vez e depois repete o tick do auth-keeper, que
+só responde logado se o cookie validar e a sessão for encontrada. Cada
+requisição abre uma conexão nova, então elas se espalham pelos workers
+(o pid de quem atendeu vem do access log). Cenários:
+
+- "baseline": sem chave configurada e sem preload, como era com
+  `os.urandom` (cada worker assina com a sua chave);
+- "production": `gunicorn.conf.py` (preload, SQLite, arquivo de chave),
+  conferido também depois de reiniciar o servidor e depois de rotacionar
+  a chave (`python -m auth.secret_key rotate`) e reiniciar de novo.
+
+Sai com código 1 se "production" perder alguma sessão.
+
+Uso:
+    python -m bench.multiworker_sessions [--workers 4] [--clients 8]
+        [--requests 10]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import requests
+
+from bench.async_login import LOGIN_BODY, _free_port, _wait_ready, app_env
+from bench.fake_oidc import FakeOIDCServer
+from bench.suite import callback_body
+
+PREFIX = "/home/"
+TICK = "auth-keeper.n_intervals"
+
+
+class Server:
+    """gunicorn em subprocesso, com access log para saber o pid de cada requisição."""
+
+    def __init__(self, env: Dict[str, str], args: List[str], log_dir: str) -> None:
+        self.env = env
+        self.args = args
+        self.log_dir = log_dir
+        self.port = _free_port()
+        self.base = f"http://127.0.0.1:{self.port}{PREFIX}"
+        self.access_log = os.path.join(log_dir, f"access-{self.port}.log")
+        self._proc = None
+
+    def __enter__(self) -> "Server":
+        self._proc = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", *self.args,
+             "--bind", f"127.0.0.1:{self.port}",
+             "--access-logfile", self.access_log,
+             "--access-logformat", "%(p)s %(U)s",
+             "--error-logfile", os.path.join(self.log_dir, "error.log"),
+             "wsgi:application"],
+            env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        _wait_ready(self.base, timeout=60)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._proc.terminate()
+        self._proc.wait()
+
+    def callback_pids(self) -> int:
+        with open(self.access_log) as fh:
+            return len({line.split()[0] for line in fh
+                        if "_dash-update-component" in line})
+
+
+def _fresh_post(base: str, cookies: Dict[str, str], body: dict) -> requests.Response:
+    # Sem keep-alive: cada requisição pode cair em outro worker
+    return requests.post(f"{base}_dash-update-component", json=body,
+                         cookies=cookies, headers={"Connection": "close"},
+                         timeout=30)
+
+
+def _login(base: str) -> Dict[str, str]:
+    resp = _fresh_post(base, {}, LOGIN_BODY)
+    resp.raise_for_status()
+    assert resp.json()["response"]["login-status"]["data"]["logged_in"]
+    return resp.cookies.get_dict()
+
+
+def _tick_body(base: str) -> dict:
+    deps = requests.get(f"{base}_dash-dependencies", timeout=10).json()
+    dep = next(d for d in deps
+               if f"{d['inputs'][0]['id']}.{d['inputs'][0]['property']}" == TICK)
+    return callback_body(dep, TICK, {TICK: 1},
+                         {"login-status.data": {"logged_in": True, "refresh_at": 0}})
+
+
+def _check(server: Server, sessions: List[Dict[str, str]], per_client: int) -> dict:
+    body = _tick_body(server.base)
+
+    def still_logged_in(cookies: Dict[str, str]) -> bool:
+        resp = _fresh_post(server.base, cookies, body)
+        if resp.status_code == 204:  # PreventUpdate: nada mudou, ainda logado
+            return True
+        return resp.json()["response"]["login-status"]["data"]["logged_in"]
+
+    jobs = [cookies for cookies in sessions for _ in range(per_client)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(still_logged_in, jobs))
+    return {"requests": len(results), "lost": results.count(False),
+            "workers_seen": server.callback_pids()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=10,
+                        help="ticks por cliente")
+    args = parser.parse_args()
+
+    report = {}
+    with FakeOIDCServer() as oidc, tempfile.TemporaryDirectory() as tmp:
+        common = {
+            "SESSION_SQLITE_PATH": os.path.join(tmp, "sessions.db"),
+            "LOGIN_THROTTLE_BACKEND": "off",
+            "WEB_CONCURRENCY": str(args.workers),
+        }
+
+        # Antes: chave aleatória por processo, workers importam o app cada um
+        env = app_env(oidc, SESSION_BACKEND="sqlite", SECRET_KEY_FILE="",
+                      **common)
+        # Arquivo vazio: sem ele o gunicorn carregaria ./gunicorn.conf.py
+        bare_config = os.path.join(tmp, "bare.conf.py")
+        open(bare_config, "w").close()
+        gunicorn = ["--config", bare_config, "--workers", str(args.workers),
+                    "--threads", "4", "--worker-class", "gthread"]
+        with Server(env, gunicorn, tmp) as server:
+            sessions = [_login(server.base) for _ in range(args.clients)]
+            report["baseline"] = _check(server, sessions, args.requests)
+
+        key_file = os.path.join(tmp, "secret_key")
+        env = app_env(oidc, SECRET_KEY_FILE=key_file, **common)
+        production = ["--config", "gunicorn.conf.py"]
+        with Server(env, production, tmp) as server:
+            sessions = [_login(server.base) for _ in range(args.clients)]
+            result = {"workers": _check(server, sessions, args.requests)}
+        with Server(env, production, tmp) as server:
+            result["after_restart"] = _check(server, sessions, args.requests)
+        subprocess.run([sys.executable, "-m", "auth.secret_key", "rotate",
+                        key_file], check=True, stdout=subprocess.DEVNULL)
+        with Server(env, production, tmp) as server:
+            result["after_rotation"] = _check(server, sessions, args.requests)
+            new_sessions = [_login(server.base) for _ in range(args.clients)]
+            result["new_logins_after_rotation"] = _check(
+                server, new_sessions, args.requests)
+        report["production"] = result
+
+    print(json.dumps(report, indent=2))
+    lost = sum(check["lost"] for check in report["production"].values())
+    if lost:
+        raise SystemExit(f"{lost} sessões perdidas no modo de produção")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Cache de discovery/JWKS (auth.oidc_metadata) e os probes `/healthz` e
+`/readyz`, contra o Keycloak falso com latência de rede simulada.
+
+Cenários:
+
+- "first_login": latência do primeiro login de um processo recém-subido,
+  sem aquecimento (baixa o JWKS no meio do login) e com `start(wait=...)`
+  antes do tráfego, como no `post_fork` do gunicorn. Cada caso roda num
+  subprocesso novo;
+- "probes": latência de `/readyz` e `/healthz` e chamadas ao Keycloak
+  feitas por eles (devem ser zero);
+- "outage": prontidão ao subir com o Keycloak fora (503), a recuperação
+  (200), dados antigos servidos durante uma queda enquanto não passam de
+  `max_stale` (tokens seguem verificados com as chaves em cache) e 503
+  depois disso.
+
+Sai com código 1 se alguma conferência falhar.
+
+Uso:
+    python -m bench.oidc_metadata [--latency 0.05] [--probes 1000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List
+
+from bench.async_login import LOGIN_BODY, app_env
+from bench.fake_oidc import FakeOIDCServer
+
+_ENV = {"LOGIN_THROTTLE_BACKEND": "off", "KEYCLOAK_BREAKER_RESET": "0.5"}
+
+
+def _check(failures: List[str], condition: bool, message: str) -> None:
+    if not condition:
+        failures.append(message)
+
+
+def _first_login(warm: bool) -> dict:
+    """Roda num subprocesso: sobe o app e mede o primeiro login."""
+    started = time.perf_counter()
+    import app
+
+    boot_ms = (time.perf_counter() - started) * 1000
+    warm_ms = 0.0
+    if warm:
+        started = time.perf_counter()
+        app.oidc_metadata.start(wait=30)
+        warm_ms = (time.perf_counter() - started) * 1000
+    client = app.server.test_client()
+    started = time.perf_counter()
+    resp = client.post(f"{app.prefix}_dash-update-component", json=LOGIN_BODY)
+    login_ms = (time.perf_counter() - started) * 1000
+    logged_in = resp.json["response"]["login-status"]["data"]["logged_in"]
+    started = time.perf_counter()
+    client.post(f"{app.prefix}_dash-update-component", json=LOGIN_BODY)
+    return {"boot_ms": round(boot_ms, 1), "warm_up_ms": round(warm_ms, 1),
+            "first_login_ms": round(login_ms, 1),
+            "second_login_ms": round((time.perf_counter() - started) * 1000, 1),
+            "logged_in": logged_in}
+
+
+def first_login(oidc: FakeOIDCServer, failures: List[str]) -> Dict[str, dict]:
+    report = {}
+    env = app_env(oidc, **_ENV)
+    for case in ("cold", "warm"):
+        out = subprocess.run(
+            [sys.executable, "-m", "bench.oidc_metadata", "--one", case],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        report[case] = json.loads(out.stdout.strip().splitlines()[-1])
+        _check(failures, report[case]["logged_in"], f"{case}: login falhou")
+    saved = report["cold"]["first_login_ms"] - report["warm"]["first_login_ms"]
+    report["first_login_saved_ms"] = round(saved, 1)
+    _check(failures, saved > 0, "aquecer não reduziu o primeiro login")
+    return report
+
+
+def _timed(call: Callable[[], object], count: int) -> float:
+    timings = []
+    for _ in range(count):
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return round(timings[len(timings) // 2] * 1e6, 1)
+
+
+def probes(oidc: FakeOIDCServer, count: int, failures: List[str]) -> dict:
+    import app
+
+    client = app.server.test_client()
+    app.oidc_metadata.start(wait=30)
+    before = sum(oidc.calls.values())
+    ready = client.get("/readyz")
+    report = {
+        "readyz_status": ready.status_code,
+        "readyz_p50_us": _timed(lambda: client.get("/readyz"), count),
+        "healthz_p50_us": _timed(lambda: client.get("/healthz"), count),
+        "keycloak_calls": sum(oidc.calls.values()) - before,
+    }
+    _check(failures, ready.status_code == 200, "/readyz não ficou pronto")
+    _check(failures, report["keycloak_calls"] == 0,
+           f"probes chamaram o Keycloak {report['keycloak_calls']} vez(es)")
+    return report
+
+
+def _wait_for(condition: Callable[[], bool], timeout: float) -> float:
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        if condition():
+            return round(time.monotonic() - started, 2)
+        time.sleep(0.05)
+    return -1.0
+
+
+def outage(oidc: FakeOIDCServer, failures: List[str]) -> dict:
+    from auth.jwks import get_verifier
+    from auth.oidc_metadata import OIDCMetadata
+
+    metadata = OIDCMetadata(ttl=1.0, max_stale=3.0, backoff=0.1, max_backoff=0.5)
+    ready = lambda: metadata.status()["ready"]  # noqa: E731
+    report = {}
+
+    oidc.fail_status = 503
+    metadata.start(wait=5)
+    report["ready_while_keycloak_down_at_boot"] = ready()
+    _check(failures, not ready(), "pronto sem nunca ter falado com o Keycloak")
+
+    oidc.fail_status = None
+    report["seconds_to_ready_after_recovery"] = _wait_for(ready, 10)
+    _check(failures, ready(), "não ficou pronto depois da volta do Keycloak")
+
+    token = oidc._token_bundle("bench", "bench")["access_token"]
+    oidc.fail_status = 503
+    time.sleep(1.5)  # passou do ttl, renovações falhando
+    status = metadata.status()
+    try:
+        get_verifier().verify(token)
+        verified = True
+    except Exception:
+        verified = False
+    report["during_outage"] = {"ready": status["ready"], "stale": status["stale"],
+                               "consecutive_failures": status["consecutive_failures"],
+                               "token_verified_with_cached_keys": verified}
+    _check(failures, status["ready"] and status["stale"],
+           "dados antigos deveriam servir até max_stale")
+    _check(failures, verified, "token não verificado com as chaves em cache")
+
+    report["seconds_to_not_ready_past_max_stale"] = _wait_for(
+        lambda: not ready(), 5)
+    _check(failures, not ready(), "continuou pronto depois de max_stale")
+
+    oidc.fail_status = None
+    report["seconds_to_ready_after_second_recovery"] = _wait_for(ready, 10)
+    _check(failures, ready(), "não voltou a ficar pronto")
+    metadata.stop()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="latência (s) de cada resposta do Keycloak falso")
+    parser.add_argument("--probes", type=int, default=1000)
+    parser.add_argument("--one", choices=("cold", "warm"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.one:
+        print(json.dumps(_first_login(args.one == "warm")))
+        return
+
+    failures: List[str] = []
+    with FakeOIDCServer(latency=args.latency) as oidc:
+        report = {"keycloak_latency_s": args.latency,
+                  "first_login": first_login(oidc, failures)}
+        os.environ.update(app_env(oidc, **_ENV))
+        report["probes"] = probes(oidc, args.probes, failures)
+        oidc.latency = 0.0
+        report["outage"] = outage(oidc, failures)
+    report["failures"] = failures
+    print(json.dumps(report, indent=2))
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
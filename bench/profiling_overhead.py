@@ -0,0 +1,198 @@
+"""
+Custo do profiling sob demanda (profiling.py) desligado e ligado, e o
+perfil que ele produz, contra o Keycloak falso com latência.
+
+- "disabled": latência dos callbacks com o profiler instalado e
+  desligado, intercalada em rodadas com a mesma carga sem os hooks
+  ("absent"), mais o custo isolado dos hooks e de `phase` sem requisição
+  perfilada;
+- "enabled": a mesma carga com `sample_rate=1`, o detalhamento por fase
+  de cada callback e as pilhas baixadas de `/admin/profiling/folded`.
+
+Sai com código 1 se os hooks e `phase` desligados custarem 1% ou mais do
+callback mais rápido, se o perfil não separar o Keycloak da montagem de
+layout e da serialização ou se as rotas de administração aceitarem
+anônimos. A diferença "absent" x "disabled" de ponta a ponta só é
+relatada: o caminho desligado é uma checagem de `profiler.enabled`, e o
+ruído entre rodadas numa máquina ociosa passa dos 5%.
+
+Uso:
+    python -m bench.profiling_overhead [--iterations 200] [--rounds 7]
+        [--latency 0.02]
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+from bench.fake_oidc import FakeOIDCServer
+from bench.suite import SCENARIOS, Suite, Worker
+
+_SCENARIOS = ("render_page_login", "render_page_main", "check_credentials")
+
+
+def _check(failures: List[str], condition: bool, message: str) -> None:
+    if not condition:
+        failures.append(message)
+
+
+def _median_ms(run: Callable[[], Any], iterations: int) -> float:
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def _per_call_ns(call: Callable[[], Any], count: int = 200000) -> float:
+    started = time.perf_counter()
+    for _ in range(count):
+        call()
+    return (time.perf_counter() - started) / count * 1e9
+
+
+def _hooks(server, names: List[str]) -> Dict[str, list]:
+    """Tira (e devolve) os hooks do profiler das listas do Flask."""
+    removed: Dict[str, list] = {}
+    for attr in ("before_request_funcs", "teardown_request_funcs"):
+        funcs = getattr(server, attr)[None]
+        removed[attr] = [f for f in funcs if f.__name__ in names]
+        funcs[:] = [f for f in funcs if f.__name__ not in names]
+    return removed
+
+
+def disabled(suite: Suite, worker: Worker, args: argparse.Namespace,
+             failures: List[str]) -> Dict[str, Any]:
+    from profiling import get_profiler, phase
+
+    server = suite.dash_app.server
+    hook_names = ["_profiling_start", "_profiling_finish"]
+    installed = {attr: list(getattr(server, attr)[None])
+                 for attr in ("before_request_funcs", "teardown_request_funcs")}
+    results: Dict[str, Dict[str, List[float]]] = {
+        name: {"absent": [], "disabled": []} for name in _SCENARIOS}
+    for round_ in range(args.rounds):
+        # Alterna a ordem para o aquecimento não favorecer um dos lados
+        order = ("absent", "disabled") if round_ % 2 == 0 else ("disabled", "absent")
+        for mode in order:
+            if mode == "absent":
+                _hooks(server, hook_names)
+            for name in _SCENARIOS:
+                scenario = SCENARIOS[name]
+
+                def run() -> None:
+                    if scenario.before:
+                        scenario.before(worker)
+                    scenario.run(worker)
+                results[name][mode].append(_median_ms(run, args.iterations))
+            for attr, funcs in installed.items():
+                getattr(server, attr)[None][:] = funcs
+
+    report: Dict[str, Any] = {}
+    for name, modes in results.items():
+        absent = statistics.median(modes["absent"])
+        with_hooks = statistics.median(modes["disabled"])
+        report[name] = {"absent_p50_ms": round(absent, 4),
+                        "disabled_p50_ms": round(with_hooks, 4),
+                        "overhead_pct": round(100 * (with_hooks / absent - 1), 2)}
+    # Entre rodadas, o ruído de cada callback passa de alguns %: só
+    # relatado; o critério é o custo dos hooks isolados, abaixo
+    report["median_overhead_pct"] = statistics.median(
+        entry["overhead_pct"] for entry in report.values())
+
+    profiler = get_profiler()
+    start = next(f for f in installed["before_request_funcs"]
+                 if f.__name__ == "_profiling_start")
+    finish = next(f for f in installed["teardown_request_funcs"]
+                  if f.__name__ == "_profiling_finish")
+    with server.test_request_context("/"):
+        hooks_ns = _per_call_ns(lambda: (start(), finish(None)))
+
+    def no_phase() -> None:
+        with phase("keycloak"):
+            pass
+    fastest_ms = min(report[name]["absent_p50_ms"] for name in _SCENARIOS)
+    report["hooks_ns_per_request"] = round(hooks_ns, 1)
+    report["phase_ns_per_call"] = round(_per_call_ns(no_phase), 1)
+    # Hooks mais `phase` nos pontos instrumentados (no máximo três por callback)
+    report["hooks_pct_of_fastest_callback"] = round(
+        100 * (hooks_ns + 3 * report["phase_ns_per_call"]) / (fastest_ms * 1e6), 4)
+    _check(failures, not profiler.enabled, "profiler ligado no teste desligado")
+    _check(failures, report["hooks_pct_of_fastest_callback"] < 1.0,
+           "hooks e phase desligados custam 1% ou mais do callback mais rápido")
+    return report
+
+
+def enabled(suite: Suite, worker: Worker, args: argparse.Namespace,
+            failures: List[str]) -> Dict[str, Any]:
+    client = worker.http
+    anonymous = suite.dash_app.server.test_client()
+    _check(failures, anonymous.get("/admin/profiling").status_code == 401,
+           "/admin/profiling aceitou anônimo")
+    _check(failures, anonymous.post("/admin/profiling",
+                                    json={"enabled": True}).status_code == 401,
+           "POST /admin/profiling aceitou anônimo")
+
+    SCENARIOS["check_credentials"].run(worker)  # sessão de administrador
+    resp = client.post("/admin/profiling", json={"enabled": True, "sample_rate": 1.0,
+                                                 "reset": True})
+    _check(failures, resp.status_code == 200, f"ligar deu {resp.status_code}")
+
+    timings = {}
+    for name in _SCENARIOS:
+        scenario = SCENARIOS[name]
+        timings[name] = round(_median_ms(lambda: scenario.run(worker),
+                                         args.iterations), 4)
+    summary = client.get("/admin/profiling").json
+    folded = client.get("/admin/profiling/folded").get_data(as_text=True)
+    client.post("/admin/profiling", json={"enabled": False})
+
+    profiles = summary["profiles"]
+    login = profiles.get("check_credentials", {}).get("phases_mean_ms", {})
+    render = profiles.get("render_page", {}).get("phases_mean_ms", {})
+    _check(failures, login.get("keycloak", 0) >= args.latency * 1000 * 0.8,
+           "check_credentials sem o tempo do Keycloak na fase keycloak")
+    _check(failures, render.get("layout", 0) > 0 and render.get("keycloak", 1) == 0,
+           "render_page sem fase layout (ou com Keycloak)")
+    _check(failures, login.get("serialization", 0) > 0,
+           "sem fase de serialização")
+    _check(failures, "check_credentials;" in folded,
+           "pilhas sem o callback check_credentials")
+    return {
+        "p50_ms_sample_rate_1": timings,
+        "profiles": {name: profiles[name] for name in ("check_credentials", "render_page")
+                     if name in profiles},
+        "folded_lines": len(folded.splitlines()),
+        "folded_sample": sorted(folded.splitlines(),
+                                key=lambda line: -int(line.rsplit(" ", 1)[1]))[:3],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="latência (s) do Keycloak falso no perfil ligado")
+    args = parser.parse_args()
+
+    failures: List[str] = []
+    with FakeOIDCServer() as oidc:
+        # O usuário do Keycloak falso só tem este papel
+        os.environ["PROFILING_ADMIN_ROLE"] = "offline_access"
+        suite = Suite(oidc, "client")
+        worker = Worker(suite)
+        report = {"disabled": disabled(suite, worker, args, failures)}
+        oidc.latency = args.latency
+        report["enabled"] = enabled(suite, worker, args, failures)
+    report["failures"] = failures
+    print(json.dumps(report, indent=2))
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
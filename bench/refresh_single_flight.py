@@ -0,0 +1,173 @@
+"""
+Stress do refresh single-flight (auth.refresh.RefreshCoordinator).
+
+Dispara N refreshes concorrentes do mesmo refresh_token, em várias
+threads de vários processos que compartilham um diretório de
+coordenação, contra um endpoint de token local. Deve haver exatamente
+uma chamada ao endpoint.
+
+Confere também que o diretório de coordenação (0700) e o `refresh.db`
+com seus `-wal`/`-shm` (0600) não ficam legíveis para outros usuários, e
+que um `arefresh` cancelado enquanto espera o lock não o deixa preso.
+
+Uso:
+    python -m bench.refresh_single_flight [--processes 4] [--threads 16]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import stat
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+
+from keycloak import KeycloakOpenID
+
+from auth.refresh import RefreshCoordinator, RefreshLockTimeout
+from bench.fake_oidc import FakeOIDCServer
+
+REFRESH_TOKEN = "bench-refresh-token"
+
+
+def _check(failures: List[str], condition: bool, message: str) -> None:
+    if not condition:
+        failures.append(message)
+
+
+def _modes(coordination_dir: str) -> Dict[str, str]:
+    paths = {"dir": coordination_dir}
+    for name in ("refresh.db", "refresh.db-wal", "refresh.db-shm"):
+        paths[name] = os.path.join(coordination_dir, name)
+    return {name: oct(stat.S_IMODE(os.stat(path).st_mode))
+            for name, path in paths.items() if os.path.exists(path)}
+
+
+def cancelled_waiter(coordinator: RefreshCoordinator,
+                     failures: List[str]) -> Dict[str, Any]:
+    """
+    Um chamador segura o lock (refresh lento que falha); um `arefresh` do
+    mesmo token é cancelado enquanto espera. Depois, um novo refresh tem
+    de conseguir o lock.
+    """
+    token = "bench-cancelled-waiter"
+
+    def slow_failure(_: str) -> Dict[str, Any]:
+        time.sleep(0.3)
+        raise RuntimeError("Keycloak fora do ar")
+
+    def holder() -> None:
+        try:
+            coordinator.refresh(token, slow_failure)
+        except RuntimeError:
+            pass
+
+    async def fetch(_: str) -> Dict[str, Any]:
+        return {"access_token": "nunca"}
+
+    async def cancel_waiter() -> None:
+        task = asyncio.ensure_future(coordinator.arefresh(token, fetch))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        # Deixa a thread da espera cancelada pegar (e devolver) o lock
+        await asyncio.sleep(0.5)
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    time.sleep(0.05)
+    asyncio.run(cancel_waiter())
+    thread.join()
+    try:
+        outcome = coordinator.refresh(token, lambda _: {"access_token": "ok"})["access_token"]
+    except RefreshLockTimeout:
+        outcome = "RefreshLockTimeout"
+    _check(failures, outcome == "ok",
+           f"refresh depois de arefresh cancelado: {outcome}")
+    _check(failures, not coordinator._locks,
+           f"locks presos: {len(coordinator._locks)}")
+    return {"next_refresh": outcome, "locks_held": len(coordinator._locks)}
+
+
+def _worker(server_url: str, shared_dir: str, threads: int, barrier,
+            results) -> None:
+    client = KeycloakOpenID(
+        server_url=server_url,
+        realm_name="bench",
+        client_id="bench",
+        client_secret_key="bench",
+    )
+    coordinator = RefreshCoordinator(shared_dir=shared_dir)
+    local_barrier = threading.Barrier(threads)
+    seen = []
+
+    def run() -> None:
+        local_barrier.wait()
+        bundle = coordinator.refresh(REFRESH_TOKEN, client.refresh_token)
+        seen.append(bundle["access_token"])
+
+    barrier.wait()
+    pool = [threading.Thread(target=run) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.extend(seen)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    failures: List[str] = []
+    with FakeOIDCServer(latency=args.latency) as server, \
+            tempfile.TemporaryDirectory() as tmp, ctx.Manager() as mgr:
+        # Criado pelo coordenador, não pelo mkdtemp (que já usa 0700)
+        shared_dir = os.path.join(tmp, "coordination")
+        barrier = mgr.Barrier(args.processes)
+        results = mgr.list()
+        procs = [
+            ctx.Process(
+                target=_worker,
+                args=(server.url, shared_dir, args.threads, barrier, results),
+            )
+            for _ in range(args.processes)
+        ]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+
+        report = {
+            "callers": args.processes * args.threads,
+            "upstream_refresh_calls": server.calls["refresh_token"],
+            "distinct_bundles": len(set(results)),
+        }
+        coordinator = RefreshCoordinator(shared_dir=shared_dir, lock_timeout=2.0)
+        report["cancelled_waiter"] = cancelled_waiter(coordinator, failures)
+        # Com uma conexão aberta, o -wal/-shm ainda existem
+        report["file_modes"] = _modes(shared_dir)
+    _check(failures, report["upstream_refresh_calls"] == 1
+           and report["distinct_bundles"] == 1, "refresh não foi single-flight")
+    modes = report["file_modes"]
+    _check(failures, modes.get("dir") == "0o700", f"diretório com {modes.get('dir')}")
+    _check(failures, len(modes) == 4 and all(
+        mode == "0o600" for name, mode in modes.items() if name != "dir"),
+        f"permissões do refresh.db: {modes}")
+    report["failures"] = failures
+    print(json.dumps(report, indent=2))
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Latência e alocações de `render_page`, com e sem o cache de layouts.
+
+"rebuild" reproduz o comportamento anterior (monta a árvore a cada
+navegação); "cached" usa `app.layout_cache`. Cada chamada inclui a
+serialização que o Dash faz da saída (`to_json`).
+
+Uso:
+    python -m bench.render_page [--calls 300]
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+import tracemalloc
+
+for _key, _value in {
+    "root": "/home/",
+    "ROOT_PATH_PREFIX": "/home",
+    "KEYCLOAK_SERVER_URL": "http://127.0.0.1:9/",
+    "KEYCLOAK_CLIENT_ID": "bench",
+    "KEYCLOAK_REALM_NAME": "bench",
+}.items():
+    os.environ.setdefault(_key, _value)
+
+from dash._utils import to_json  # noqa: E402
+
+import app as dash_app  # noqa: E402
+from home_layout import layout_main  # noqa: E402
+from login_layout import create_login_layout  # noqa: E402
+
+# (pathname, login-status): rota protegida sem login e rota comum
+CASES = {
+    "login": ("/home", {"logged_in": False}),
+    "main": ("/home/other", {"logged_in": False}),
+}
+_BUILDERS = {"login": create_login_layout, "main": layout_main}
+
+
+def _render(pathname: str, login_status: dict) -> str:
+    with dash_app.server.test_request_context("/"):
+        return to_json(dash_app.render_page(pathname, login_status))
+
+
+def _measure(calls: int, case: str) -> dict:
+    pathname, login_status = CASES[case]
+    _render(pathname, login_status)  # aquece
+
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        _render(pathname, login_status)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    _render(pathname, login_status)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(
+        stat.size_diff for stat in after.compare_to(before, "filename")
+        if stat.size_diff > 0
+    )
+    tracemalloc.start()
+    _render(pathname, login_status)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+        "peak_alloc_kb": round(peak / 1024, 1),
+        "retained_kb": round(allocated / 1024, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=300)
+    args = parser.parse_args()
+
+    cache = dash_app.layout_cache
+    cached_get = cache.get
+    report = {}
+
+    cache.get = lambda name: _BUILDERS[name]()
+    report["rebuild"] = {case: _measure(args.calls, case) for case in CASES}
+
+    cache.get = cached_get
+    report["cached"] = {case: _measure(args.calls, case) for case in CASES}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
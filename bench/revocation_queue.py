@@ -0,0 +1,89 @@
+"""
+Logout com revogação em segundo plano (auth.revocation) contra um
+Keycloak falso lento ou fora do ar.
+
+- "slow_keycloak": o logout responde sem esperar o Keycloak (500 ms);
+- "outage": o endpoint de logout falha com 503 por um tempo e volta;
+  as revogações pendentes são repetidas com backoff até passar;
+- "shutdown": a drenagem no encerramento respeita o prazo.
+
+Uso:
+    python -m bench.revocation_queue
+"""
+import json
+import os
+import time
+
+from bench.async_login import app_env
+from bench.fake_oidc import FakeOIDCServer
+from bench.suite import SCENARIOS, Suite, run_scenario
+
+
+def _wait(predicate, timeout: float) -> float:
+    start = time.monotonic()
+    while not predicate() and time.monotonic() - start < timeout:
+        time.sleep(0.02)
+    return round(time.monotonic() - start, 2)
+
+
+def slow_keycloak(suite: Suite, oidc: FakeOIDCServer) -> dict:
+    from auth.revocation import get_revocation_queue
+
+    oidc.calls.clear()
+    oidc.inject("logout", status=None, latency=0.5)
+    result = run_scenario(suite, SCENARIOS["handle_logout"], 20, 1)
+    drained_s = _wait(lambda: oidc.calls["logout"] >= 21 and
+                      not get_revocation_queue().depth(), 30)
+    oidc.clear_faults()
+    return {"logout_p50_ms": result["p50_ms"], "logout_p99_ms": result["p99_ms"],
+            "keycloak_latency_ms": 500, "revoked": oidc.calls["logout"],
+            "drained_after_s": drained_s}
+
+
+def outage(suite: Suite, oidc: FakeOIDCServer) -> dict:
+    from auth.revocation import REVOCATIONS, get_revocation_queue
+
+    before = dict(REVOCATIONS.collect())
+    oidc.inject("logout", status=503)
+    run_scenario(suite, SCENARIOS["handle_logout"], 10, 1)
+    time.sleep(1.0)
+    depth_during = get_revocation_queue().depth()
+    oidc.clear_faults()
+    recovered_s = _wait(lambda: not get_revocation_queue().depth(), 30)
+    after = REVOCATIONS.collect()
+    return {
+        "pending_during_outage": depth_during,
+        "recovered_after_s": recovered_s,
+        "outcomes": {key[0]: after[key] - before.get(key, 0) for key in after},
+    }
+
+
+def shutdown() -> dict:
+    from auth.revocation import RevocationQueue
+
+    revocations = RevocationQueue(revoke=lambda token: time.sleep(1.0),
+                                  workers=2, drain_timeout=0.5)
+    for i in range(50):
+        revocations.submit(f"token-{i}")
+    start = time.monotonic()
+    left = revocations.shutdown()
+    return {"queued": 50, "left_unrevoked": left,
+            "shutdown_s": round(time.monotonic() - start, 2),
+            "drain_timeout_s": 0.5}
+
+
+def main() -> None:
+    with FakeOIDCServer() as oidc:
+        os.environ.update(app_env(oidc, REVOCATION_BACKOFF="0.2",
+                                   KEYCLOAK_BREAKER_RESET="1"))
+        suite = Suite(oidc, "client")
+        report = {
+            "slow_keycloak": slow_keycloak(suite, oidc),
+            "outage": outage(suite, oidc),
+        }
+    report["shutdown"] = shutdown()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
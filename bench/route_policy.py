@@ -0,0 +1,150 @@
+"""
+Política de rotas (auth.route_policy): custo do casamento na trie contra
+uma busca linear de prefixos, com milhares de regras, e o efeito do
+`before_request` nas páginas do app contra o Keycloak falso.
+
+- "matching": ns por `match` (acertos em profundidade 2-4 e caminhos sem
+  regra) e tempo de compilação, para 100, 1000 e 10000 regras;
+- "pages": status e latência de páginas com e sem login. Sem login, a
+  página protegida recebe 302 sem o Dash montar o HTML.
+
+Sai com código 1 se alguma página responder com o status errado.
+
+Uso:
+    python -m bench.route_policy [--rules 100 1000 10000] [--lookups 100000]
+"""
+import argparse
+import json
+import os
+import random
+import time
+from typing import Dict, List, Optional
+
+from bench.async_login import app_env
+from bench.fake_oidc import FakeOIDCServer
+from bench.suite import Suite, Worker, _login
+
+RULES = "/home/admin=realm:admin;/home/ajuda=public;/home/conta=offline_access"
+
+
+def _generated_rules(count: int) -> str:
+    rng = random.Random(count)
+    entries = []
+    for i in range(count):
+        depth = rng.randint(1, 3)
+        path = f"/home/area{i % 200}/" + "/".join(
+            f"s{rng.randint(0, 50)}" for _ in range(depth))
+        roles = rng.choice(["", "=public", "=analista", "=realm:admin,client:gestor"])
+        entries.append(path + roles)
+    return ";".join(entries)
+
+
+def _linear_match(rules, path: str):
+    """Referência: maior prefixo por varredura de todas as regras."""
+    best = None
+    for rule in rules:
+        prefix = rule.prefix
+        if path == prefix or path.startswith(prefix.rstrip("/") + "/"):
+            # Empate (prefixo repetido): vale a última, como na trie
+            if best is None or len(prefix) >= len(best.prefix):
+                best = rule
+    return best
+
+
+def _per_call_ns(fn, paths: List[str]) -> float:
+    start = time.perf_counter()
+    for path in paths:
+        fn(path)
+    return round((time.perf_counter() - start) / len(paths) * 1e9, 1)
+
+
+def matching(counts: List[int], lookups: int) -> Dict[str, dict]:
+    from auth.route_policy import RoutePolicy, parse_rules
+
+    report = {}
+    for count in counts:
+        rules = parse_rules(_generated_rules(count))
+        start = time.perf_counter()
+        policy = RoutePolicy(rules)
+        compile_ms = (time.perf_counter() - start) * 1000
+
+        rng = random.Random(0)
+        hits = [rng.choice(rules).prefix + "/pagina" for _ in range(lookups)]
+        misses = [f"/home/outra{rng.randint(0, 999)}/pagina" for _ in range(lookups)]
+        for path in hits[:200] + misses[:200]:
+            if policy.match(path) != _linear_match(rules, path):
+                raise SystemExit(f"trie e busca linear divergem em {path}")
+
+        linear_sample = hits[: max(100, lookups // max(count, 1))]
+        report[str(count)] = {
+            "compile_ms": round(compile_ms, 2),
+            "trie_hit_ns": _per_call_ns(policy.match, hits),
+            "trie_miss_ns": _per_call_ns(policy.match, misses),
+            "linear_hit_ns": _per_call_ns(lambda p: _linear_match(rules, p),
+                                          linear_sample),
+        }
+    return report
+
+
+def _get(worker: Worker, path: str):
+    start = time.perf_counter()
+    resp = worker.http.get(path)
+    return resp.status_code, (time.perf_counter() - start) * 1000, resp
+
+
+def pages(iterations: int) -> Dict[str, dict]:
+    expected = {
+        # caminho: (sem login, com login)
+        "/home/": (200, 200),
+        "/home/relatorios": (302, 200),
+        "/home/ajuda": (200, 200),
+        "/home/conta/dados": (302, 200),
+        "/home/admin/usuarios": (302, 403),
+        "/home/_dash-layout": (200, 200),
+    }
+    with FakeOIDCServer() as oidc:
+        os.environ.update(app_env(oidc, ROUTE_RULES=RULES))
+        suite = Suite(oidc, "client")
+        anonymous, logged_in = Worker(suite), Worker(suite)
+        _login(logged_in)
+
+        report = {}
+        failures = []
+        for path, statuses in expected.items():
+            entry = {}
+            for label, worker, status in (("anonymous", anonymous, statuses[0]),
+                                          ("logged_in", logged_in, statuses[1])):
+                timings = []
+                got: Optional[int] = None
+                for _ in range(iterations):
+                    got, elapsed, resp = _get(worker, path)
+                    timings.append(elapsed)
+                if got != status:
+                    failures.append(f"{label} {path}: {got} (esperado {status})")
+                timings.sort()
+                entry[label] = {"status": got,
+                                "p50_ms": round(timings[len(timings) // 2], 3)}
+                if got == 302:
+                    entry[label]["location"] = resp.headers["Location"]
+            report[path] = entry
+    if failures:
+        print(json.dumps(report, indent=2))
+        raise SystemExit("; ".join(failures))
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rules", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--lookups", type=int, default=100_000)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    # "pages" primeiro: o Config é lido no import, com o ambiente do app
+    report = {"pages": pages(args.iterations)}
+    report["matching"] = matching(args.rules, args.lookups)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
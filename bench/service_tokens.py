@@ -0,0 +1,218 @@
+"""
+Tokens de serviço (`auth.service_tokens`) contra o endpoint client
+credentials do Keycloak falso, contando as buscas que chegam a ele.
+
+- "uncached": uma busca por chamada, como cada job faria sem o cache;
+- "cached": `--threads` threads pedindo o token `--iterations` vezes;
+- "cold_single_flight": as mesmas threads pedindo juntas, com o cache
+  vazio;
+- "refresh_ahead": tokens de vida curta pedidos sem parar por
+  `--duration` s; a renovação antecipada acontece em segundo plano e
+  nenhum pedido depois do primeiro espera o Keycloak;
+- "shared_memory", "shared_file", "shared_sqlite": `--processes`
+  processos (workers) pedindo dois scopes ao mesmo tempo, cada um com o
+  seu cache ou com o store compartilhado.
+
+Sai com código 1 se o cache buscar mais de uma vez por scope, se algum
+pedido com token em cache esperar o Keycloak ou se os stores
+compartilhados não reduzirem as buscas a uma por scope entre processos.
+
+Uso:
+    python -m bench.service_tokens [--iterations 200] [--threads 8]
+        [--processes 4] [--latency 0.05] [--duration 10]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from bench.async_login import app_env
+from bench.fake_oidc import FakeOIDCServer
+
+_SCOPES = ("", "reports")
+STORES = ("memory", "file", "sqlite")
+
+
+def _check(failures: List[str], condition: bool, message: str) -> None:
+    if not condition:
+        failures.append(message)
+
+
+def _ms(timings: List[float]) -> Dict[str, float]:
+    timings = sorted(timings)
+    return {"p50_ms": round(statistics.median(timings) * 1000, 3),
+            "max_ms": round(timings[-1] * 1000, 3)}
+
+
+def _timed(call: Callable[[], Any]) -> float:
+    started = time.perf_counter()
+    call()
+    return time.perf_counter() - started
+
+
+def _fetches(oidc: FakeOIDCServer) -> int:
+    return oidc.calls["client_credentials"]
+
+
+def uncached(oidc: FakeOIDCServer, args: argparse.Namespace,
+             failures: List[str]) -> Dict[str, Any]:
+    from auth.service_tokens import fetch_client_credentials
+
+    before = _fetches(oidc)
+    timings = [_timed(fetch_client_credentials) for _ in range(args.iterations)]
+    return {"fetches": _fetches(oidc) - before, **_ms(timings)}
+
+
+def cached(oidc: FakeOIDCServer, args: argparse.Namespace,
+           failures: List[str]) -> Dict[str, Any]:
+    from auth.service_tokens import ServiceTokenProvider, fetch_client_credentials
+
+    provider = ServiceTokenProvider(fetch_client_credentials)
+    before = _fetches(oidc)
+
+    def job(_: int) -> List[float]:
+        return [_timed(provider.get_token) for _ in range(args.iterations)]
+
+    with ThreadPoolExecutor(args.threads) as pool:
+        timings = [t for chunk in pool.map(job, range(args.threads)) for t in chunk]
+    fetches = _fetches(oidc) - before
+    _check(failures, fetches == 1, f"cache buscou {fetches} vezes")
+    return {"calls": len(timings), "fetches": fetches, **_ms(timings)}
+
+
+def cold_single_flight(oidc: FakeOIDCServer, args: argparse.Namespace,
+                       failures: List[str]) -> Dict[str, Any]:
+    from auth.service_tokens import ServiceTokenProvider, fetch_client_credentials
+
+    provider = ServiceTokenProvider(fetch_client_credentials)
+    start = threading.Barrier(args.threads * 2)
+    before = _fetches(oidc)
+
+    def job(i: int) -> str:
+        start.wait()
+        return provider.get_token(scope=_SCOPES[i % 2])
+
+    with ThreadPoolExecutor(args.threads * 2) as pool:
+        tokens = list(pool.map(job, range(args.threads * 2)))
+    fetches = _fetches(oidc) - before
+    _check(failures, fetches == len(_SCOPES),
+           f"{fetches} buscas para {len(_SCOPES)} scopes com o cache vazio")
+    return {"callers": len(tokens), "distinct_tokens": len(set(tokens)),
+            "fetches": fetches}
+
+
+def refresh_ahead(oidc: FakeOIDCServer, args: argparse.Namespace,
+                  failures: List[str]) -> Dict[str, Any]:
+    from auth.service_tokens import ServiceTokenProvider, fetch_client_credentials
+
+    ttl, skew, ahead = 6, 1.0, 0.5
+    oidc.access_ttl = ttl
+    provider = ServiceTokenProvider(fetch_client_credentials, skew=skew,
+                                    refresh_ahead=ahead)
+    before = _fetches(oidc)
+    first = _timed(provider.get_token)
+    stop = time.monotonic() + args.duration
+
+    def job(_: int) -> List[float]:
+        timings = []
+        while time.monotonic() < stop:
+            timings.append(_timed(provider.get_token))
+            time.sleep(0.005)
+        return timings
+
+    with ThreadPoolExecutor(args.threads) as pool:
+        timings = [t for chunk in pool.map(job, range(args.threads)) for t in chunk]
+    oidc.access_ttl = 300
+    fetches = _fetches(oidc) - before
+    expected = 1 + int(args.duration // (ttl * ahead))
+    _check(failures, max(timings) < args.latency,
+           f"pedido com token em cache esperou {max(timings) * 1000:.1f} ms")
+    _check(failures, fetches <= expected + 1,
+           f"{fetches} buscas em {args.duration}s (esperado ~{expected})")
+    return {"token_ttl_s": ttl, "refresh_after_s": ttl * ahead,
+            "first_call_ms": round(first * 1000, 3), "calls": len(timings),
+            "fetches": fetches, "expected_fetches": expected, **_ms(timings)}
+
+
+def run_process(args: argparse.Namespace) -> Dict[str, Any]:
+    """Roda num subprocesso: um worker pedindo tokens com o store configurado."""
+    from auth.service_tokens import get_service_token
+
+    time.sleep(max(0.0, args.start_at - time.time()))
+
+    def job(i: int) -> List[str]:
+        return [get_service_token(scope=_SCOPES[(i + n) % 2])
+                for n in range(args.iterations // 4)]
+
+    with ThreadPoolExecutor(4) as pool:
+        tokens = {t for chunk in pool.map(job, range(4)) for t in chunk}
+    return {"pid": os.getpid(), "distinct_tokens": len(tokens)}
+
+
+def shared(store: str, oidc: FakeOIDCServer, args: argparse.Namespace,
+           failures: List[str]) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "tokens.db" if store == "sqlite" else "tokens")
+        env = app_env(oidc, SERVICE_TOKEN_STORE=store, SERVICE_TOKEN_STORE_PATH=path)
+        before = _fetches(oidc)
+        start_at = time.time() + 3.0  # tempo de import dos subprocessos
+        procs = [subprocess.Popen(
+            [sys.executable, "-m", "bench.service_tokens", "--one-process",
+             "--start-at", str(start_at), "--iterations", str(args.iterations)],
+            env=env, stdout=subprocess.PIPE, text=True,
+        ) for _ in range(args.processes)]
+        results = [json.loads(p.communicate()[0].strip().splitlines()[-1])
+                   for p in procs]
+    fetches = _fetches(oidc) - before
+    if store != "memory":
+        _check(failures, fetches == len(_SCOPES),
+               f"store {store}: {fetches} buscas em {args.processes} processos")
+    return {"processes": args.processes, "fetches": fetches,
+            "distinct_tokens_per_process": [r["distinct_tokens"] for r in results]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="latência (s) do endpoint de token")
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="duração (s) do cenário refresh_ahead")
+    parser.add_argument("--one-process", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--start-at", type=float, default=0.0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.one_process:
+        print(json.dumps(run_process(args)))
+        return
+
+    failures: List[str] = []
+    report: Dict[str, Any] = {}
+    with FakeOIDCServer(latency=args.latency) as oidc:
+        os.environ.update(app_env(oidc))
+        for name, scenario in (("uncached", uncached), ("cached", cached),
+                               ("cold_single_flight", cold_single_flight),
+                               ("refresh_ahead", refresh_ahead)):
+            report[name] = scenario(oidc, args, failures)
+        for store in STORES:
+            report[f"shared_{store}"] = shared(store, oidc, args, failures)
+    _check(failures, report["shared_memory"]["fetches"]
+           > report["shared_sqlite"]["fetches"],
+           "store compartilhado não reduziu as buscas entre processos")
+    report["failures"] = failures
+    print(json.dumps(report, indent=2))
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
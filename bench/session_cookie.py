@@ -0,0 +1,226 @@
+"""
+Compara tamanho de requisição e latência de callback entre a sessão por
+cookie do Flask e os backends de sessão no servidor.
+
+A sessão leva um access token RS256 de verdade (do tamanho típico do
+Keycloak), assinado aqui e verificado pelo `JWKSVerifier` com um JWKS
+local: o callback lê o `current_user` verificado, como em produção.
+
+Nos backends no servidor, confere também o login sobre um id de sessão
+já existente (session fixation): o id muda e o registro antigo some.
+Sai com código 1 se não mudar.
+
+Uso:
+    python -m bench.session_cookie [--requests 500]
+"""
+import argparse
+import json
+import os
+import secrets
+import statistics
+import tempfile
+import time
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+for _key, _value in {
+    "root": "/home/",
+    "ROOT_PATH_PREFIX": "/home",
+    "KEYCLOAK_SERVER_URL": "http://127.0.0.1:9/",
+    "KEYCLOAK_CLIENT_ID": "bench",
+    "KEYCLOAK_REALM_NAME": "bench",
+}.items():
+    os.environ.setdefault(_key, _value)
+
+from flask import session  # noqa: E402
+from flask.sessions import SecureCookieSessionInterface  # noqa: E402
+
+import app as dash_app  # noqa: E402
+import auth.context  # noqa: E402
+from auth.auth import _save_tokens_to_session  # noqa: E402
+from auth.jwks import JWKSVerifier, realm_issuer, realm_jwks_url  # noqa: E402
+from auth.session_store import (  # noqa: E402
+    MemorySessionStore,
+    ServerSideSessionInterface,
+    SQLiteSessionStore,
+)
+from config import Config  # noqa: E402
+
+_KID = secrets.token_hex(8)
+_PRIVATE_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def _jwks() -> dict:
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(_PRIVATE_KEY.public_key()))
+    jwk.update({"kid": _KID, "use": "sig", "alg": "RS256"})
+    return {"keys": [jwk]}
+
+
+# Verificador com o JWKS local, no lugar do que buscaria no Keycloak
+_VERIFIER = JWKSVerifier(realm_jwks_url(), realm_issuer(), Config.KEYCLOAK_CLIENT_ID,
+                         fetcher=_jwks)
+auth.context.get_verifier = lambda: _VERIFIER
+
+# Payload do tick do auth-keeper / saudação: um callback que lê a sessão
+_CALLBACK_BODY = {
+    "output": "greetings-user.children",
+    "outputs": {"id": "greetings-user", "property": "children"},
+    "inputs": [{"id": "login-status", "property": "data",
+                "value": {"logged_in": True, "token": None}}],
+    "changedPropIds": ["login-status.data"],
+    "state": [],
+}
+
+
+def _fake_jwt(size: int) -> str:
+    return ".".join(secrets.token_urlsafe(n) for n in (40, size, 256))
+
+
+def _access_token(claims: dict) -> str:
+    """Access token assinado, com as claims de rotina de um token do Keycloak."""
+    now = int(time.time())
+    return jwt.encode(
+        {
+            **claims,
+            "iss": realm_issuer(),
+            "aud": "account",
+            "azp": Config.KEYCLOAK_CLIENT_ID,
+            "exp": now + 300,
+            "iat": now,
+            "jti": secrets.token_hex(16),
+            "sub": secrets.token_hex(16),
+            "typ": "Bearer",
+            "sid": secrets.token_hex(16),
+            "acr": "1",
+            "allowed-origins": ["https://app.example.com"],
+            "scope": "openid profile email",
+            "email_verified": True,
+            "given_name": "Bench",
+            "family_name": "User",
+        },
+        _PRIVATE_KEY,
+        algorithm="RS256",
+        headers={"kid": _KID},
+    )
+
+
+_CLAIMS = {
+    "preferred_username": "bench",
+    "name": "Bench User",
+    "email": "bench@example.com",
+    "realm_access": {"roles": ["offline_access", "uma_authorization"]},
+    "resource_access": {"account": {"roles": ["manage-account"]}},
+}
+
+
+def _session_bundle() -> dict:
+    now = int(time.time())
+    claims = _CLAIMS
+    return {
+        "kc": {
+            "access_token": _access_token(claims),
+            # O refresh token não é verificado localmente
+            "refresh_token": _fake_jwt(500),
+            "access_expires_at": now + 270,
+            "refresh_expires_at": now + 1770,
+            "session_state": secrets.token_hex(16),
+            "scope": "openid profile email",
+            "token_type": "Bearer",
+            "claims": claims,
+        },
+        "username": "bench",
+        "name": "Bench User",
+    }
+
+
+def _run(interface, n_requests: int) -> dict:
+    server = dash_app.server
+    server.session_interface = interface
+
+    with server.test_request_context("/"):
+        session.update(_session_bundle())
+        response = server.response_class()
+        interface.save_session(server, session, response)
+        cookie_header = response.headers["Set-Cookie"].split(";", 1)[0]
+
+    client = server.test_client()
+    name, value = cookie_header.split("=", 1)
+    client.set_cookie(name, value)
+    url = f"{dash_app.prefix}_dash-update-component"
+    latencies = []
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        resp = client.post(url, json=_CALLBACK_BODY)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert resp.status_code == 200, resp.status_code
+    assert "Bench User" in resp.get_data(as_text=True), "sessão não carregada"
+
+    latencies.sort()
+    return {
+        "cookie_bytes": len(cookie_header),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+    }
+
+
+def _fixation(interface: ServerSideSessionInterface) -> dict:
+    """Login sobre um id plantado antes da autenticação."""
+    server = dash_app.server
+    server.session_interface = interface
+
+    with server.test_request_context("/"):
+        session["next"] = "/home/"
+        response = server.response_class()
+        interface.save_session(server, session, response)
+        planted = response.headers["Set-Cookie"].split(";", 1)[0]
+
+    with server.test_request_context("/", headers={"Cookie": planted}):
+        planted_sid = session.sid
+        _save_tokens_to_session({
+            "access_token": _access_token(_CLAIMS),
+            "refresh_token": _fake_jwt(500),
+            "expires_in": 300,
+            "refresh_expires_in": 1800,
+        }, login=True)
+        response = server.response_class()
+        interface.save_session(server, session, response)
+        login_sid = session.sid
+        cookie = response.headers.get("Set-Cookie", "").split(";", 1)[0]
+
+    return {
+        "sid_changed": login_sid != planted_sid,
+        "cookie_changed": bool(cookie) and cookie != planted,
+        "planted_sid_cleared": interface.store.get(planted_sid) is None,
+        "data_kept": interface.store.get(login_sid) is not None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = {
+            "cookie": SecureCookieSessionInterface(),
+            "memory": ServerSideSessionInterface(MemorySessionStore()),
+            "sqlite": ServerSideSessionInterface(
+                SQLiteSessionStore(os.path.join(tmp, "sessions.db"))
+            ),
+        }
+        result = {name: _run(iface, args.requests)
+                  for name, iface in backends.items()}
+        for name, iface in backends.items():
+            if isinstance(iface, ServerSideSessionInterface):
+                result[name]["fixation"] = _fixation(iface)
+    print(json.dumps(result, indent=2))
+
+    failures = [f"{name}: {check}" for name, backend in result.items()
+                for check, ok in backend.get("fixation", {}).items() if not ok]
+    if failures:
+        raise SystemExit("session fixation: " + ", ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""
+Suíte de carga dos callbacks de autenticação e do `render_page`, contra
+o Keycloak falso (bench.fake_oidc).
+
+Cada cenário dispara o endpoint `_dash-update-component` como o navegador
+faria, pelo test client do Flask ("client") ou por HTTP contra o app
+servido num servidor WSGI local ("wsgi"). Preparação por iteração
+(login antes do logout, expirar o access token antes do refresh) fica
+fora da medição.
+
+Relata vazão e latência p50/p95/p99 em JSON. Com `--baseline`, compara
+com uma execução anterior e sai com código 1 se algum cenário piorar
+além de `--max-regression` (p95 maior ou vazão menor).
+
+Uso:
+    python -m bench.suite [--transport client|wsgi] [--iterations 200]
+        [--concurrency 1] [--latency 0.0] [--scenarios ...]
+        [--output atual.json] [--baseline anterior.json]
+        [--max-regression 0.25]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import requests
+
+from bench.async_login import app_env
+from bench.fake_oidc import FakeOIDCServer, _QuietHandler
+
+
+class Scenario(NamedTuple):
+    """Um cenário: preparação por iteração (fora da medição) e operação."""
+
+    before: Optional[Callable[["Worker"], None]]
+    run: Callable[["Worker"], bool]
+
+
+def callback_body(dep: Dict[str, Any], trigger: str, inputs: Dict[str, Any],
+                  state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Corpo de `_dash-update-component` para uma entrada de `_dash-dependencies`.
+
+    :param trigger: Input que disparou o callback ("id.prop").
+    """
+    output = dep["output"]
+    specs = output.strip(".").split("...") if output.startswith("..") else [output]
+    outputs = []
+    for spec in specs:
+        component_id, prop = spec.rsplit(".", 1)
+        outputs.append({"id": component_id, "property": prop.split("@")[0]})
+
+    def values(items: List[Dict[str, str]], given: Dict[str, Any]):
+        return [
+            {**item, "value": given.get(f"{item['id']}.{item['property']}")}
+            for item in items
+        ]
+
+    return {
+        "output": output,
+        "outputs": outputs if len(outputs) > 1 else outputs[0],
+        "inputs": values(dep["inputs"], inputs),
+        "state": values(dep["state"], state),
+        "changedPropIds": [trigger],
+    }
+
+
+class Worker:
+    """Um cliente (com seu próprio cookie de sessão) da suíte."""
+
+    def __init__(self, suite: "Suite") -> None:
+        self.suite = suite
+        if suite.base_url:
+            self.http = requests.Session()
+        else:
+            self.http = suite.dash_app.server.test_client()
+
+    def call(self, trigger: str, inputs: Dict[str, Any],
+             state: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Dispara o callback cujo primeiro Input é `trigger` ("id.prop")."""
+        body = self.suite.callback_body(trigger, inputs, state or {})
+        url = f"{self.suite.base_url}{self.suite.prefix}_dash-update-component"
+        resp = self.http.post(url, json=body)
+        if resp.status_code == 204:  # PreventUpdate
+            return {}
+        payload = resp.json() if self.suite.base_url else resp.json
+        return payload["response"]
+
+    def session_cookie(self) -> Optional[str]:
+        name = self.suite.dash_app.server.config["SESSION_COOKIE_NAME"]
+        if self.suite.base_url:
+            return self.http.cookies.get(name)
+        cookie = self.http.get_cookie(name)
+        return cookie.value if cookie else None
+
+
+class Suite:
+    """Monta o app contra o servidor falso e executa os cenários."""
+
+    def __init__(self, oidc: FakeOIDCServer, transport: str) -> None:
+        os.environ.update(app_env(oidc, LOGIN_THROTTLE_BACKEND="off"))
+        import app as dash_app
+
+        self.dash_app = dash_app
+        self.prefix = dash_app.prefix
+        self.base_url = ""
+        self._server = None
+        deps = dash_app.server.test_client().get(
+            f"{self.prefix}_dash-dependencies").json
+        self._deps = {
+            f"{dep['inputs'][0]['id']}.{dep['inputs'][0]['property']}": dep
+            for dep in deps if not dep.get("clientside_function")
+        }
+        if transport == "wsgi":
+            from werkzeug.serving import make_server
+
+            self._server = make_server("127.0.0.1", 0, dash_app.server,
+                                       threaded=True,
+                                       request_handler=_QuietHandler)
+            threading.Thread(target=self._server.serve_forever,
+                             daemon=True).start()
+            host, port = self._server.server_address[:2]
+            self.base_url = f"http://{host}:{port}"
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+
+    def callback_body(self, trigger: str, inputs: Dict[str, Any],
+                      state: Dict[str, Any]) -> Dict[str, Any]:
+        """Corpo de `_dash-update-component` a partir de `_dash-dependencies`."""
+        return callback_body(self._deps[trigger], trigger, inputs, state)
+
+    def expire_access_token(self, worker: Worker) -> None:
+        """Marca o access token da sessão do worker como vencido."""
+        server = self.dash_app.server
+        name = server.config["SESSION_COOKIE_NAME"]
+        interface = server.session_interface
+        headers = {"Cookie": f"{name}={worker.session_cookie()}"}
+        with server.test_request_context("/", headers=headers) as ctx:
+            session = interface.open_session(server, ctx.request)
+            session["kc"] = {**session["kc"], "access_expires_at": 0}
+            interface.save_session(server, session, server.response_class())
+
+
+# --- cenários ----------------------------------------------------------------
+
+_LOGGED_OUT = {"logged_in": False, "token": None}
+_LOGGED_IN = {"logged_in": True, "token": None, "refresh_at": 0}
+
+
+def _login(worker: Worker) -> bool:
+    response = worker.call(
+        "login-submit.data", {"login-submit.data": {"attempt": 1}},
+        {"username.value": "bench", "password.value": "secret"},
+    )
+    return response["login-status"]["data"]["logged_in"] is True
+
+
+def _render(pathname: str) -> Callable[[Worker], bool]:
+    def run(worker: Worker) -> bool:
+        response = worker.call("url.pathname", {"url.pathname": pathname},
+                               {"login-status.data": _LOGGED_OUT})
+        return bool(response["page-content"]["children"])
+    return run
+
+
+def _refresh(worker: Worker) -> bool:
+    response = worker.call("auth-keeper.n_intervals",
+                           {"auth-keeper.n_intervals": 1},
+                           {"login-status.data": _LOGGED_IN})
+    return response["login-status"]["data"]["logged_in"] is True
+
+
+def _before_refresh(worker: Worker) -> None:
+    if not worker.session_cookie():
+        _login(worker)
+    worker.suite.expire_access_token(worker)
+
+
+def _logout(worker: Worker) -> bool:
+    response = worker.call("logout-btn.n_clicks", {"logout-btn.n_clicks": 1})
+    return response["login-status"]["data"]["logged_in"] is False
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "render_page_login": Scenario(None, _render("/home")),
+    "render_page_main": Scenario(None, _render("/home/other")),
+    "check_credentials": Scenario(None, _login),
+    "refresh_access_token": Scenario(_before_refresh, _refresh),
+    "handle_logout": Scenario(_login, _logout),
+}
+
+
+# --- medição -----------------------------------------------------------------
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    index = max(0, min(len(sorted_values) - 1,
+                       int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(suite: Suite, scenario: Scenario, iterations: int,
+                 concurrency: int) -> Dict[str, Any]:
+    """Executa `iterations` operações divididas entre `concurrency` workers."""
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+    measured = [0.0]
+
+    def work(count: int) -> None:
+        worker = Worker(suite)
+        local, failed, busy = [], 0, 0.0
+        for _ in range(count):
+            if scenario.before:
+                scenario.before(worker)
+            start = time.perf_counter()
+            try:
+                ok = scenario.run(worker)
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            busy += elapsed
+            local.append(elapsed * 1000)
+            failed += not ok
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+            measured[0] = max(measured[0], busy)
+
+    shares = [iterations // concurrency + (i < iterations % concurrency)
+              for i in range(concurrency)]
+    work(1)  # aquece caches, conexões e JWKS
+    latencies.clear()
+    errors[0] = 0
+    measured[0] = 0.0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(work, shares))
+
+    latencies.sort()
+    # Vazão pelo tempo medido do worker mais ocupado (exclui preparação)
+    return {
+        "ops": len(latencies),
+        "errors": errors[0],
+        "throughput_per_s": round(len(latencies) / measured[0], 1),
+        "p50_ms": round(_percentile(latencies, 50), 3),
+        "p95_ms": round(_percentile(latencies, 95), 3),
+        "p99_ms": round(_percentile(latencies, 99), 3),
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any],
+            max_regression: float) -> List[str]:
+    """Cenários que pioraram além da tolerância em relação à baseline."""
+    regressions = []
+    for name, base in baseline.get("results", {}).items():
+        now = current["results"].get(name)
+        if now is None:
+            continue
+        if now["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+            regressions.append(
+                f"{name}: p95 {base['p95_ms']} -> {now['p95_ms']} ms")
+        if now["throughput_per_s"] < base["throughput_per_s"] * (1 - max_regression):
+            regressions.append(
+                f"{name}: vazão {base['throughput_per_s']} -> "
+                f"{now['throughput_per_s']}/s")
+    return regressions
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--transport", choices=("client", "wsgi"),
+                        default="client")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="latência (s) do Keycloak falso")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS),
+                        default=list(SCENARIOS))
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    args = parser.parse_args()
+
+    with FakeOIDCServer(latency=args.latency) as oidc:
+        suite = Suite(oidc, args.transport)
+        try:
+            results = {
+                name: run_scenario(suite, SCENARIOS[name], args.iterations,
+                                   args.concurrency)
+                for name in args.scenarios
+            }
+        finally:
+            suite.close()
+        upstream = dict(oidc.calls)
+
+    report = {
+        "meta": {
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "transport": args.transport,
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "keycloak_latency_s": args.latency,
+            "timestamp": int(time.time()),
+        },
+        "results": results,
+        "upstream_calls": upstream,
+    }
+    if args.baseline:
+        with open(args.baseline) as fh:
+            report["regressions"] = compare(report, json.load(fh),
+                                            args.max_regression)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    if report.get("regressions") or any(r["errors"] for r in results.values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Exercita o transporte do Keycloak (auth.transport) contra um servidor
+falso lento ou falhando: timeouts, circuit breaker e bulkhead.
+
+Sai com código 1 se o timeout não cortar a chamada ou deixar vaga presa,
+se o circuito não abrir depois de `failure_threshold` falhas e ficar
+meio-aberto depois do `reset_timeout`, se um 4xx for repetido, se o
+bulkhead deixar passar mais que `max_in_flight`, se corrotinas perderem
+vagas para threads ou se uma chamada de teste do meio-aberto cancelada
+deixar o circuito travado.
+
+Uso:
+    python -m bench.transport_faults
+"""
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+import requests
+
+from auth.transport import (
+    CircuitBreaker,
+    KeycloakGateway,
+    KeycloakUnavailableError,
+    build_keycloak_client,
+)
+from bench.fake_oidc import BAD_PASSWORD, FakeOIDCServer
+from config import Config
+
+
+def _check(failures: List[str], condition: bool, message: str) -> None:
+    if not condition:
+        failures.append(message)
+
+
+def _client(server: FakeOIDCServer):
+    Config.KEYCLOAK_SERVER_URL = server.url
+    Config.KEYCLOAK_REALM_NAME = server.realm
+    Config.KEYCLOAK_CLIENT_ID = "bench"
+    Config.KEYCLOAK_CLIENT_SECRET_KEY = "bench"
+    Config.KEYCLOAK_CONNECT_TIMEOUT = 0.5
+    Config.KEYCLOAK_READ_TIMEOUT = 0.5
+    return build_keycloak_client()
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    try:
+        fn()
+        outcome = "ok"
+    except KeycloakUnavailableError:
+        outcome = "unavailable"
+    except Exception as exc:
+        outcome = type(exc).__name__
+    return outcome, round((time.perf_counter() - start) * 1000, 1)
+
+
+def slow_server(server: FakeOIDCServer, failures: List[str]) -> dict:
+    """Keycloak travado: a chamada desiste no read timeout, sem retry no POST."""
+    client = _client(server)
+    gateway = KeycloakGateway(CircuitBreaker(), retries=2, backoff=0.05)
+    server.calls.clear()
+    # Latência injetada no endpoint: a chamada é contada antes do atraso
+    server.inject("password", status=None, latency=3.0)
+    outcome, elapsed = _timed(
+        lambda: gateway.call("token", client.token, "bench", "secret")
+    )
+    server.clear_faults()
+    read_timeout_ms = Config.KEYCLOAK_READ_TIMEOUT * 1000
+    _check(failures, outcome != "ok" and elapsed < read_timeout_ms * 2,
+           f"timeout: {outcome} em {elapsed} ms")
+    _check(failures, server.calls["password"] == 1,
+           f"POST repetido após timeout ({server.calls['password']} chamadas)")
+    _check(failures, gateway.bulkhead.in_use == 0,
+           f"timeout deixou {gateway.bulkhead.in_use} vaga(s) presa(s)")
+    return {"outcome": outcome, "elapsed_ms": elapsed,
+            "read_timeout_ms": read_timeout_ms,
+            "upstream_calls": server.calls["password"],
+            "slots_in_use_after": gateway.bulkhead.in_use}
+
+
+def failing_server(server: FakeOIDCServer, failures: List[str]) -> dict:
+    """Keycloak com 503: o circuito abre e as chamadas seguintes falham rápido."""
+    client = _client(server)
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.5)
+    gateway = KeycloakGateway(breaker, retries=0)
+    server.calls.clear()
+    server.fail_status = 503
+    outcomes = [_timed(lambda: gateway.call("certs", client.certs,
+                                            idempotent=True))
+                for _ in range(20)]
+    upstream_while_failing = sum(server.calls.values())
+    state_while_failing = breaker.state
+
+    server.fail_status = None
+    time.sleep(breaker.reset_timeout)
+    state_after_reset = breaker.state
+    recovery = _timed(lambda: gateway.call("certs", client.certs,
+                                           idempotent=True))
+    _check(failures, upstream_while_failing == breaker.failure_threshold,
+           f"circuito abriu depois de {upstream_while_failing} chamadas"
+           f" (limite {breaker.failure_threshold})")
+    _check(failures, state_while_failing == "open", "circuito não abriu")
+    _check(failures, state_after_reset == "half-open",
+           f"depois do reset_timeout o circuito ficou {state_after_reset}")
+    _check(failures, recovery[0] == "ok" and breaker.state == "closed",
+           "circuito não fechou depois da chamada de teste")
+    return {
+        "calls": len(outcomes),
+        "upstream_calls": upstream_while_failing,
+        "fast_failures": sum(1 for o, _ in outcomes if o == "unavailable"),
+        "max_fast_failure_ms": max(ms for o, ms in outcomes if o == "unavailable"),
+        "state_while_failing": state_while_failing,
+        "state_after_reset_timeout": state_after_reset,
+        "recovery": recovery[0],
+        "state_after_recovery": breaker.state,
+    }
+
+
+def no_retry_on_4xx(server: FakeOIDCServer, failures: List[str]) -> dict:
+    """Senha errada (401): nem as operações idempotentes são repetidas."""
+    client = _client(server)
+    breaker = CircuitBreaker()
+    gateway = KeycloakGateway(breaker, retries=2, backoff=0.01)
+    server.calls.clear()
+    outcome, elapsed = _timed(lambda: gateway.call(
+        "token", client.token, "bench", BAD_PASSWORD, idempotent=True))
+    _check(failures, server.calls["password"] == 1,
+           f"4xx repetido ({server.calls['password']} chamadas)")
+    _check(failures, breaker.state == "closed", "4xx abriu o circuito")
+    return {"outcome": outcome, "upstream_calls": server.calls["password"],
+            "state": breaker.state}
+
+
+def bulkhead(server: FakeOIDCServer, failures: List[str]) -> dict:
+    """Com 2 vagas e 16 chamadas simultâneas, o excedente é recusado localmente."""
+    client = _client(server)
+    gateway = KeycloakGateway(CircuitBreaker(), max_in_flight=2,
+                              bulkhead_timeout=0.05)
+    server.calls.clear()
+    server.latency = 0.3
+    in_flight = {"now": 0, "max": 0}
+    lock = threading.Lock()
+
+    def certs():
+        with lock:
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        try:
+            return client.certs()
+        finally:
+            with lock:
+                in_flight["now"] -= 1
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        outcomes = list(pool.map(
+            lambda _: _timed(lambda: gateway.call("certs", certs,
+                                                  idempotent=True)),
+            range(16),
+        ))
+    server.latency = 0.0
+    rejected = sum(1 for o, _ in outcomes if o == "unavailable")
+    _check(failures, in_flight["max"] <= 2,
+           f"{in_flight['max']} chamadas simultâneas com 2 vagas")
+    _check(failures, rejected == len(outcomes) - server.calls["certs"] and rejected > 0,
+           f"{rejected} recusadas, {server.calls['certs']} chegaram ao servidor")
+    _check(failures, gateway.bulkhead.in_use == 0,
+           f"bulkhead ficou com {gateway.bulkhead.in_use} vaga(s) presa(s)")
+    return {
+        "calls": len(outcomes),
+        "rejected": rejected,
+        "upstream_calls": server.calls["certs"],
+        "max_in_flight_observed": in_flight["max"],
+    }
+
+
+def bulkhead_fairness(failures: List[str]) -> dict:
+    """
+    Threads e corrotinas disputando 2 vagas (0.05 s cada), com folga de
+    sobra no `bulkhead_timeout`: ninguém pode ser recusado.
+    """
+    gateway = KeycloakGateway(CircuitBreaker(), max_in_flight=2,
+                              bulkhead_timeout=2.0)
+    outcomes: Dict[str, List[str]] = {"thread": [], "coroutine": []}
+
+    def threads() -> None:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            outcomes["thread"] = [o for o, _ in pool.map(
+                lambda _: _timed(lambda: gateway.call("x", time.sleep, 0.05)),
+                range(8))]
+
+    async def coroutines() -> None:
+        async def one() -> str:
+            try:
+                await gateway.acall("x", asyncio.sleep, 0.05)
+                return "ok"
+            except KeycloakUnavailableError:
+                return "unavailable"
+        outcomes["coroutine"] = list(await asyncio.gather(*(one() for _ in range(8))))
+
+    worker = threading.Thread(target=threads)
+    worker.start()
+    asyncio.run(coroutines())
+    worker.join()
+    report = {kind: {"ok": items.count("ok"), "rejected": len(items) - items.count("ok")}
+              for kind, items in outcomes.items()}
+    _check(failures, all(r["rejected"] == 0 for r in report.values()),
+           f"bulkhead recusou com folga no timeout: {report}")
+    return report
+
+
+def cancelled_probe(failures: List[str]) -> dict:
+    """
+    A chamada de teste do meio-aberto é cancelada (cliente ASGI
+    desconectou) ou interrompida (SystemExit): o circuito não pode ficar
+    preso recusando tudo.
+    """
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+    gateway = KeycloakGateway(breaker, retries=0)
+
+    def fail() -> None:
+        raise requests.ConnectionError("fora do ar")
+
+    def exit_worker() -> None:
+        raise SystemExit(1)
+
+    async def cancel_probe() -> None:
+        task = asyncio.ensure_future(gateway.acall("x", asyncio.sleep, 5))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    report = {}
+    for name in ("cancelled", "system_exit"):
+        _timed(lambda: gateway.call("x", fail))
+        time.sleep(breaker.reset_timeout)
+        if name == "cancelled":
+            asyncio.run(cancel_probe())
+        else:
+            try:
+                gateway.call("x", exit_worker)
+            except SystemExit:
+                pass
+        outcome, _ = _timed(lambda: gateway.call("x", lambda: None))
+        report[name] = {"next_call": outcome, "state": breaker.state,
+                        "slots_in_use": gateway.bulkhead.in_use}
+        _check(failures, outcome == "ok" and breaker.state == "closed",
+               f"{name}: depois da chamada de teste interrompida veio {outcome}"
+               f" ({breaker.state})")
+        _check(failures, gateway.bulkhead.in_use == 0,
+               f"{name}: vaga do bulkhead presa")
+    return report
+
+
+def main() -> None:
+    failures: List[str] = []
+    report: Dict[str, Any] = {}
+    with FakeOIDCServer() as server:
+        report["slow_server"] = slow_server(server, failures)
+        report["failing_server"] = failing_server(server, failures)
+        report["no_retry_on_4xx"] = no_retry_on_4xx(server, failures)
+        report["bulkhead"] = bulkhead(server, failures)
+    report["bulkhead_fairness"] = bulkhead_fairness(failures)
+    report["cancelled_probe"] = cancelled_probe(failures)
+    report["failures"] = failures
+    print(json.dumps(report, indent=2))
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
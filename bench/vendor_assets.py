@@ -0,0 +1,139 @@
+"""
+Confere o build e a rota de assets de terceiros (static_assets): nomes com
+hash, `url()` reescritas no CSS, variantes br/gzip escolhidas pelo
+`Accept-Encoding`, cache imutável, 304 por ETag e bytes economizados.
+
+Usa `vendor/` se já tiver sido baixado; senão, gera arquivos sintéticos
+com a mesma estrutura (CSS com fontes relativas e JS minificado).
+
+Uso:
+    python -m bench.vendor_assets
+"""
+import gzip
+import json
+import os
+import re
+import tempfile
+
+from flask import Flask
+
+import static_assets
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+_PREFIX = "/home/vendor/"
+
+
+def _synthetic_vendor(vendor_dir: str) -> None:
+    js = b"!function(t,e){'use strict';var n=function(t){return t};" * 800
+    css = (
+        "@font-face{font-family:boxicons;"
+        "src:url(../fonts/boxicons.eot);"
+        "src:url(../fonts/boxicons.woff2) format('woff2'),"
+        "url('../fonts/boxicons.svg?#boxicons') format('svg')}"
+        + ".bx{font-family:boxicons!important;display:inline-block}" * 400
+    ).encode()
+    files = {
+        "boxicons/css/boxicons.min.css": css,
+        "boxicons/fonts/boxicons.eot": os.urandom(4096),
+        "boxicons/fonts/boxicons.woff2": os.urandom(4096),
+        "boxicons/fonts/boxicons.svg": b"<svg><glyph d='M0 0h1'/></svg>" * 300,
+    }
+    for asset in static_assets.VENDOR_ASSETS:
+        files.setdefault(asset["path"], js)
+    for rel, content in files.items():
+        path = os.path.join(vendor_dir, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as fh:
+            fh.write(content)
+
+
+def _check(failures: list, condition: bool, message: str) -> None:
+    if not condition:
+        failures.append(message)
+
+
+def main() -> None:
+    failures: list = []
+    with tempfile.TemporaryDirectory() as tmp:
+        vendor_dir = static_assets.VENDOR_DIR
+        synthetic = not os.path.isdir(vendor_dir)
+        if synthetic:
+            vendor_dir = os.path.join(tmp, "vendor")
+            _synthetic_vendor(vendor_dir)
+        build_dir = os.path.join(tmp, "build")
+        manifest = static_assets.build(vendor_dir, build_dir)
+
+        server = Flask(__name__)
+        static_assets.register_vendor_route(server, _PREFIX, build_dir)
+        client = server.test_client()
+        stylesheets, scripts = static_assets.vendor_urls(_PREFIX, manifest)
+        _check(failures, len(stylesheets) == 1 and len(scripts) == 3,
+               f"URLs inesperadas: {stylesheets} {scripts}")
+
+        css_name = manifest["assets"][0]["file"]
+        with open(os.path.join(build_dir, css_name)) as fh:
+            css = fh.read()
+        refs = re.findall(r"url\(['\"]?([^'\")?#]+)", css)
+        _check(failures, bool(refs) and all(r in manifest["files"] for r in refs),
+               f"url() não reescritas no CSS: {refs}")
+        for ref in refs:
+            _check(failures, client.get(_PREFIX + ref).status_code == 200,
+                   f"fonte {ref} não servida")
+
+        url = stylesheets[0]
+        with open(os.path.join(build_dir, css_name), "rb") as fh:
+            identity = fh.read()
+        encodings = {}
+        for accept, expected in (("br, gzip", "br" if brotli else "gzip"),
+                                 ("gzip", "gzip"), ("", None)):
+            resp = client.get(url, headers={"Accept-Encoding": accept})
+            body = resp.get_data()
+            if expected == "br":
+                body = brotli.decompress(body)
+            elif expected == "gzip":
+                body = gzip.decompress(body)
+            encodings[accept or "identity"] = resp.headers.get("Content-Encoding")
+            _check(failures, resp.headers.get("Content-Encoding") == expected,
+                   f"Accept-Encoding={accept!r}: "
+                   f"{resp.headers.get('Content-Encoding')} != {expected}")
+            _check(failures, body == identity,
+                   f"Accept-Encoding={accept!r}: conteúdo diferente")
+            _check(failures, "immutable" in resp.headers.get("Cache-Control", ""),
+                   "Cache-Control sem immutable")
+            _check(failures, "Accept-Encoding" in resp.headers.get("Vary", ""),
+                   "Vary sem Accept-Encoding")
+
+        etag = client.get(url).headers["ETag"]
+        revalidated = client.get(url, headers={"If-None-Match": etag})
+        _check(failures, revalidated.status_code == 304, "sem 304 por ETag")
+        _check(failures, client.get(_PREFIX + "nao-existe.js").status_code == 404,
+               "arquivo fora do manifesto não deu 404")
+
+        totals = {"identity": 0, "gzip": 0, "br": 0}
+        for sizes in manifest["files"].values():
+            for key in totals:
+                totals[key] += sizes.get(key, sizes["identity"])
+        _check(failures, totals["gzip"] < totals["identity"],
+               "gzip não reduziu o total")
+
+    print(json.dumps({
+        "source": "synthetic" if synthetic else "vendor/",
+        "files": len(manifest["files"]),
+        "encodings": encodings,
+        "total_bytes": totals,
+        "saved_pct": {
+            key: round(100 * (1 - totals[key] / totals["identity"]), 1)
+            for key in ("gzip", "br")
+        },
+        "failures": failures,
+    }, indent=2))
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,6 @@
 """Registro de callbacks globais."""
 import auth.auth
+from config import Config
+
+if Config.AUTH_ASYNC:
+    import auth.auth_async
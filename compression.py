@@ -0,0 +1,336 @@
+"""
+Compressão das respostas HTTP e ETags fortes para o JSON do Dash.
+
+`install_compression` envolve o `wsgi_app` do Flask: escolhe br (se o
+pacote `brotli` estiver instalado) ou gzip pelo `Accept-Encoding` e
+comprime o corpo pedaço a pedaço, sem juntar a resposta na memória.
+Respostas sem `Content-Length` (geradores) recebem um flush por pedaço,
+para que cada parte chegue ao cliente sem esperar a próxima. Ficam de
+fora:
+
+- respostas menores que `Config.COMPRESSION_MIN_SIZE` (cabeçalho e CPU
+  não compensam);
+- tipos já comprimidos (imagens, woff2) e respostas que já têm
+  `Content-Encoding`, como as variantes pré-comprimidas de `static_assets`;
+- HEAD, 204, 206, 304 e `Cache-Control: no-transform`.
+
+Respostas com cache longo (os bundles do Dash, com a versão na URL) são
+comprimidas uma vez, no nível mais alto, e reaproveitadas até
+`Config.COMPRESSION_CACHE_BYTES`; as demais usam um nível rápido.
+
+Uma ETag forte identifica a representação, então a versão comprimida
+recebe o sufixo da codificação (`"abc-br"`). No `If-None-Match` o sufixo é
+retirado antes de chegar ao Flask e devolvido no 304.
+
+`install_etags` calcula ETags fortes (hash do corpo) para endpoints
+escolhidos, como `_dash-layout` e `_dash-dependencies`, e responde 304
+quando o navegador já tem a mesma versão.
+"""
+import hashlib
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from itertools import chain
+from typing import Any, Callable, Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+from flask import Flask, Response, request
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+
+from config import Config
+from metrics import REGISTRY
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele só gzip
+    brotli = None
+
+COMPRESSED_BYTES = REGISTRY.counter(
+    "http_compression_bytes_total",
+    "Bytes das respostas comprimidas, antes (in) e depois (out).",
+    ("encoding", "stage"),
+)
+NOT_MODIFIED = REGISTRY.counter(
+    "http_not_modified_total",
+    "Respostas 304 de endpoints com ETag (install_etags).",
+    ("endpoint",),
+)
+
+_COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/x-javascript",
+    "application/xml",
+    "application/manifest+json",
+    "image/svg+xml",
+)
+_SKIP_STATUS = (204, 206, 304)
+# Nível rápido a cada requisição; nível alto para o que fica em cache
+_LEVELS = {"gzip": (6, 9), "br": (4, 9)}
+_LONG_CACHE = 24 * 3600
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+_ETAG_SUFFIX = re.compile(r'"([^"]*)-(br|gzip)"')
+
+
+def available_encodings() -> Tuple[str, ...]:
+    """Codificações suportadas, da preferida para a menos preferida."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding: Optional[str],
+              encodings: Optional[Iterable[str]] = None) -> Optional[str]:
+    """
+    Codificação para um `Accept-Encoding`, ou None (sem compressão).
+
+    :param encodings: Candidatas em ordem de preferência (padrão:
+        `available_encodings()`). Vale a maior qualidade; no empate, a ordem.
+    """
+    accepted = parse_accept_header(accept_encoding)
+    best, best_quality = None, 0.0
+    for encoding in encodings or available_encodings():
+        quality = accepted[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class _Codec(NamedTuple):
+    compress: Callable[[bytes], bytes]
+    flush: Callable[[], bytes]
+    finish: Callable[[], bytes]
+
+
+def _codec(encoding: str, best: bool = False) -> _Codec:
+    level = _LEVELS[encoding][best]
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=level)
+        return _Codec(compressor.process, compressor.flush, compressor.finish)
+    # wbits 31: formato gzip (cabeçalho + CRC), não zlib puro
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return _Codec(compressor.compress,
+                  lambda: compressor.flush(zlib.Z_SYNC_FLUSH),
+                  compressor.flush)
+
+
+def compress(data: bytes, encoding: str, best: bool = False) -> bytes:
+    """Comprime `data` de uma vez (gzip ou br)."""
+    codec = _codec(encoding, best)
+    return codec.compress(data) + codec.finish()
+
+
+class _CompressedCache:
+    """Corpos comprimidos de respostas imutáveis, em LRU limitado por bytes."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Optional[bytes]:
+        with self._lock:
+            body = self._items.get(key)
+            if body is not None:
+                self._items.move_to_end(key)
+            return body
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+    def put(self, key: Tuple, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                return
+            self._items[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, old = self._items.popitem(last=False)
+                self._size -= len(old)
+
+
+def _compressible(code: int, headers: Headers, min_size: int) -> bool:
+    if code < 200 or code in _SKIP_STATUS:
+        return False
+    if "Content-Encoding" in headers:
+        return False
+    if "no-transform" in headers.get("Cache-Control", ""):
+        return False
+    mimetype = headers.get("Content-Type", "").split(";", 1)[0].strip().lower()
+    if not mimetype.startswith(_COMPRESSIBLE_TYPES):
+        return False
+    length = headers.get("Content-Length")
+    return length is None or int(length) >= min_size
+
+
+def _long_cached(headers: Headers) -> bool:
+    match = _MAX_AGE.search(headers.get("Cache-Control", ""))
+    return (match is not None and int(match.group(1)) >= _LONG_CACHE
+            and "Content-Length" in headers)
+
+
+def _tag_etag(headers: Headers, encoding: str) -> None:
+    etag = headers.get("ETag")
+    # ETag fraca vale para representações equivalentes: fica como está
+    if etag and etag.startswith('"'):
+        headers["ETag"] = f'"{etag[1:-1]}-{encoding}"'
+
+
+def _add_vary(headers: Headers) -> None:
+    vary = [v.strip() for v in headers.get("Vary", "").split(",") if v.strip()]
+    if "accept-encoding" not in (v.lower() for v in vary):
+        vary.append("Accept-Encoding")
+    headers["Vary"] = ", ".join(vary)
+
+
+class CompressionMiddleware:
+    """
+    Middleware WSGI que comprime as respostas conforme o `Accept-Encoding`.
+
+    :param app: Aplicação WSGI envolvida.
+    :param min_size: Tamanho mínimo (bytes) para comprimir.
+    :param cache_bytes: Limite do cache de respostas imutáveis (0 desliga).
+    """
+
+    def __init__(self, app: Callable, min_size: int, cache_bytes: int) -> None:
+        self.app = app
+        self.min_size = min_size
+        self.cache = _CompressedCache(cache_bytes) if cache_bytes > 0 else None
+
+    def __call__(self, environ: Dict[str, Any], start_response: Callable) -> Iterable[bytes]:
+        encoding = None
+        if environ.get("REQUEST_METHOD") != "HEAD":
+            encoding = negotiate(environ.get("HTTP_ACCEPT_ENCODING"))
+
+        # Validador de uma versão comprimida: o Flask só conhece a ETag original
+        etag_suffix = None
+        if_none_match = environ.get("HTTP_IF_NONE_MATCH")
+        if if_none_match:
+            match = _ETAG_SUFFIX.search(if_none_match)
+            if match:
+                etag_suffix = match.group(2)
+                environ["HTTP_IF_NONE_MATCH"] = _ETAG_SUFFIX.sub(r'"\1"', if_none_match)
+
+        if encoding is None and etag_suffix is None:
+            return self.app(environ, start_response)
+
+        state: Dict[str, Any] = {}
+
+        def start(status: str, headers: Any, exc_info: Any = None) -> Callable:
+            state["started"] = True
+            code = int(status.split(" ", 1)[0])
+            headers = Headers(headers)
+            if code == 304 and etag_suffix:
+                _tag_etag(headers, etag_suffix)
+                _add_vary(headers)
+            elif encoding and _compressible(code, headers, self.min_size):
+                key = None
+                if self.cache is not None and _long_cached(headers):
+                    key = (environ.get("PATH_INFO"), environ.get("QUERY_STRING"),
+                           encoding, headers["Content-Length"], headers.get("ETag"))
+                    state["cached"] = self.cache.get(key)
+                state.update(encoding=encoding, key=key,
+                             streaming="Content-Length" not in headers)
+                headers["Content-Encoding"] = encoding
+                _tag_etag(headers, encoding)
+                _add_vary(headers)
+                if state.get("cached") is not None:
+                    headers["Content-Length"] = str(len(state["cached"]))
+                else:
+                    headers.remove("Content-Length")
+            return start_response(status, headers.to_wsgi_list(), exc_info)
+
+        app_iter = self.app(environ, start)
+        if "started" in state and "encoding" not in state:
+            return app_iter  # nada a comprimir: preserva o file_wrapper
+        return self._body(app_iter, state)
+
+    def _body(self, app_iter: Iterable[bytes], state: Dict[str, Any]) -> Iterator[bytes]:
+        try:
+            chunks = iter(app_iter)
+            # Em apps geradores o start_response só vem com o primeiro pedaço
+            first = next(chunks, None)
+            body = chain([] if first is None else [first], chunks)
+            if "encoding" not in state:
+                yield from body
+            elif state.get("cached") is not None:
+                yield state["cached"]
+            else:
+                yield from self._encode(body, state)
+        finally:
+            close = getattr(app_iter, "close", None)
+            if close is not None:
+                close()
+
+    def _encode(self, body: Iterator[bytes], state: Dict[str, Any]) -> Iterator[bytes]:
+        encoding, key = state["encoding"], state["key"]
+        codec = _codec(encoding, best=key is not None)
+        kept = []
+        size_in = size_out = 0
+        for chunk in body:
+            size_in += len(chunk)
+            out = codec.compress(chunk)
+            if state["streaming"]:
+                out += codec.flush()
+            if out:
+                size_out += len(out)
+                if key is not None:
+                    kept.append(out)
+                yield out
+        out = codec.finish()
+        size_out += len(out)
+        COMPRESSED_BYTES.inc(size_in, encoding=encoding, stage="in")
+        COMPRESSED_BYTES.inc(size_out, encoding=encoding, stage="out")
+        if key is not None:
+            kept.append(out)
+            self.cache.put(key, b"".join(kept))
+        yield out
+
+
+def install_compression(server: Flask, min_size: Optional[int] = None,
+                        cache_bytes: Optional[int] = None) -> CompressionMiddleware:
+    """
+    Comprime as respostas de `server` (br/gzip, conforme o cliente).
+
+    :param min_size: Tamanho mínimo; padrão `Config.COMPRESSION_MIN_SIZE`.
+    :param cache_bytes: Cache das respostas imutáveis; padrão
+        `Config.COMPRESSION_CACHE_BYTES`.
+    """
+    middleware = CompressionMiddleware(
+        server.wsgi_app,
+        Config.COMPRESSION_MIN_SIZE if min_size is None else min_size,
+        Config.COMPRESSION_CACHE_BYTES if cache_bytes is None else cache_bytes,
+    )
+    server.wsgi_app = middleware
+    return middleware
+
+
+def install_etags(server: Flask, endpoints: Iterable[str]) -> None:
+    """
+    ETag forte (hash do corpo) e 304 condicional nos `endpoints`.
+
+    As respostas saem com `no-cache`: o navegador revalida a cada carga e,
+    se nada mudou, recebe um 304 sem corpo em vez do JSON inteiro.
+
+    :param endpoints: Nomes de endpoint do Flask (no Dash, o caminho
+        completo, como `/home/_dash-layout`).
+    """
+    endpoints = frozenset(endpoints)
+
+    @server.after_request
+    def _conditional(response: Response) -> Response:
+        if (request.endpoint not in endpoints or response.status_code != 200
+                or request.method not in ("GET", "HEAD") or response.is_streamed):
+            return response
+        response.set_etag(hashlib.sha256(response.get_data()).hexdigest()[:32])
+        # O layout pode depender do usuário: só o cache do navegador guarda
+        response.headers["Cache-Control"] = "private, no-cache"
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            NOT_MODIFIED.inc(endpoint=request.endpoint)
+        return response
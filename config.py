@@ -18,3 +18,133 @@ class Config:
     KEYCLOAK_REALM_NAME = os.getenv("KEYCLOAK_REALM_NAME")
     KEYCLOAK_CLIENT_SECRET_KEY = os.getenv("KEYCLOAK_CLIENT_SECRET_KEY")
     ROOT_PATH_PREFIX = os.getenv("ROOT_PATH_PREFIX")
+
+    # Verificação local de tokens (JWKS)
+    KEYCLOAK_AUDIENCE = os.getenv("KEYCLOAK_AUDIENCE")
+    JWKS_MIN_REFRESH_INTERVAL: float = float(
+        os.getenv("JWKS_MIN_REFRESH_INTERVAL", "30"))
+    JWT_LEEWAY: int = int(os.getenv("JWT_LEEWAY", "10"))
+    # Claims já verificadas lembradas por token (auth.context)
+    CLAIMS_CACHE_SIZE: int = int(os.getenv("CLAIMS_CACHE_SIZE", "1024"))
+
+    # Política de rotas (ver auth.route_policy): "prefixo=papel,papel"
+    # separados por ";"; "public" libera o prefixo, sem papéis basta login
+    ROUTE_RULES: str = os.getenv("ROUTE_RULES", "")
+
+    # Chave de assinatura das sessões (ver auth.secret_key)
+    SECRET_KEY: str = os.getenv("SECRET_KEY", "")
+    SECRET_KEY_FALLBACKS: str = os.getenv("SECRET_KEY_FALLBACKS", "")
+    SECRET_KEY_FILE: str = os.getenv("SECRET_KEY_FILE", "")
+    # Proxies reversos confiáveis à frente do app (X-Forwarded-For/-Proto)
+    TRUSTED_PROXIES: int = int(os.getenv("TRUSTED_PROXIES", "0"))
+
+    # Sessão no servidor: "memory", "sqlite" ou "cookie" (sessão padrão do Flask)
+    SESSION_BACKEND: str = os.getenv("SESSION_BACKEND", "memory")
+    SESSION_SQLITE_PATH: str = os.getenv("SESSION_SQLITE_PATH", "sessions.db")
+    SESSION_MAX_ENTRIES: int = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+    SESSION_DEFAULT_TTL: int = int(os.getenv("SESSION_DEFAULT_TTL", "1800"))
+
+    # Refresh single-flight; diretório compartilhado entre workers (opcional)
+    REFRESH_COORDINATION_DIR: str = os.getenv("REFRESH_COORDINATION_DIR", "")
+    REFRESH_RESULT_TTL: float = float(os.getenv("REFRESH_RESULT_TTL", "60"))
+
+    # Callbacks de login/logout/refresh assíncronos (requer asgiref)
+    AUTH_ASYNC: bool = os.getenv("AUTH_ASYNC", "false").lower() in ("1", "true", "yes")
+    ASGI_THREADS: int = int(os.getenv("ASGI_THREADS", "64"))
+
+    # Transporte HTTP para o Keycloak
+    KEYCLOAK_CONNECT_TIMEOUT: float = float(os.getenv("KEYCLOAK_CONNECT_TIMEOUT", "3"))
+    KEYCLOAK_READ_TIMEOUT: float = float(os.getenv("KEYCLOAK_READ_TIMEOUT", "10"))
+    KEYCLOAK_POOL_MAXSIZE: int = int(os.getenv("KEYCLOAK_POOL_MAXSIZE", "20"))
+    KEYCLOAK_MAX_IN_FLIGHT: int = int(os.getenv("KEYCLOAK_MAX_IN_FLIGHT", "20"))
+    KEYCLOAK_BULKHEAD_TIMEOUT: float = float(os.getenv("KEYCLOAK_BULKHEAD_TIMEOUT", "2"))
+    KEYCLOAK_RETRIES: int = int(os.getenv("KEYCLOAK_RETRIES", "2"))
+    KEYCLOAK_RETRY_BACKOFF: float = float(os.getenv("KEYCLOAK_RETRY_BACKOFF", "0.2"))
+    KEYCLOAK_BREAKER_THRESHOLD: int = int(os.getenv("KEYCLOAK_BREAKER_THRESHOLD", "5"))
+    KEYCLOAK_BREAKER_RESET: float = float(os.getenv("KEYCLOAK_BREAKER_RESET", "30"))
+    # Modo degradado: com o Keycloak fora do ar, sessões seguem válidas por
+    # até KEYCLOAK_OUTAGE_GRACE s depois do vencimento do access_token (0
+    # desliga) e o refresh é retentado com backoff exponencial e jitter
+    KEYCLOAK_OUTAGE_GRACE: int = int(os.getenv("KEYCLOAK_OUTAGE_GRACE", "900"))
+    KEYCLOAK_OUTAGE_RETRY_BASE: int = int(os.getenv("KEYCLOAK_OUTAGE_RETRY_BASE", "10"))
+    KEYCLOAK_OUTAGE_RETRY_MAX: int = int(os.getenv("KEYCLOAK_OUTAGE_RETRY_MAX", "120"))
+
+    # Limite de tentativas de login (token bucket por IP e por usuário)
+    # Backend: "memory", "sqlite" (compartilhado entre workers) ou "off"
+    LOGIN_THROTTLE_BACKEND: str = os.getenv("LOGIN_THROTTLE_BACKEND", "memory")
+    LOGIN_THROTTLE_SQLITE_PATH: str = os.getenv("LOGIN_THROTTLE_SQLITE_PATH", "throttle.db")
+    LOGIN_IP_BURST: float = float(os.getenv("LOGIN_IP_BURST", "20"))
+    LOGIN_IP_PER_MINUTE: float = float(os.getenv("LOGIN_IP_PER_MINUTE", "20"))
+    LOGIN_USER_BURST: float = float(os.getenv("LOGIN_USER_BURST", "5"))
+    LOGIN_USER_PER_MINUTE: float = float(os.getenv("LOGIN_USER_PER_MINUTE", "5"))
+
+    # Métricas Prometheus em /metrics; com token, exige "Authorization: Bearer"
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
+
+    # Revogação do refresh token no logout, em segundo plano
+    REVOCATION_QUEUE_SIZE: int = int(os.getenv("REVOCATION_QUEUE_SIZE", "1000"))
+    REVOCATION_WORKERS: int = int(os.getenv("REVOCATION_WORKERS", "2"))
+    REVOCATION_MAX_ATTEMPTS: int = int(os.getenv("REVOCATION_MAX_ATTEMPTS", "5"))
+    REVOCATION_BACKOFF: float = float(os.getenv("REVOCATION_BACKOFF", "1"))
+    REVOCATION_DRAIN_TIMEOUT: float = float(os.getenv("REVOCATION_DRAIN_TIMEOUT", "5"))
+    # Refresh tokens mais velhos que isso já expiraram no Keycloak
+    REVOCATION_MAX_AGE: float = float(os.getenv("REVOCATION_MAX_AGE", "1800"))
+
+    # Compressão das respostas (br/gzip) e cache das versões comprimidas
+    # dos bundles do Dash (ver compression.py)
+    COMPRESSION_ENABLED: bool = os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+    COMPRESSION_MIN_SIZE: int = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+    COMPRESSION_CACHE_BYTES: int = int(os.getenv("COMPRESSION_CACHE_BYTES", str(16 * 1024 * 1024)))
+
+    # Discovery/JWKS do realm em cache, renovados em segundo plano antes de
+    # vencer (ver auth.oidc_metadata); /readyz falha sem renovação por
+    # mais de OIDC_METADATA_MAX_STALE
+    OIDC_METADATA_TTL: float = float(os.getenv("OIDC_METADATA_TTL", "300"))
+    OIDC_METADATA_MAX_STALE: float = float(os.getenv("OIDC_METADATA_MAX_STALE", "3600"))
+    # Espera pelo primeiro download ao subir cada worker do gunicorn
+    OIDC_WARM_TIMEOUT: float = float(os.getenv("OIDC_WARM_TIMEOUT", "10"))
+
+    # Logging (ver logging_setup): JSON ou texto, escrito por uma thread a
+    # partir de uma fila limitada (cheia, descarta); LOG_SAMPLE_RATES
+    # amostra eventos frequentes ("evento=fração,...")
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")
+    LOG_ASYNC: bool = os.getenv("LOG_ASYNC", "true").lower() in ("1", "true", "yes")
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    LOG_SAMPLE_RATES: str = os.getenv("LOG_SAMPLE_RATES", "auth.refresh_tick=0.01")
+
+    # Profiling sob demanda (ver profiling): liga no boot ou por
+    # POST /admin/profiling (papel PROFILING_ADMIN_ROLE); perfila a fração
+    # PROFILING_SAMPLE_RATE das requisições, com uma amostra de pilha a
+    # cada PROFILING_INTERVAL s
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+    PROFILING_SAMPLE_RATE: float = float(os.getenv("PROFILING_SAMPLE_RATE", "0.05"))
+    PROFILING_INTERVAL: float = float(os.getenv("PROFILING_INTERVAL", "0.005"))
+    PROFILING_ADMIN_ROLE: str = os.getenv("PROFILING_ADMIN_ROLE", "admin")
+
+    # Cliente das APIs protegidas (ver auth.api_client): conexões
+    # keep-alive por host, token da sessão renovado
+    # API_TOKEN_REFRESH_MARGIN s antes de vencer e lotes de chamadas em
+    # paralelo; o token só vai para o esquema e host de API_BASE_URL e
+    # para os de API_ALLOWED_HOSTS ("host:porta,..." em https;
+    # "http://host:porta" para aceitar http); com os dois vazios, nenhum
+    # host recebe o token
+    API_BASE_URL: str = os.getenv("API_BASE_URL", "")
+    API_ALLOWED_HOSTS: str = os.getenv("API_ALLOWED_HOSTS", "")
+    API_CONNECT_TIMEOUT: float = float(os.getenv("API_CONNECT_TIMEOUT", "3"))
+    API_READ_TIMEOUT: float = float(os.getenv("API_READ_TIMEOUT", "15"))
+    API_POOL_HOSTS: int = int(os.getenv("API_POOL_HOSTS", "10"))
+    API_POOL_MAXSIZE: int = int(os.getenv("API_POOL_MAXSIZE", "20"))
+    API_BATCH_WORKERS: int = int(os.getenv("API_BATCH_WORKERS", "8"))
+    API_TOKEN_REFRESH_MARGIN: int = int(os.getenv("API_TOKEN_REFRESH_MARGIN", "30"))
+
+    # Tokens de serviço (client credentials, ver auth.service_tokens): em
+    # cache por scope/audience até SERVICE_TOKEN_SKEW s antes de vencer e
+    # renovados em segundo plano depois da fração SERVICE_TOKEN_REFRESH_AHEAD
+    # da vida. Store: "memory" (por processo), "file" (diretório) ou
+    # "sqlite", os dois últimos compartilhados pelos workers da máquina
+    SERVICE_TOKEN_STORE: str = os.getenv("SERVICE_TOKEN_STORE", "memory")
+    SERVICE_TOKEN_STORE_PATH: str = os.getenv("SERVICE_TOKEN_STORE_PATH", "service_tokens.db")
+    SERVICE_TOKEN_SKEW: float = float(os.getenv("SERVICE_TOKEN_SKEW", "30"))
+    SERVICE_TOKEN_REFRESH_AHEAD: float = float(os.getenv("SERVICE_TOKEN_REFRESH_AHEAD", "0.75"))
@@ -0,0 +1,63 @@
+"""
+Configuração do gunicorn para produção.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+O app é importado uma vez no master (`preload_app`) e herdado pelos
+workers no fork: o boot do Dash acontece uma só vez e a memória do código
+é compartilhada. Um worker por núcleo, com threads para as esperas de I/O
+no Keycloak.
+
+Qualquer worker precisa atender qualquer sessão, então os padrões daqui
+trocam os backends em memória por arquivos compartilhados: sessões e
+limite de login em SQLite e a chave de assinatura em `SECRET_KEY_FILE`
+(ver auth.secret_key). Variáveis de ambiente e o `.env` continuam
+mandando.
+
+Com `AUTH_ASYNC`, sirva `asgi:application` por um worker ASGI do uvicorn
+(`-k`), que sobe um event loop por processo.
+"""
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+
+# O .env vale antes dos padrões abaixo, como no app
+load_dotenv()
+os.environ.setdefault("SESSION_BACKEND", "sqlite")
+os.environ.setdefault("LOGIN_THROTTLE_BACKEND", "sqlite")
+os.environ.setdefault("SECRET_KEY_FILE", "secret_key")
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8052")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+# Tempo para a fila de revogação drenar no encerramento
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "15"))
+keepalive = 5
+
+
+def on_starting(server) -> None:
+    if workers < 2:
+        return
+    for name in ("SESSION_BACKEND", "LOGIN_THROTTLE_BACKEND"):
+        if os.environ[name].lower() == "memory":
+            server.log.warning(
+                "%s=memory com %d workers: cada worker terá o seu estado.",
+                name, workers,
+            )
+
+
+def post_fork(server, worker) -> None:
+    # Threads não atravessam o fork: cada worker aquece e renova o seu
+    # cache de discovery/JWKS antes de atender (o master não fala com o
+    # Keycloak, para o pool de conexões não ser herdado)
+    from auth.oidc_metadata import get_oidc_metadata
+    from config import Config
+    from logging_setup import start_logging
+
+    # A thread que escreve os logs também não veio com o fork
+    start_logging()
+    get_oidc_metadata().start(wait=Config.OIDC_WARM_TIMEOUT)
@@ -0,0 +1,40 @@
+"""
+Probes de liveness e readiness para o orquestrador (ex.: Kubernetes).
+
+- `/healthz`: o processo está de pé e atende requisições. Não olha
+  dependências, para o orquestrador não reiniciar o pod por causa de uma
+  queda do Keycloak;
+- `/readyz`: o processo pode receber tráfego. Responde 503 enquanto
+  `readiness` não estiver pronto, com o detalhe em JSON.
+
+Nenhum dos dois chama serviços externos: `readiness` deve ler estado já
+em memória (ver `auth.oidc_metadata.OIDCMetadata.status`), porque os
+probes rodam a cada poucos segundos em todos os pods.
+"""
+from typing import Any, Callable, Dict
+
+from flask import Flask, jsonify
+
+
+def install_health_routes(server: Flask,
+                          readiness: Callable[[], Dict[str, Any]],
+                          prefix: str = "") -> None:
+    """
+    Registra `/healthz` e `/readyz` em `server`.
+
+    :param readiness: Estado de prontidão; a chave "ready" decide o status.
+    :param prefix: Prefixo das rotas (padrão: raiz, como `/metrics`).
+    """
+
+    def healthz() -> Any:
+        return jsonify(status="ok")
+
+    def readyz() -> Any:
+        state = readiness()
+        response = jsonify(state)
+        response.status_code = 200 if state.get("ready") else 503
+        response.headers["Cache-Control"] = "no-store"
+        return response
+
+    server.add_url_rule(f"{prefix}/healthz", "healthz", healthz)
+    server.add_url_rule(f"{prefix}/readyz", "readyz", readyz)
@@ -1,9 +1,24 @@
+from functools import lru_cache
+
 import dash
 import dash_mantine_components as dmc
 
 
+@lru_cache(maxsize=None)
+def ensure_figure_templates() -> None:
+    """
+    Registra mantine_light e mantine_dark no plotly (requer dmc >= 0.15.1).
+
+    Feito no primeiro uso: importar o plotly e montar os templates custa
+    centenas de ms que não precisam pesar no boot do worker.
+    """
+    dmc.add_figure_templates()
+
+
 def layout_main():
 
+    ensure_figure_templates()
+
     return dmc.MantineProvider([
         dmc.Flex([
 
@@ -0,0 +1,96 @@
+"""Cache de layouts estáticos já serializados."""
+
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from dash._utils import to_json
+
+from config import Config
+from profiling import phase
+
+
+class CachedLayout(NamedTuple):
+    fingerprint: str
+    tree: Any
+
+
+def config_fingerprint(*extra: Any) -> str:
+    """
+    Impressão digital de `Config` (e de dados extras, como o tema).
+
+    Calculada uma vez por `LayoutCache`; depois de mudar atributos públicos
+    de `Config` ou `extra`, chame `LayoutCache.invalidate()`.
+    """
+    values = {
+        name: value for name, value in vars(Config).items()
+        if not name.startswith("_") and isinstance(value, (str, int, float, bool))
+    }
+    payload = json.dumps([values, extra], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+class LayoutCache:
+    """
+    Monta e serializa cada layout estático uma única vez.
+
+    `get` devolve a árvore já convertida para dicts/listas puros (o formato
+    que o Dash envia ao navegador), então o Dash não precisa percorrer os
+    componentes de novo a cada navegação. A árvore é compartilhada: quem a
+    recebe não deve alterá-la.
+
+    :param fingerprint: Função que identifica a configuração/tema atual.
+        É chamada no primeiro uso (ou em `warm_up`) e de novo só depois de
+        `invalidate()`, não a cada `get`.
+    """
+
+    def __init__(self, fingerprint: Callable[[], str] = config_fingerprint) -> None:
+        self._fingerprint = fingerprint
+        self._current: Optional[str] = None
+        self._builders: Dict[str, Callable[[], Any]] = {}
+        self._entries: Dict[str, CachedLayout] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, builder: Callable[[], Any]) -> None:
+        """Associa um nome a uma função que monta o layout."""
+        self._builders[name] = builder
+        self._entries.pop(name, None)
+
+    def _entry(self, name: str) -> CachedLayout:
+        entry = self._entries.get(name)
+        if entry is not None:
+            return entry
+        with self._lock:
+            if self._current is None:
+                self._current = self._fingerprint()
+            entry = self._entries.get(name)
+            if entry is None:
+                entry = CachedLayout(
+                    self._current, json.loads(to_json(self._builders[name]())))
+                self._entries[name] = entry
+        return entry
+
+    def get(self, name: str) -> Any:
+        """Layout `name` pronto para ser devolvido por um callback."""
+        with phase("layout"):
+            return self._entry(name).tree
+
+    def warm_up(self) -> None:
+        """Calcula a impressão digital e monta todos os layouts registrados."""
+        for name in list(self._builders):
+            self._entry(name)
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """
+        Descarta um layout (ou todos) para reconstruir no próximo uso.
+
+        Sem `name`, também recalcula a impressão digital: use depois de
+        mudar `Config` ou o tema.
+        """
+        with self._lock:
+            if name is None:
+                self._current = None
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
@@ -0,0 +1,242 @@
+"""
+Logging da aplicação fora do caminho das requisições.
+
+`setup_logging` troca os handlers do logger raiz por um `QueueHandler`:
+quem loga só amostra o registro, monta a mensagem e a põe numa fila; a
+escrita (JSON, uma linha por registro) acontece numa thread
+(`QueueListener`). Com o stdout lento (pipe cheio, coletor de logs
+atrasado), as requisições não esperam: a fila é limitada e, cheia,
+descarta o registro e conta em `log_records_dropped_total`.
+
+- Amostragem por evento: registros com `extra={"event": ...}` em
+  `Config.LOG_SAMPLE_RATES` (ex.: `auth.refresh_tick=0.01`) saem só nessa
+  fração, com `sample_rate` no JSON para reponderar contagens. WARNING ou
+  acima nunca são descartados.
+- Redação: JWTs, `Bearer ...`, pares `password=...`/`token: ...` na
+  mensagem e campos extras com nomes sensíveis viram `[REDACTED]` antes
+  de serem escritos, também no formato texto.
+
+Threads não atravessam o fork: `start` é idempotente por processo e o
+`post_fork` do gunicorn o chama em cada worker.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from config import Config
+from metrics import REGISTRY
+
+LOG_DROPPED = REGISTRY.counter(
+    "log_records_dropped_total",
+    "Registros de log descartados com a fila cheia.",
+)
+LOG_SAMPLED_OUT = REGISTRY.counter(
+    "log_records_sampled_out_total",
+    "Registros de log descartados pela amostragem, por evento.",
+    ("event",),
+)
+
+REDACTED = "[REDACTED]"
+_SENSITIVE_KEY = re.compile(
+    r"pass(word|wd)?|secret|token|authorization|cookie|credential", re.IGNORECASE,
+)
+_SECRET_PATTERNS = (
+    # JWT (cabeçalho base64url de um JSON sempre começa com "eyJ")
+    (re.compile(r"eyJ[\w-]*\.[\w-]*\.[\w-]*"), REDACTED),
+    (re.compile(r"(?i)\b(bearer|basic)\s+[\w.~+/-]+=*"), r"\1 " + REDACTED),
+    (re.compile(
+        r"""(?i)\b([\w-]*(?:password|passwd|secret|token))(["']?\s*[:=]\s*["']?)"""
+        r"""[^\s"'&,;}]+"""),
+     r"\1\2" + REDACTED),
+)
+# Atributos de todo LogRecord; o resto veio de `extra`
+_RECORD_ATTRS = frozenset(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+
+def redact_text(text: str) -> str:
+    """Troca tokens e senhas que aparecem em `text` por `[REDACTED]`."""
+    for pattern, replacement in _SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def redact(value: Any, key: str = "") -> Any:
+    """Redige um valor de campo extra, recursivamente em dicts e listas."""
+    if key and _SENSITIVE_KEY.search(key):
+        return REDACTED
+    if isinstance(value, str):
+        return redact_text(value)
+    if isinstance(value, dict):
+        return {k: redact(v, str(k)) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    return value
+
+
+class JSONFormatter(logging.Formatter):
+    """Uma linha JSON por registro, com os campos de `extra` e redação."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+                  + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact_text(record.getMessage()),
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = redact(value, key)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = redact_text(record.exc_text)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RedactingFormatter(logging.Formatter):
+    """Formato texto (desenvolvimento) com a mesma redação do JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return redact_text(super().format(record))
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """`"evento=fração,evento=fração"` -> {evento: fração}."""
+    rates = {}
+    for item in spec.split(","):
+        if "=" in item:
+            event, rate = item.split("=", 1)
+            rates[event.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Deixa passar só uma fração dos registros de cada evento amostrado."""
+
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        rate = self.rates.get(event) if event else None
+        if rate is None or rate >= 1.0 or record.levelno >= logging.WARNING:
+            return True
+        if random.random() >= rate:
+            LOG_SAMPLED_OUT.inc(event=event)
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # A fila não sai do processo: sem formatar aqui (isso fica com a
+        # thread), só congela a mensagem e o traceback
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+
+def _formatter(fmt: str) -> logging.Formatter:
+    if fmt == "text":
+        return RedactingFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    return JSONFormatter()
+
+
+class LogPipeline:
+    """
+    Fila, handler e thread de escrita de um processo.
+
+    :param stream: Destino das linhas (padrão: stdout).
+    :param fmt: "json" ou "text".
+    :param queue_size: Registros aguardando escrita antes de descartar.
+    """
+
+    def __init__(self, stream=None, fmt: str = "json",
+                 queue_size: int = 10000) -> None:
+        self.stream = stream
+        self.queue_size = queue_size
+        self.formatter = _formatter(fmt)
+        self.handler = _NonBlockingQueueHandler(queue.Queue(queue_size))
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Inicia a thread de escrita neste processo (idempotente)."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Processo novo (fork): fila nova, a thread do pai não existe aqui
+            self._pid = os.getpid()
+            self.handler.queue = queue.Queue(self.queue_size)
+            output = logging.StreamHandler(self.stream or sys.stdout)
+            output.setFormatter(self.formatter)
+            self._listener = logging.handlers.QueueListener(
+                self.handler.queue, output, respect_handler_level=True,
+            )
+            self._listener.start()
+
+    def stop(self) -> None:
+        """Escreve o que está na fila e encerra a thread."""
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+            self._listener = None
+            self._pid = None
+
+
+_pipeline: Optional[LogPipeline] = None
+
+
+def setup_logging(stream=None) -> None:
+    """
+    Configura o logger raiz a partir de `Config` (chamar uma vez, no
+    import do app). Com `LOG_ASYNC` desligado, escreve direto no stream,
+    como o `logging.basicConfig`.
+    """
+    global _pipeline
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(Config.LOG_LEVEL.upper())
+
+    if Config.LOG_ASYNC:
+        _pipeline = LogPipeline(stream, Config.LOG_FORMAT, Config.LOG_QUEUE_SIZE)
+        _pipeline.start()
+        atexit.register(_pipeline.stop)
+        handler: logging.Handler = _pipeline.handler
+    else:
+        handler = logging.StreamHandler(stream or sys.stdout)
+        handler.setFormatter(_formatter(Config.LOG_FORMAT))
+    handler.addFilter(SamplingFilter(parse_sample_rates(Config.LOG_SAMPLE_RATES)))
+    root.addHandler(handler)
+
+
+def start_logging() -> None:
+    """Reinicia a thread de escrita depois de um fork (ver `post_fork`)."""
+    if _pipeline is not None:
+        _pipeline.start()
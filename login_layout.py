@@ -68,15 +68,15 @@ def create_login_layout() -> DashComponent:
                                             },
                                         },
                                     ),
+                                    # Exibido pela validação no navegador
+                                    # (ver auth.auth); style só controla display
                                     dmc.Text(
                                         id="password-error",
                                         children="Por favor, insira sua senha",
                                         size="sm",
-                                        style={
-                                            "display": "none",
-                                            "color": "#a0a0a0",
-                                            "fontWeight": 500,
-                                        },
+                                        c="#a0a0a0",
+                                        fw=500,
+                                        style={"display": "none"},
                                     ),
                                 ],
                             ),
@@ -128,6 +128,9 @@ def create_login_layout() -> DashComponent:
                                 style={"display": "none"},
                                 n_submit=0,
                             ),
+                            # Tentativa validada no navegador; só ela chega
+                            # ao servidor (check_credentials)
+                            dcc.Store(id="login-submit"),
                             # Saída e erro
                             html.Div(id="login-output"),
                             dmc.Text(
@@ -135,11 +138,9 @@ def create_login_layout() -> DashComponent:
                                 children="",
                                 ta="center",
                                 mt="sm",
-                                style={
-                                    "display": "none",
-                                    "color": "#ff6b6b",
-                                    "fontWeight": 600,
-                                },
+                                c="#ff6b6b",
+                                fw=600,
+                                style={"display": "none"},
                             ),
 
                         ],
@@ -0,0 +1,305 @@
+"""
+Métricas da aplicação no formato texto do Prometheus, servidas em `/metrics`.
+
+Contadores, histogramas e gauges simples, sem dependências. O registro é
+feito em caminhos quentes (todo callback, toda chamada ao Keycloak), então
+cada métrica divide seus valores em faixas (`_STRIPES`), cada uma com seu
+próprio lock; cada thread recebe uma faixa (em rodízio) no primeiro uso. Threads diferentes quase
+nunca disputam o mesmo lock, e a soma das faixas só acontece na coleta.
+"""
+import bisect
+import hmac
+import itertools
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from flask import Flask, Response, abort, g, request
+
+from config import Config
+
+_STRIPES = 16
+
+# Latência em segundos: de 5 ms a 10 s
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Tamanho em bytes (cookies, payloads)
+SIZE_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+LabelValues = Tuple[str, ...]
+
+_local = threading.local()
+_next_stripe = itertools.count()
+
+
+def _thread_stripe() -> int:
+    # get_ident() é endereço alinhado; o módulo cairia sempre na mesma faixa
+    index = getattr(_local, "stripe", None)
+    if index is None:
+        index = _local.stripe = next(_next_stripe) % _STRIPES
+    return index
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str],
+                   extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str,
+                 labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._stripes: List[Tuple[threading.Lock, Dict[LabelValues, Any]]] = [
+            (threading.Lock(), {}) for _ in range(_STRIPES)
+        ]
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _stripe(self) -> Tuple[threading.Lock, Dict[LabelValues, Any]]:
+        return self._stripes[_thread_stripe()]
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+
+
+class Counter(_Metric):
+    """Contador monotônico."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        lock, values = self._stripe()
+        with lock:
+            values[key] = values.get(key, 0.0) + amount
+
+    def collect(self) -> Dict[LabelValues, float]:
+        totals: Dict[LabelValues, float] = {}
+        for lock, values in self._stripes:
+            with lock:
+                for key, value in values.items():
+                    totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    def render(self) -> Iterable[str]:
+        yield from super().render()
+        for key, value in sorted(self.collect().items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value:g}"
+
+
+class Histogram(_Metric):
+    """Histograma com buckets fixos (contagens acumuladas na coleta)."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str,
+                 labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        lock, values = self._stripe()
+        with lock:
+            series = values.get(key)
+            if series is None:
+                # [contagem por bucket (+Inf no fim), soma]
+                series = values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def time(self, **labels: str) -> "_Timer":
+        """Context manager que observa a duração do bloco."""
+        return _Timer(self, labels)
+
+    def collect(self) -> Dict[LabelValues, Tuple[List[int], float]]:
+        totals: Dict[LabelValues, Tuple[List[int], float]] = {}
+        for lock, values in self._stripes:
+            with lock:
+                for key, (counts, total) in values.items():
+                    acc_counts, acc_sum = totals.get(
+                        key, ([0] * len(counts), 0.0))
+                    totals[key] = (
+                        [a + b for a, b in zip(acc_counts, counts)],
+                        acc_sum + total,
+                    )
+        return totals
+
+    def render(self) -> Iterable[str]:
+        yield from super().render()
+        for key, (counts, total) in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {total:g}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]) -> None:
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._histogram.observe(time.perf_counter() - self._start,
+                                **self._labels)
+
+
+class Gauge(_Metric):
+    """Valor instantâneo lido na coleta por uma função."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str,
+                 read: Callable[[], Optional[float]]) -> None:
+        super().__init__(name, help_text)
+        self._read = read
+
+    def render(self) -> Iterable[str]:
+        value = self._read()
+        if value is None:
+            return
+        yield from super().render()
+        yield f"{self.name} {value:g}"
+
+
+class Registry:
+    """Conjunto de métricas expostas em `/metrics`."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str,
+                labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str,
+                  labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name: str, help_text: str,
+              read: Callable[[], Optional[float]]) -> Gauge:
+        return self.register(Gauge(name, help_text, read))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+DASH_CALLBACK_SECONDS = REGISTRY.histogram(
+    "dash_callback_duration_seconds",
+    "Duração das requisições de callback do Dash.",
+    ("callback", "status"),
+)
+SESSION_COOKIE_BYTES = REGISTRY.histogram(
+    "session_cookie_bytes",
+    "Tamanho do cookie de sessão enviado em Set-Cookie.",
+    buckets=SIZE_BUCKETS,
+)
+
+
+def _callback_name(dash_app: Any) -> str:
+    body = request.get_json(silent=True) or {}
+    entry = dash_app.callback_map.get(body.get("output", ""))
+    if entry is None:
+        return "desconhecido"
+    func = entry.get("callback")
+    return getattr(func, "__name__", "desconhecido")
+
+
+def install_metrics(server: Flask, dash_app: Any,
+                    session_count: Optional[Callable[[], Optional[int]]] = None,
+                    path: str = "/metrics") -> None:
+    """
+    Mede os callbacks do Dash e o cookie de sessão e expõe `path`.
+
+    :param server: Servidor Flask do app.
+    :param dash_app: App Dash (para dar nome aos callbacks).
+    :param session_count: Função com o número de sessões ativas, ou None.
+    :param path: Rota das métricas. Com `Config.METRICS_TOKEN`, exige
+        `Authorization: Bearer <token>`.
+    """
+    if session_count is not None:
+        REGISTRY.gauge("sessions_active", "Sessões ativas no backend.",
+                       session_count)
+
+    cookie_prefix = f"{server.config['SESSION_COOKIE_NAME']}="
+    wsgi_app = server.wsgi_app
+
+    # O Flask grava a sessão depois dos after_request; o Set-Cookie só
+    # aparece na resposta que sai para o servidor WSGI
+    def measure_cookie(environ: Dict[str, Any], start_response: Callable) -> Any:
+        def start(status: str, headers: List[Tuple[str, str]],
+                  exc_info: Any = None) -> Any:
+            for name, value in headers:
+                if name.lower() == "set-cookie" and value.startswith(cookie_prefix):
+                    SESSION_COOKIE_BYTES.observe(len(value.split(";", 1)[0]))
+            return start_response(status, headers, exc_info)
+        return wsgi_app(environ, start)
+
+    server.wsgi_app = measure_cookie
+
+    @server.before_request
+    def _metrics_start() -> None:
+        if request.path.endswith("_dash-update-component"):
+            g.metrics_started = time.perf_counter()
+
+    @server.after_request
+    def _metrics_finish(response: Response) -> Response:
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            DASH_CALLBACK_SECONDS.observe(
+                time.perf_counter() - started,
+                callback=_callback_name(dash_app),
+                status=str(response.status_code),
+            )
+        return response
+
+    def metrics_view() -> Response:
+        token = Config.METRICS_TOKEN
+        if token:
+            given = request.headers.get("Authorization", "")
+            if not hmac.compare_digest(given, f"Bearer {token}"):
+                abort(401)
+        return Response(REGISTRY.render(),
+                        mimetype="text/plain; version=0.0.4")
+
+    server.add_url_rule(path, "metrics", metrics_view)
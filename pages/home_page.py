@@ -3,4 +3,5 @@ from home_layout import layout_main
 
 dash.register_page(__name__, path="/home")
 
-layout = layout_main()
+# Montado a cada acesso à página, não no import
+layout = layout_main
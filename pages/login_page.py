@@ -3,4 +3,5 @@ from login_layout import create_login_layout
 
 dash.register_page(__name__, path="/login")
 
-layout = create_login_layout()
+# Montado a cada acesso à página, não no import
+layout = create_login_layout
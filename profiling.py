@@ -0,0 +1,368 @@
+"""
+Profiling sob demanda de requisições Flask e callbacks do Dash.
+
+Desligado por padrão (`Config.PROFILING_ENABLED`); um administrador liga,
+desliga e baixa os perfis em `/admin/profiling` sem redeploy. Ligado, uma
+fração das requisições (`sample_rate`) é perfilada:
+
+- tempo de parede por fase, exclusivo (fases aninhadas não contam duas
+  vezes): "keycloak" (chamadas do `KeycloakGateway`), "api" (APIs
+  protegidas, `auth.api_client`), "layout" (montagem de layouts),
+  "callback" (o resto do código do callback), "serialization" (JSON da
+  resposta do Dash) e "framework" (Flask, Dash, sessão e hooks);
+- pilhas amostradas por uma thread a cada `interval` s
+  (`sys._current_frames`), só das threads com requisição perfilada, no
+  formato "folded" (flamegraph.pl, speedscope).
+
+Os agregados são por callback (nome da função) ou endpoint Flask e por
+processo: com vários workers, cada um responde pelo que atendeu.
+
+Desligado, o custo por requisição é um teste de atributo no
+`before_request`, e `phase` nos pontos instrumentados só lê uma ContextVar.
+"""
+import contextlib
+import functools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from flask import Flask, Response, g, jsonify, request
+
+from config import Config
+from metrics import REGISTRY, _callback_name
+
+PHASES = ("framework", "callback", "keycloak", "api", "layout", "serialization")
+
+PROFILED_REQUESTS = REGISTRY.counter(
+    "profiled_requests_total",
+    "Requisições perfiladas (amostradas) por este processo.",
+)
+
+_current: ContextVar[Optional["RequestProfile"]] = ContextVar("profile", default=None)
+_NO_PHASE = contextlib.nullcontext()
+
+
+class RequestProfile:
+    """Relógio de fases de uma requisição perfilada."""
+
+    __slots__ = ("started", "phases", "stack", "stacks", "_mark")
+
+    def __init__(self) -> None:
+        self.started = self._mark = time.perf_counter()
+        self.phases: Dict[str, float] = dict.fromkeys(PHASES, 0.0)
+        self.stack: List[str] = ["framework"]
+        self.stacks: Counter = Counter()
+
+    def _switch(self) -> None:
+        now = time.perf_counter()
+        self.phases[self.stack[-1]] += now - self._mark
+        self._mark = now
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        self._switch()
+        self.stack.append(name)
+        try:
+            yield
+        finally:
+            self._switch()
+            self.stack.pop()
+
+    def finish(self) -> float:
+        self._switch()
+        return self._mark - self.started
+
+
+def phase(name: str):
+    """
+    Conta o bloco na fase `name` da requisição perfilada atual (sem
+    requisição perfilada, não faz nada)::
+
+        with phase("keycloak"):
+            ...
+    """
+    profile = _current.get()
+    if profile is None:
+        return _NO_PHASE
+    return profile.phase(name)
+
+
+def _folded(frame: Any) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class _Stats:
+    __slots__ = ("count", "wall", "max_wall", "phases", "stacks")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.wall = 0.0
+        self.max_wall = 0.0
+        self.phases: Dict[str, float] = dict.fromkeys(PHASES, 0.0)
+        self.stacks: Counter = Counter()
+
+
+class Profiler:
+    """
+    Amostragem de requisições, thread de pilhas e agregados de um processo.
+
+    :param sample_rate: Fração das requisições perfiladas (0 a 1).
+    :param interval: Intervalo (s) entre amostras de pilha.
+    :param max_stacks: Pilhas distintas guardadas por nome, no máximo.
+    """
+
+    def __init__(self, sample_rate: float = 0.05, interval: float = 0.005,
+                 max_stacks: int = 5000) -> None:
+        self.enabled = False
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.started_at: Optional[float] = None
+        self._stats: Dict[str, _Stats] = {}
+        self._active: Dict[int, RequestProfile] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    # --- liga/desliga ------------------------------------------------------
+
+    def enable(self, sample_rate: Optional[float] = None,
+               interval: Optional[float] = None) -> None:
+        if sample_rate is not None:
+            self.sample_rate = min(1.0, max(0.0, sample_rate))
+        if interval is not None:
+            self.interval = max(0.001, interval)
+        _install_dash_phases()
+        with self._lock:
+            if self._pid != os.getpid():
+                # Processo novo (fork): a thread do pai não existe aqui
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._sample_stacks, name="profiler", daemon=True,
+                )
+                self._thread.start()
+        if not self.enabled:
+            self.started_at = time.time()
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+        self.started_at = time.time() if self.enabled else None
+
+    # --- por requisição ----------------------------------------------------
+
+    def begin(self) -> None:
+        if random.random() >= self.sample_rate:
+            return
+        profile = RequestProfile()
+        g.profile_token = _current.set(profile)
+        g.profile = profile
+        with self._lock:
+            self._active[threading.get_ident()] = profile
+        self._wake.set()
+
+    def end(self, name: str) -> None:
+        profile: RequestProfile = g.pop("profile")
+        try:
+            _current.reset(g.pop("profile_token"))
+        except ValueError:  # teardown em outro contexto
+            _current.set(None)
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+        wall = profile.finish()
+        PROFILED_REQUESTS.inc()
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = _Stats()
+            stats.count += 1
+            stats.wall += wall
+            stats.max_wall = max(stats.max_wall, wall)
+            for key, value in profile.phases.items():
+                stats.phases[key] += value
+            for stack, count in profile.stacks.items():
+                if stack in stats.stacks or len(stats.stacks) < self.max_stacks:
+                    stats.stacks[stack] += count
+
+    def _sample_stacks(self) -> None:
+        while True:
+            with self._lock:
+                active = list(self._active.items())
+                if not active:
+                    self._wake.clear()
+            if not active:
+                self._wake.wait()
+                continue
+            frames = sys._current_frames()
+            samples = [(ident, profile, _folded(frames[ident]))
+                       for ident, profile in active if ident in frames]
+            del frames
+            with self._lock:
+                for ident, profile, stack in samples:
+                    # A requisição pode ter terminado durante a amostra
+                    if self._active.get(ident) is profile:
+                        profile.stacks[stack] += 1
+            time.sleep(self.interval)
+
+    # --- relatórios --------------------------------------------------------
+
+    def summary(self) -> Dict[str, Any]:
+        """Agregados por callback/endpoint: médias (ms) e parte de cada fase."""
+        with self._lock:
+            items = list(self._stats.items())
+        report = {}
+        for name, stats in sorted(items, key=lambda item: -item[1].wall):
+            report[name] = {
+                "count": stats.count,
+                "mean_ms": round(stats.wall / stats.count * 1000, 3),
+                "max_ms": round(stats.max_wall * 1000, 3),
+                "phases_mean_ms": {
+                    key: round(value / stats.count * 1000, 3)
+                    for key, value in stats.phases.items()
+                },
+                "phases_pct": {
+                    key: round(100 * value / stats.wall, 1) if stats.wall else 0.0
+                    for key, value in stats.phases.items()
+                },
+                "stack_samples": sum(stats.stacks.values()),
+            }
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "interval": self.interval,
+            "pid": os.getpid(),
+            "since": self.started_at,
+            "profiles": report,
+        }
+
+    def folded(self) -> str:
+        """Pilhas agregadas em "folded", com o callback/endpoint na raiz."""
+        with self._lock:
+            items = [(name, list(stats.stacks.items()))
+                     for name, stats in self._stats.items()]
+        lines = [f"{name};{stack} {count}"
+                 for name, stacks in items for stack, count in stacks]
+        return "\n".join(lines) + ("\n" if lines else "")
+
+
+_DASH_PATCHED = False
+
+
+def _install_dash_phases() -> None:
+    """
+    Mede o corpo do callback e a serialização da resposta no Dash.
+
+    O Dash não tem ganchos para isso: troca `_invoke_callback` e `to_json`
+    em `dash._callback` (só na primeira vez que o profiling é ligado).
+    """
+    global _DASH_PATCHED
+    if _DASH_PATCHED:
+        return
+    from dash import _callback
+
+    def timed(func: Callable, name: str) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def timed_async(func: Callable, name: str) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with phase(name):
+                return await func(*args, **kwargs)
+        return wrapper
+
+    _callback._invoke_callback = timed(_callback._invoke_callback, "callback")
+    if hasattr(_callback, "_async_invoke_callback"):
+        _callback._async_invoke_callback = timed_async(
+            _callback._async_invoke_callback, "callback")
+    _callback.to_json = timed(_callback.to_json, "serialization")
+    _DASH_PATCHED = True
+
+
+_profiler: Optional[Profiler] = None
+
+
+def get_profiler() -> Profiler:
+    """Profiler do processo, configurado por `Config`."""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(Config.PROFILING_SAMPLE_RATE, Config.PROFILING_INTERVAL)
+    return _profiler
+
+
+def install_profiling(server: Flask, dash_app: Any,
+                      path: str = "/admin/profiling") -> Profiler:
+    """
+    Registra os hooks de amostragem e as rotas de administração.
+
+    - `GET path`: agregados em JSON;
+    - `POST path`: `{"enabled": bool, "sample_rate": x, "interval": s,
+      "reset": bool}`;
+    - `GET path/folded`: pilhas para flamegraph (texto).
+
+    As rotas exigem o papel `Config.PROFILING_ADMIN_ROLE`.
+    """
+    from auth.context import requires_auth
+
+    profiler = get_profiler()
+    if Config.PROFILING_ENABLED:
+        profiler.enable()
+
+    @server.before_request
+    def _profiling_start() -> None:
+        if profiler.enabled:
+            profiler.begin()
+
+    @server.teardown_request
+    def _profiling_finish(_exc: Optional[BaseException]) -> None:
+        if "profile" not in g:
+            return
+        if request.path.endswith("_dash-update-component"):
+            name = _callback_name(dash_app)
+        else:
+            name = request.endpoint or "desconhecido"
+        profiler.end(name)
+
+    @requires_auth(Config.PROFILING_ADMIN_ROLE)
+    def profiling_view() -> Any:
+        if request.method == "POST":
+            body = request.get_json(silent=True) or {}
+            if body.get("reset"):
+                profiler.reset()
+            if body.get("enabled") is False:
+                profiler.disable()
+            elif body.get("enabled") or "sample_rate" in body or "interval" in body:
+                profiler.enable(body.get("sample_rate"), body.get("interval"))
+        response = jsonify(profiler.summary())
+        response.headers["Cache-Control"] = "no-store"
+        return response
+
+    @requires_auth(Config.PROFILING_ADMIN_ROLE)
+    def profiling_folded() -> Response:
+        return Response(
+            profiler.folded(), mimetype="text/plain",
+            headers={"Cache-Control": "no-store",
+                     "Content-Disposition": f'attachment; filename="profile-{os.getpid()}.folded"'},
+        )
+
+    server.add_url_rule(path, "profiling", profiling_view, methods=["GET", "POST"])
+    server.add_url_rule(f"{path}/folded", "profiling_folded", profiling_folded)
+    return profiler
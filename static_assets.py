@@ -0,0 +1,293 @@
+"""
+Assets de terceiros servidos pela própria aplicação, em vez de CDNs.
+
+Duas etapas, rodadas no deploy (nada disso é versionado no git):
+
+- `python -m static_assets fetch` (precisa de rede): baixa os arquivos de
+  `VENDOR_ASSETS` e os recursos referenciados pelos CSS (fontes) para
+  `vendor/`.
+- `python -m static_assets build` (offline): copia `vendor/` para
+  `assets/vendor/` com o hash do conteúdo no nome, reescreve as `url()`
+  dos CSS para os nomes com hash, gera as variantes `.gz` e `.br`
+  (se o pacote `brotli` estiver instalado) e grava `manifest.json`.
+
+`register_vendor_route` serve os arquivos gerados com cache imutável de
+um ano, escolhendo a variante pré-comprimida pelo `Accept-Encoding`.
+Se os arquivos não foram baixados e gerados, a aplicação sobe assim
+mesmo: `vendor_urls` devolve as URLs de CDN.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import sys
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from flask import Flask, Response, abort, request, send_file
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele só há .gz
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+VENDOR_DIR = os.path.join(BASE_DIR, "vendor")
+BUILD_DIR = os.path.join(BASE_DIR, "assets", "vendor")
+MANIFEST_PATH = os.path.join(BUILD_DIR, "manifest.json")
+
+# Ordem importa: é a ordem de inclusão na página
+VENDOR_ASSETS = [
+    {
+        "path": "boxicons/css/boxicons.min.css",
+        "url": "https://unpkg.com/boxicons@2.1.1/css/boxicons.min.css",
+    },
+    {
+        "path": "bootstrap/js/bootstrap.bundle.min.js",
+        "url": "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js",
+    },
+    {
+        "path": "dayjs/dayjs.min.js",
+        "url": "https://cdnjs.cloudflare.com/ajax/libs/dayjs/1.10.8/dayjs.min.js",
+    },
+    {
+        "path": "dayjs/locale/pt.min.js",
+        "url": "https://cdnjs.cloudflare.com/ajax/libs/dayjs/1.10.8/locale/pt.min.js",
+    },
+]
+
+_CSS_URL = re.compile(r"url\(\s*(['\"]?)([^'\")]+)\1\s*\)")
+_COMPRESSIBLE = (".css", ".js", ".svg", ".ttf", ".eot", ".json")
+_ONE_YEAR = 365 * 24 * 3600
+
+
+def _css_refs(css: str) -> List[str]:
+    """Referências relativas (sem query/fragmento) em `url()` de um CSS."""
+    refs = []
+    for _, ref in _CSS_URL.findall(css):
+        if ref.startswith(("data:", "http:", "https:", "//", "#")):
+            continue
+        refs.append(ref)
+    return refs
+
+
+def _strip_query(ref: str) -> str:
+    return urlsplit(ref).path
+
+
+# --- fetch (online) ----------------------------------------------------------
+
+def fetch(vendor_dir: str = VENDOR_DIR) -> None:
+    """Baixa os assets e as fontes referenciadas pelos CSS para `vendor/`."""
+    import requests
+
+    def download(url: str, rel_path: str) -> bytes:
+        response = requests.get(url, timeout=30)
+        response.raise_for_status()
+        target = os.path.join(vendor_dir, rel_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as fh:
+            fh.write(response.content)
+        print(f"  {rel_path} ({len(response.content)} bytes)")
+        return response.content
+
+    for asset in VENDOR_ASSETS:
+        content = download(asset["url"], asset["path"])
+        if not asset["path"].endswith(".css"):
+            continue
+        for ref in set(_strip_query(r) for r in _css_refs(content.decode())):
+            rel = posixpath.normpath(
+                posixpath.join(posixpath.dirname(asset["path"]), ref)
+            )
+            download(urljoin(asset["url"], ref), rel)
+
+
+# --- build (offline) ---------------------------------------------------------
+
+def _fingerprinted(rel_path: str, content: bytes) -> str:
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    stem, ext = os.path.splitext(posixpath.basename(rel_path))
+    return f"{stem}.{digest}{ext}"
+
+
+def _write_variants(path: str, content: bytes) -> Dict[str, int]:
+    sizes = {"identity": len(content)}
+    with open(path, "wb") as fh:
+        fh.write(content)
+    if not path.endswith(_COMPRESSIBLE):
+        return sizes
+    variants = {"gzip": (".gz", gzip.compress(content, compresslevel=9, mtime=0))}
+    if brotli is not None:
+        variants["br"] = (".br", brotli.compress(content, quality=11))
+    for encoding, (suffix, compressed) in variants.items():
+        # Formatos já comprimidos (woff2, eot) podem até crescer
+        if len(compressed) >= len(content):
+            continue
+        with open(path + suffix, "wb") as fh:
+            fh.write(compressed)
+        sizes[encoding] = len(compressed)
+    return sizes
+
+
+def build(vendor_dir: str = VENDOR_DIR, build_dir: str = BUILD_DIR) -> Dict:
+    """
+    Gera `build_dir` a partir de `vendor_dir` (sem acesso à rede).
+
+    :return: Manifesto gravado em `build_dir/manifest.json`.
+    """
+    missing = [a["path"] for a in VENDOR_ASSETS
+               if not os.path.exists(os.path.join(vendor_dir, a["path"]))]
+    if missing:
+        raise FileNotFoundError(
+            f"Assets ausentes em {vendor_dir}: {missing}. "
+            "Rode `python -m static_assets fetch` com acesso à rede."
+        )
+
+    if os.path.isdir(build_dir):
+        shutil.rmtree(build_dir)
+    os.makedirs(build_dir)
+
+    # Recursos (fontes etc.) primeiro, para reescrever os CSS depois
+    sources: Dict[str, bytes] = {}
+    for root, _, files in os.walk(vendor_dir):
+        for name in files:
+            full = os.path.join(root, name)
+            rel = os.path.relpath(full, vendor_dir).replace(os.sep, "/")
+            with open(full, "rb") as fh:
+                sources[rel] = fh.read()
+
+    renamed: Dict[str, str] = {}
+    files: Dict[str, Dict] = {}
+    for rel in sorted(sources, key=lambda r: r.endswith(".css")):
+        content = sources[rel]
+        if rel.endswith(".css"):
+            base = posixpath.dirname(rel)
+
+            def rewrite(match: "re.Match") -> str:
+                quote, ref = match.groups()
+                target = posixpath.normpath(
+                    posixpath.join(base, _strip_query(ref))
+                )
+                if target not in renamed:
+                    return match.group(0)
+                suffix = ref[len(_strip_query(ref)):]
+                return f"url({quote}{renamed[target]}{suffix}{quote})"
+
+            content = _CSS_URL.sub(rewrite, content.decode()).encode()
+        out_name = _fingerprinted(rel, content)
+        renamed[rel] = out_name
+        files[rel] = {
+            "file": out_name,
+            "sizes": _write_variants(os.path.join(build_dir, out_name), content),
+        }
+
+    manifest = {
+        "assets": [
+            {"path": a["path"], "file": files[a["path"]]["file"]}
+            for a in VENDOR_ASSETS
+        ],
+        "files": {info["file"]: info["sizes"] for info in files.values()},
+    }
+    with open(os.path.join(build_dir, "manifest.json"), "w") as fh:
+        json.dump(manifest, fh, indent=2)
+    return manifest
+
+
+def savings_report(manifest: Dict) -> str:
+    """Tabela com o tamanho de cada arquivo e de suas variantes comprimidas."""
+    lines = [f"{'arquivo':<44} {'bytes':>9} {'gzip':>9} {'br':>9}"]
+    totals = {"identity": 0, "gzip": 0, "br": 0}
+    for name, sizes in sorted(manifest["files"].items()):
+        for key in totals:
+            totals[key] += sizes.get(key, sizes["identity"])
+        lines.append(
+            f"{name:<44} {sizes['identity']:>9} "
+            f"{sizes.get('gzip', '-'):>9} {sizes.get('br', '-'):>9}"
+        )
+    lines.append(
+        f"{'total':<44} {totals['identity']:>9} "
+        f"{totals['gzip']:>9} {totals['br']:>9}"
+    )
+    return "\n".join(lines)
+
+
+# --- runtime -----------------------------------------------------------------
+
+def load_manifest(path: str = MANIFEST_PATH) -> Optional[Dict]:
+    """Manifesto do build, ou None se os assets ainda não foram gerados."""
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return None
+
+
+def vendor_urls(url_prefix: str,
+                manifest: Optional[Dict] = None) -> Tuple[List[str], List[str]]:
+    """
+    URLs de CSS e JS de terceiros, na ordem de `VENDOR_ASSETS`.
+
+    :param url_prefix: Prefixo da rota registrada por `register_vendor_route`.
+    :return: (stylesheets, scripts). Sem build, as URLs de CDN.
+    """
+    manifest = manifest if manifest is not None else load_manifest()
+    if manifest is None:
+        logger.warning("Assets locais não gerados; usando CDNs.")
+        urls = [a["url"] for a in VENDOR_ASSETS]
+    else:
+        urls = [f"{url_prefix}{a['file']}" for a in manifest["assets"]]
+    stylesheets = [u for u in urls if urlsplit(u).path.endswith(".css")]
+    scripts = [u for u in urls if urlsplit(u).path.endswith(".js")]
+    return stylesheets, scripts
+
+
+def register_vendor_route(server: Flask, url_prefix: str,
+                          build_dir: str = BUILD_DIR) -> None:
+    """
+    Serve `build_dir` em `url_prefix` com cache imutável e variantes
+    pré-comprimidas escolhidas pelo `Accept-Encoding`.
+    """
+    manifest = load_manifest(os.path.join(build_dir, "manifest.json"))
+    known = manifest["files"] if manifest else {}
+
+    def serve_vendor(filename: str) -> Response:
+        sizes = known.get(filename)
+        if sizes is None:
+            abort(404)
+        path = os.path.join(build_dir, filename)
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+        encoding = None
+        for candidate, key in (("br", "br"), ("gzip", "gzip")):
+            if key in sizes and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+
+        suffix = {"br": ".br", "gzip": ".gz"}.get(encoding, "")
+        response = send_file(path + suffix, mimetype=mimetype,
+                             conditional=True, etag=True, max_age=_ONE_YEAR)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.headers["Cache-Control"] = f"public, max-age={_ONE_YEAR}, immutable"
+        response.vary.add("Accept-Encoding")
+        return response
+
+    server.add_url_rule(f"{url_prefix}<path:filename>", "vendor_assets",
+                        serve_vendor)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if command == "fetch":
+        fetch()
+    elif command == "build":
+        print(savings_report(build()))
+    else:
+        raise SystemExit("uso: python -m static_assets [fetch|build]")
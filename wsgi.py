@@ -0,0 +1,13 @@
+"""
+Entrada WSGI de produção.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+Veja `gunicorn.conf.py` para workers, threads e os backends compartilhados
+entre processos.
+"""
+from app import server, warm_up
+
+warm_up()
+
+application = server